@@ -0,0 +1,180 @@
+"""
+User details from the SCRC personnel database.
+
+The user, org and user_orgs tables of the personnel database are mirrored into DirectoryUser and DirectoryOrg by the
+sync_directory command, so looking up a user's details only reads the local database. Records looked up are cached
+for USER_DIRECTORY_CACHE_TIMEOUT seconds, or until the next sync changes them.
+"""
+from collections import namedtuple
+import hashlib
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Prefetch
+from mysql.connector import pooling
+
+OPTION_FILES = '/home/ubuntu/.mysql/people.cnf'
+DATABASE = 'people'
+
+DirectoryRecord = namedtuple('DirectoryRecord', ('full_name', 'email', 'orgs'))
+
+NOT_FOUND = DirectoryRecord('User Not Found', 'User Not Found', ())
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    """
+    Return the connection pool for the personnel database, creating it on first use.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = pooling.MySQLConnectionPool(
+                pool_name='people',
+                pool_size=getattr(settings, 'USER_DIRECTORY_POOL_SIZE', 5),
+                option_files=OPTION_FILES,
+                database=DATABASE,
+            )
+        return _pool
+
+
+def _cache_key(username):
+    return 'user-directory:%s' % hashlib.sha1(username.encode('utf-8')).hexdigest()
+
+
+def _read_directory():
+    """
+    Read the users, orgs and the links between them from the personnel database.
+
+    The tables are read in full every time: they record neither when a row changed nor which rows were deleted, so
+    there is nothing to read from incrementally. Only the changes are written to the mirror.
+    """
+    conn = _get_pool().get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('SELECT id, name, full_name, email FROM user')
+        users = {row[0]: tuple(row[1:]) for row in cursor.fetchall()}
+        cursor.execute('SELECT id, name FROM org')
+        orgs = {row[0]: row[1] for row in cursor.fetchall()}
+        cursor.execute('SELECT user_id, org_id FROM user_orgs')
+        links = {(user_id, org_id) for user_id, org_id in cursor.fetchall() if user_id in users and org_id in orgs}
+    finally:
+        # Closing a pooled connection returns it to the pool
+        conn.close()
+    return users, orgs, links
+
+
+def _apply(model, rows, fields):
+    """
+    Bring the mirror of a directory table up to date, touching only the rows which have changed.
+
+    :param model: The mirror model
+    :param rows: The rows of the directory table, as a dictionary of field value tuples keyed by directory id
+    :param fields: The names of the fields in the tuples
+    :return: A tuple of the dictionary of mirror primary keys keyed by directory id, the number of rows changed and a
+             list of the values of the changed rows, including their values before any update
+    """
+    existing = {obj.directory_id: obj for obj in model.objects.all()}
+    created = [model(directory_id=directory_id, **dict(zip(fields, values)))
+               for directory_id, values in rows.items() if directory_id not in existing]
+    deleted = [obj for directory_id, obj in existing.items() if directory_id not in rows]
+    updated = []
+    touched = [values for directory_id, values in rows.items() if directory_id not in existing]
+    touched.extend(tuple(getattr(obj, field) for field in fields) for obj in deleted)
+    for directory_id, obj in existing.items():
+        values = rows.get(directory_id)
+        current = tuple(getattr(obj, field) for field in fields)
+        if values is not None and current != values:
+            touched.extend((current, values))
+            for field, value in zip(fields, values):
+                setattr(obj, field, value)
+            updated.append(obj)
+    if deleted:
+        model.objects.filter(pk__in=[obj.pk for obj in deleted]).delete()
+    if updated:
+        model.objects.bulk_update(updated, fields)
+    model.objects.bulk_create(created)
+    ids = dict(model.objects.values_list('directory_id', 'pk'))
+    return ids, len(created) + len(updated) + len(deleted), touched
+
+
+def sync():
+    """
+    Update the mirror of the personnel database, only writing the users, orgs and memberships that have changed.
+
+    :return: A dictionary of the number of users, orgs and memberships changed
+    """
+    from .models import DirectoryOrg, DirectoryUser
+
+    users, orgs, links = _read_directory()
+    with transaction.atomic():
+        org_ids, org_changes, _ = _apply(DirectoryOrg, {org_id: (name,) for org_id, name in orgs.items()}, ('name',))
+        user_ids, user_changes, touched = _apply(DirectoryUser, users, ('name', 'full_name', 'email'))
+
+        through = DirectoryUser.orgs.through
+        wanted = {(user_ids[user_id], org_ids[org_id]) for user_id, org_id in links}
+        existing = {(user_id, org_id): link_id for link_id, user_id, org_id in through.objects.values_list(
+            'id', 'directoryuser_id', 'directoryorg_id')}
+        removed = [existing[link] for link in set(existing) - wanted]
+        added = wanted - set(existing)
+        through.objects.filter(id__in=removed).delete()
+        through.objects.bulk_create(
+            [through(directoryuser_id=user_id, directoryorg_id=org_id) for user_id, org_id in added])
+
+        # Forget the cached records of everyone whose details may have changed
+        names = {values[0] for values in touched}
+        if org_changes or removed or added:
+            names.update(DirectoryUser.objects.values_list('name', flat=True))
+    cache.delete_many([_cache_key(name) for name in names])
+    return {'users': user_changes, 'orgs': org_changes, 'memberships': len(removed) + len(added)}
+
+
+def _fetch(usernames):
+    """
+    Fetch the directory records of the users with the given usernames from the mirror.
+    """
+    from .models import DirectoryOrg, DirectoryUser
+
+    users = DirectoryUser.objects.filter(name__in=usernames).prefetch_related(
+        Prefetch('orgs', queryset=DirectoryOrg.objects.order_by('name')))
+    return {
+        user.name: DirectoryRecord(user.full_name, user.email, tuple(org.name for org in user.orgs.all()))
+        for user in users
+    }
+
+
+def lookup(usernames):
+    """
+    Return the directory records of the users with the given usernames.
+
+    :param usernames: The usernames to look up
+    :return: A dictionary of DirectoryRecords keyed by username, with NOT_FOUND for any user not in the directory
+    """
+    usernames = set(usernames)
+    cached = cache.get_many([_cache_key(username) for username in usernames])
+    records = {username: cached[_cache_key(username)] for username in usernames if _cache_key(username) in cached}
+    missing = sorted(usernames - set(records))
+    if not missing:
+        return records
+    found = _fetch(missing)
+    found.update((username, NOT_FOUND) for username in missing if username not in found)
+    cache.set_many({_cache_key(username): record for username, record in found.items()},
+                   getattr(settings, 'USER_DIRECTORY_CACHE_TIMEOUT', 300))
+    records.update(found)
+    return records
+
+
+def prefetch(users):
+    """
+    Look up the directory records of many users at once, storing them on the users.
+    """
+    users = [user for user in users if getattr(user, '_directory_record', None) is None]
+    if not users:
+        return
+    records = lookup(user.username for user in users)
+    for user in users:
+        user._directory_record = records[user.username]
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+import mysql.connector as mariadb
+
+from custom_user import directory
+
+
+class Command(BaseCommand):
+    help = ('Update the local mirror of the users and organisations in the SCRC personnel database. Each sync reads '
+            'the whole of the user, org and user_orgs tables, as they have no record of when rows changed, so the '
+            'time it takes grows with the size of the database; choose --interval to suit')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=int, default=0,
+            help='Keep running, syncing again after this number of seconds',
+        )
+
+    def handle(self, interval=0, **options):
+        while True:
+            try:
+                changes = directory.sync()
+            except (ValueError, mariadb.Error) as ex:
+                if not interval:
+                    raise
+                self.stderr.write('Unable to read the personnel database: %s' % ex)
+            else:
+                self.stdout.write('Synced personnel database: %(users)d users, %(orgs)d orgs and %(memberships)d '
+                                  'memberships changed' % changes)
+            if not interval:
+                return
+            time.sleep(interval)
@@ -1,70 +1,68 @@
 from django.contrib.auth.models import AbstractUser, AbstractBaseUser
-import mysql.connector as mariadb
+from django.db import models
 
+from . import directory
 from .managers import CustomUserManager
 
 
-def _get_db_connection():
-    connection = mariadb.connect(
-        option_files='/home/ubuntu/.mysql/people.cnf',
-        database='people'
-    )
-    return connection
+class DirectoryOrg(models.Model):
+    """
+    An organisation in the SCRC personnel database, mirrored by the sync_directory command.
+    """
+    directory_id = models.IntegerField(unique=True)
+    name = models.CharField(max_length=255)
+
+    def __str__(self):
+        return self.name
+
+
+class DirectoryUser(models.Model):
+    """
+    A user in the SCRC personnel database, mirrored by the sync_directory command.
+    """
+    directory_id = models.IntegerField(unique=True)
+    name = models.CharField(max_length=150, db_index=True)
+    full_name = models.CharField(max_length=255, null=True, blank=True)
+    email = models.CharField(max_length=255, null=True, blank=True)
+    orgs = models.ManyToManyField(DirectoryOrg, related_name='users', blank=True)
+
+    def __str__(self):
+        return self.name
 
 
 class User(AbstractUser):
     """
-    Custom user that retrieves user details from the SCRC personnel database.
+    Custom user that retrieves user details from the mirror of the SCRC personnel database.
     """
     objects = CustomUserManager()
 
     REQUIRED_FIELDS = []
 
+    _directory_record = None
+
+    @staticmethod
+    def prefetch_directory(users):
+        """
+        Look up the details of many users in the mirror of the personnel database at once.
+        """
+        directory.prefetch(users)
+
+    def directory_record(self):
+        """
+        Return the user's details from the personnel database, looking them up if they have not been prefetched.
+        """
+        if self._directory_record is None:
+            self._directory_record = directory.lookup([self.username])[self.username]
+        return self._directory_record
+
     def full_name(self):
-        conn = None
-        try:
-            conn = _get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute('SELECT full_name FROM user WHERE name = %s', (self.username,))
-            row = cursor.fetchone()
-            return row[0]
-        except (ValueError, TypeError):
-            return 'User Not Found'
-        finally:
-            if conn is not None: conn.close()
+        return self.directory_record().full_name
 
     def email(self):
-        conn = None
-        try:
-            conn = _get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute('SELECT email FROM user WHERE name = %s', (self.username,))
-            row = cursor.fetchone()
-            return row[0]
-        except (ValueError, TypeError):
-            return 'User Not Found'
-        finally:
-            if conn is not None: conn.close()
+        return self.directory_record().email
 
     def orgs(self):
-        sql = '''
-        SELECT org.name FROM user, org, user_orgs 
-        WHERE user.name = %s
-          AND user_orgs.user_id = user.id
-          AND user_orgs.org_id = org.id
-        '''
-        conn = None
-        try:
-            conn = _get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute(sql, (self.username,))
-            rows = cursor.fetchmany()
-            return [row[0] for row in rows]
-        except (ValueError, TypeError):
-            return []
-        finally:
-            if conn is not None:
-                conn.close()
+        return list(self.directory_record().orgs)
 
     def clean(self):
         # Skip the AbstractUser.clean as this tries to set self.email
@@ -1,3 +1,131 @@
+import os
+import sqlite3
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
 from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from . import directory
+from .models import DirectoryOrg, DirectoryUser, User
+
+
+class PeopleDatabase:
+    """
+    A SQLite stand-in for the personnel database, with the same user, org and user_orgs tables.
+    """
+
+    def __init__(self):
+        handle, self.path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(handle)
+        self.execute(
+            'CREATE TABLE user (id INTEGER PRIMARY KEY, name TEXT, full_name TEXT, email TEXT)',
+            'CREATE TABLE org (id INTEGER PRIMARY KEY, name TEXT)',
+            'CREATE TABLE user_orgs (user_id INTEGER, org_id INTEGER)',
+        )
+
+    def execute(self, *statements):
+        conn = sqlite3.connect(self.path)
+        with conn:
+            for statement in statements:
+                conn.execute(statement)
+        conn.close()
+
+    def get_connection(self):
+        return sqlite3.connect(self.path)
+
+    def close(self):
+        os.remove(self.path)
+
+
+class DirectoryTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.people = PeopleDatabase()
+        self.addCleanup(self.people.close)
+        self.people.execute(
+            "INSERT INTO user VALUES (1, 'alice', 'Alice Smith', 'alice@example.com')",
+            "INSERT INTO user VALUES (2, 'bob', 'Bob Jones', 'bob@example.com')",
+            "INSERT INTO org VALUES (1, 'Org B')",
+            "INSERT INTO org VALUES (2, 'Org A')",
+            'INSERT INTO user_orgs VALUES (1, 1)',
+            'INSERT INTO user_orgs VALUES (1, 2)',
+        )
+        patcher = mock.patch('custom_user.directory._get_pool', return_value=self.people)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_sync(self):
+        self.assertEqual(directory.sync(), {'users': 2, 'orgs': 2, 'memberships': 2})
+        alice = DirectoryUser.objects.get(name='alice')
+        self.assertEqual(alice.email, 'alice@example.com')
+        self.assertEqual(sorted(org.name for org in alice.orgs.all()), ['Org A', 'Org B'])
+        self.assertEqual(directory.sync(), {'users': 0, 'orgs': 0, 'memberships': 0})
+
+    def test_sync_changes(self):
+        directory.sync()
+        alice = DirectoryUser.objects.get(name='alice')
+        self.people.execute(
+            "UPDATE user SET email = 'smith@example.com' WHERE id = 1",
+            'DELETE FROM user WHERE id = 2',
+            "INSERT INTO user VALUES (3, 'carol', 'Carol White', 'carol@example.com')",
+            "INSERT INTO org VALUES (3, 'Org C')",
+            'DELETE FROM user_orgs WHERE org_id = 1',
+            'INSERT INTO user_orgs VALUES (3, 3)',
+        )
+        self.assertEqual(directory.sync(), {'users': 3, 'orgs': 1, 'memberships': 2})
+        self.assertEqual(DirectoryUser.objects.get(name='alice').pk, alice.pk)
+        self.assertEqual(DirectoryUser.objects.get(name='alice').email, 'smith@example.com')
+        self.assertFalse(DirectoryUser.objects.filter(name='bob').exists())
+        self.assertEqual([org.name for org in DirectoryUser.objects.get(name='carol').orgs.all()], ['Org C'])
+        self.assertEqual(DirectoryOrg.objects.count(), 3)
+
+    def test_user_details(self):
+        directory.sync()
+        user = User(username='alice')
+        self.assertEqual(user.full_name(), 'Alice Smith')
+        self.assertEqual(user.email(), 'alice@example.com')
+        self.assertEqual(user.orgs(), ['Org A', 'Org B'])
+
+    def test_user_not_found(self):
+        directory.sync()
+        user = User(username='carol')
+        self.assertEqual(user.full_name(), 'User Not Found')
+        self.assertEqual(user.orgs(), [])
+
+    def test_details_do_not_use_the_personnel_database(self):
+        directory.sync()
+        with mock.patch('custom_user.directory._get_pool', side_effect=ValueError('Unavailable')):
+            self.assertEqual(User(username='alice').full_name(), 'Alice Smith')
+
+    def test_cached_details_are_updated_by_sync(self):
+        directory.sync()
+        self.assertEqual(User(username='alice').email(), 'alice@example.com')
+        self.people.execute("UPDATE user SET email = 'smith@example.com' WHERE id = 1")
+        self.assertEqual(User(username='alice').email(), 'alice@example.com')
+        directory.sync()
+        self.assertEqual(User(username='alice').email(), 'smith@example.com')
+
+    def test_user_list_is_looked_up_at_once(self):
+        directory.sync()
+        for username in ('alice', 'bob', 'carol'):
+            User.objects.create(username=username)
+        client = APIClient()
+        client.force_authenticate(user=User.objects.get(username='alice'))
+        with self.assertNumQueries(4):
+            response = client.get(reverse('user-list'), format='json')
+        self.assertEqual(response.status_code, 200)
+        results = {user['username']: user for user in response.json()['results']}
+        self.assertEqual(results['alice']['orgs'], ['Org A', 'Org B'])
+        self.assertEqual(results['bob']['email'], 'bob@example.com')
+        self.assertEqual(results['carol']['full_name'], 'User Not Found')
 
-# Create your tests here.
+    def test_command(self):
+        out = StringIO()
+        call_command('sync_directory', stdout=out)
+        self.assertIn('2 users, 2 orgs and 2 memberships changed', out.getvalue())
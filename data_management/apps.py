@@ -1,5 +1,35 @@
 from django.apps import AppConfig
+from django.db.models.signals import m2m_changed, post_delete, post_migrate, post_save, pre_delete
 
 
 class DataManagementConfig(AppConfig):
     name = 'data_management'
+
+    def ready(self):
+        from . import caching, changes, lineage, models, search, versions
+        from .indexes import create_trigram_indexes
+        post_migrate.connect(create_trigram_indexes, sender=self)
+        post_migrate.connect(versions.fill_sort_keys, sender=self)
+        post_migrate.connect(search.create_search_indexes, sender=self)
+        post_migrate.connect(changes.create_change_log_triggers, sender=self)
+
+        for model in models.all_models.values():
+            post_save.connect(caching.model_changed, sender=model)
+            post_delete.connect(caching.model_changed, sender=model)
+            for field in model._meta.local_many_to_many:
+                m2m_changed.connect(caching.relation_changed, sender=field.remote_field.through)
+
+        m2m_changed.connect(lineage.code_run_components_changed, sender=models.CodeRun.inputs.through)
+        m2m_changed.connect(lineage.code_run_components_changed, sender=models.CodeRun.outputs.through)
+        pre_delete.connect(lineage.code_run_pre_delete, sender=models.CodeRun)
+        post_delete.connect(lineage.code_run_post_delete, sender=models.CodeRun)
+        pre_delete.connect(lineage.object_component_pre_delete, sender=models.ObjectComponent)
+        post_delete.connect(lineage.object_component_post_delete, sender=models.ObjectComponent)
+
+        for model in search.DOCUMENTS:
+            post_save.connect(search.searchable_saved, sender=model)
+            post_delete.connect(search.searchable_deleted, sender=model)
+        post_save.connect(search.namespace_saved, sender=models.Namespace)
+        post_save.connect(search.object_saved, sender=models.Object)
+        post_save.connect(search.keyword_changed, sender=models.Keyword)
+        post_delete.connect(search.keyword_changed, sender=models.Keyword)
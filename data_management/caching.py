@@ -0,0 +1,96 @@
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+def _generation_key(model):
+    return 'generation:%s' % model._meta.label_lower
+
+
+def _initial_generation():
+    # Start from the current time rather than zero so that a generation which has been evicted from the cache does
+    # not come back with a value already used in the keys of cached entries
+    return int(time.time() * 1000)
+
+
+def generations(models):
+    """
+    Return the current generation of each of the given models, which changes whenever any of their rows change.
+    """
+    keys = [_generation_key(model) for model in models]
+    values = cache.get_many(keys)
+    for key in keys:
+        if key not in values:
+            cache.add(key, _initial_generation(), None)
+            values[key] = cache.get(key)
+    return [values[key] for key in keys]
+
+
+def bump_generation(model):
+    """
+    Record that rows of a model have changed, invalidating everything cached against its generation.
+
+    Inside a transaction the generation is bumped again when it commits, as until then other connections still read the
+    old rows and may cache them against the new generation.
+    """
+    _bump(model)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: _bump(model))
+
+
+def _bump(model):
+    key = _generation_key(model)
+    now = _initial_generation()
+    try:
+        generation = cache.incr(key)
+    except ValueError:
+        cache.add(key, now, None)
+        return
+    if generation < now:
+        # Keep the generation at least the time of the change in milliseconds, so it also tells when the model's
+        # rows last changed
+        cache.incr(key, now - generation)
+
+
+def model_changed(sender, **kwargs):
+    """
+    Signal handler bumping the generation of the model which sent the signal.
+    """
+    bump_generation(sender)
+
+
+def relation_changed(sender, instance, model, action, **kwargs):
+    """
+    Signal handler bumping the generations of the models at both ends of a many-to-many relation whose rows changed.
+    """
+    if action.startswith('post_'):
+        bump_generation(type(instance))
+        bump_generation(model)
+
+
+def cached(prefix, models, parts, compute, timeout):
+    """
+    Return a value from the cache, computing and caching it if necessary.
+
+    The value is cached for timeout seconds, or not at all if this is 0, under a key including the generations of the
+    given models so that changes to any of them invalidate it.
+
+    :param prefix: Prefix of the cache key, identifying the kind of value
+    :param models: The models the value is derived from
+    :param parts: The arguments the value is derived from
+    :param compute: Function computing the value
+    :param timeout: Number of seconds to cache the value for
+    :return: The value
+    """
+    if not timeout:
+        return compute()
+    digest = hashlib.sha1(repr(tuple(parts)).encode('utf-8')).hexdigest()
+    key = '%s:%s:%s' % (prefix, '.'.join(str(generation) for generation in generations(models)), digest)
+    value = cache.get(key)
+    if value is None:
+        # Wrap the value so that a value of None can be cached
+        value = (compute(),)
+        cache.set(key, value, timeout)
+    return value[0]
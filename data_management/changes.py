@@ -0,0 +1,145 @@
+"""
+The change log of the registry: an entry for every row of a model in all_models which is created, updated or deleted,
+read through the changes feed so that mirrors can follow the registry without listing whole tables.
+
+Entries are written by triggers on the model tables, so they are part of the transaction making the change and also
+record bulk inserts and QuerySet updates, which send no signals. A change to a many-to-many relation is recorded as an
+update of the object of the model declaring the relation.
+
+Entries must be read in an order in which none can later appear before one already read. Ids are taken when a row is
+written rather than when its transaction commits, so on PostgreSQL each entry also records the id of its transaction
+and the feed is read in order of transaction, only up to the oldest transaction still in progress: every transaction
+which commits later has a larger id than any already read. SQLite only allows one writer at a time, so its entries
+are read in order of id.
+"""
+import logging
+
+from django.db import DatabaseError, connection, connections, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.text import camel_case_to_spaces
+
+from . import models
+
+logger = logging.getLogger(__name__)
+
+CREATED = 'created'
+UPDATED = 'updated'
+DELETED = 'deleted'
+
+FUNCTION = 'data_management_log_change'
+
+
+def type_name(model):
+    """
+    Return the name of a model in the changes feed, as used in its API URL.
+    """
+    return camel_case_to_spaces(model.__name__).replace(' ', '_')
+
+
+def _tables():
+    """
+    Return the tables whose changes are logged, as tuples of the table, the name of the model in the log, the column
+    holding the id of the changed object and the action logged for every change, or None to log the operation.
+    """
+    tables = []
+    for model in models.all_models.values():
+        tables.append((model._meta.db_table, model._meta.model_name, model._meta.pk.column, None))
+        for field in model._meta.local_many_to_many:
+            tables.append((
+                field.remote_field.through._meta.db_table, model._meta.model_name, field.m2m_column_name(), UPDATED))
+    return tables
+
+
+def _postgresql_statements(conn, log):
+    q = conn.ops.quote_name
+    yield (
+        'CREATE OR REPLACE FUNCTION %(function)s() RETURNS trigger AS $$\n'
+        'DECLARE\n'
+        '    changed jsonb;\n'
+        'BEGIN\n'
+        "    IF TG_OP = 'DELETE' THEN changed := to_jsonb(OLD); ELSE changed := to_jsonb(NEW); END IF;\n"
+        '    INSERT INTO %(log)s (%(model)s, %(object_id)s, %(action)s, %(timestamp)s, %(txid)s) VALUES (\n'
+        '        TG_ARGV[0], (changed ->> TG_ARGV[1])::integer,\n'
+        "        COALESCE(NULLIF(TG_ARGV[2], ''), CASE TG_OP WHEN 'INSERT' THEN '%(created)s' "
+        "WHEN 'UPDATE' THEN '%(updated)s' ELSE '%(deleted)s' END),\n"
+        '        clock_timestamp(), txid_current());\n'
+        '    RETURN NULL;\n'
+        'END;\n'
+        '$$ LANGUAGE plpgsql' % {
+            'function': FUNCTION, 'log': q(log), 'model': q('model'), 'object_id': q('object_id'),
+            'action': q('action'), 'timestamp': q('timestamp'), 'txid': q('txid'),
+            'created': CREATED, 'updated': UPDATED, 'deleted': DELETED,
+        }
+    )
+    for table, model_name, column, action in _tables():
+        trigger = q('%s_log_change' % table)
+        yield 'DROP TRIGGER IF EXISTS %s ON %s' % (trigger, q(table))
+        yield (
+            "CREATE TRIGGER %s AFTER INSERT OR UPDATE OR DELETE ON %s FOR EACH ROW "
+            "EXECUTE PROCEDURE %s('%s', '%s', '%s')" % (trigger, q(table), FUNCTION, model_name, column, action or '')
+        )
+
+
+def _sqlite_statements(conn, log):
+    q = conn.ops.quote_name
+    for table, model_name, column, action in _tables():
+        for operation, row, operation_action in (('INSERT', 'new', CREATED), ('UPDATE', 'new', UPDATED),
+                                                 ('DELETE', 'old', DELETED)):
+            yield (
+                "CREATE TRIGGER IF NOT EXISTS %s AFTER %s ON %s BEGIN "
+                "INSERT INTO %s (%s, %s, %s, %s) "
+                "VALUES ('%s', %s.%s, '%s', strftime('%%Y-%%m-%%d %%H:%%M:%%f', 'now')); END" % (
+                    q('%s_log_%s' % (table, operation.lower())), operation, q(table),
+                    q(log), q('model'), q('object_id'), q('action'), q('timestamp'),
+                    model_name, row, q(column), action or operation_action,
+                )
+            )
+
+
+def create_change_log_triggers(using='default', **kwargs):
+    """
+    Create the triggers writing the change log, on PostgreSQL or SQLite.
+    """
+    conn = connections[using]
+    log = models.ChangeLogEntry._meta.db_table
+    if conn.vendor == 'postgresql':
+        statements = _postgresql_statements(conn, log)
+    elif conn.vendor == 'sqlite':
+        statements = _sqlite_statements(conn, log)
+    else:
+        logger.warning('The change log is not supported on %s', conn.vendor)
+        return
+    try:
+        with transaction.atomic(using=using), conn.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
+    except DatabaseError as ex:
+        logger.warning('Could not create the change log triggers: %s', ex)
+
+
+def changes(since=0, limit=100, types=None):
+    """
+    Return the entries of the change log after the entry with the given id, in the order they are read in.
+
+    :param since: The id of the last entry already seen, or 0 to start from the beginning
+    :param limit: The largest number of entries to return
+    :param types: The names of the models, as given by type_name, to return the changes to, or None for all of them
+    :return: A list of tuples of the entry and the model it records a change to
+    """
+    by_name = {model._meta.model_name: model for model in models.all_models.values()}
+    entries = models.ChangeLogEntry.objects.all()
+    if connection.vendor == 'postgresql':
+        entries = entries.filter(
+            txid__lt=RawSQL('txid_snapshot_xmin(txid_current_snapshot())', ())).order_by('txid', 'id')
+        txid = models.ChangeLogEntry.objects.filter(id=since).values_list('txid', flat=True).first()
+        if txid is not None:
+            entries = entries.filter(Q(txid__gt=txid) | Q(txid=txid, id__gt=since))
+        else:
+            entries = entries.filter(id__gt=since)
+    else:
+        entries = entries.filter(id__gt=since).order_by('id')
+    if types is not None:
+        entries = entries.filter(model__in=[
+            model._meta.model_name for model in by_name.values() if type_name(model) in types])
+    return [(entry, by_name.get(entry.model)) for entry in entries[:limit]]
@@ -0,0 +1,40 @@
+import logging
+
+from django.db import DatabaseError, connections, transaction
+
+logger = logging.getLogger(__name__)
+
+
+def _name_field_columns():
+    """
+    Yield the table and column of every NameField in the data management models.
+    """
+    from . import models
+
+    for model in models.all_models.values():
+        for field in model._meta.local_fields:
+            if isinstance(field, models.NameField):
+                yield model._meta.db_table, field.column
+
+
+def create_trigram_indexes(using='default', **kwargs):
+    """
+    Create a trigram index on every NameField column when using PostgreSQL, so that globs without a literal prefix,
+    which are matched with LIKE or a regular expression, do not need to scan the whole table.
+
+    This is run after migrations are applied, and does nothing on other databases.
+    """
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return
+    quote_name = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        try:
+            with transaction.atomic(using=using):
+                cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        except DatabaseError as ex:
+            logger.warning('Unable to enable pg_trgm, glob filters will not use trigram indexes: %s', ex)
+            return
+        for table, column in _name_field_columns():
+            cursor.execute('CREATE INDEX IF NOT EXISTS %s ON %s USING gin (%s gin_trgm_ops)' % (
+                quote_name('%s_%s_trgm' % (table, column)), quote_name(table), quote_name(column)))
@@ -0,0 +1,181 @@
+from . import models
+
+BATCH_SIZE = 1000
+
+
+def _inputs(code_run_ids):
+    return set(models.CodeRun.inputs.through.objects.filter(
+        coderun_id__in=code_run_ids).values_list('objectcomponent_id', flat=True))
+
+
+def _outputs(code_run_ids):
+    return set(models.CodeRun.outputs.through.objects.filter(
+        coderun_id__in=code_run_ids).values_list('objectcomponent_id', flat=True))
+
+
+def _parents(components):
+    """
+    Return a dictionary mapping each of the given ObjectComponent ids to the set of ids of the inputs of the CodeRuns
+    which output it.
+    """
+    runs = {}
+    for component_id, code_run_id in models.CodeRun.outputs.through.objects.filter(
+            objectcomponent_id__in=components).values_list('objectcomponent_id', 'coderun_id'):
+        runs.setdefault(code_run_id, set()).add(component_id)
+    parents = {component: set() for component in components}
+    for code_run_id, component_id in models.CodeRun.inputs.through.objects.filter(
+            coderun_id__in=runs).values_list('coderun_id', 'objectcomponent_id'):
+        for child in runs[code_run_id]:
+            if child != component_id:
+                parents[child].add(component_id)
+    return parents
+
+
+def _save(paths, existing):
+    """
+    Save a dictionary mapping (ancestor, descendant) pairs to depths, keeping the shortest depth for pairs which
+    already have a row in the given dictionary of existing rows.
+    """
+    new = []
+    shorter = []
+    for (ancestor, descendant), depth in paths.items():
+        row = existing.get((ancestor, descendant))
+        if row is None:
+            new.append(models.ComponentLineage(ancestor_id=ancestor, descendant_id=descendant, depth=depth))
+        elif depth < row.depth:
+            row.depth = depth
+            shorter.append(row)
+    models.ComponentLineage.objects.bulk_create(new, batch_size=BATCH_SIZE, ignore_conflicts=True)
+    models.ComponentLineage.objects.bulk_update(shorter, ['depth'], batch_size=BATCH_SIZE)
+
+
+def link(inputs, outputs):
+    """
+    Add the paths created by a CodeRun taking the given inputs and producing the given outputs.
+
+    Every ancestor of an input, and the input itself, becomes an ancestor of every output and every descendant of an
+    output, with the depth of the shortest path through the run.
+
+    :param inputs: ObjectComponent ids of the inputs
+    :param outputs: ObjectComponent ids of the outputs
+    """
+    if not inputs or not outputs:
+        return
+    upstream = {component: 1 for component in inputs}
+    for ancestor, depth in models.ComponentLineage.objects.filter(
+            descendant_id__in=inputs).values_list('ancestor_id', 'depth'):
+        upstream[ancestor] = min(upstream.get(ancestor, depth + 1), depth + 1)
+    downstream = {component: 0 for component in outputs}
+    for descendant, depth in models.ComponentLineage.objects.filter(
+            ancestor_id__in=outputs).values_list('descendant_id', 'depth'):
+        downstream[descendant] = min(downstream.get(descendant, depth), depth)
+
+    paths = {
+        (ancestor, descendant): up + down
+        for ancestor, up in upstream.items() for descendant, down in downstream.items() if ancestor != descendant
+    }
+    existing = {
+        (row.ancestor_id, row.descendant_id): row
+        for row in models.ComponentLineage.objects.filter(ancestor_id__in=upstream, descendant_id__in=downstream)
+    }
+    _save(paths, existing)
+
+
+def recompute(components):
+    """
+    Recompute the ancestors of the given ObjectComponents and of all their descendants by walking the CodeRuns
+    upstream from them, for use after paths have been removed.
+
+    :param components: ObjectComponent ids
+    """
+    if not components:
+        return
+    region = set(components) | set(models.ComponentLineage.objects.filter(
+        ancestor_id__in=components).values_list('descendant_id', flat=True))
+    models.ComponentLineage.objects.filter(descendant_id__in=region).delete()
+
+    parents = {}
+    ancestors = {component: {} for component in region}
+    frontiers = {component: {component} for component in region}
+    depth = 0
+    while any(frontiers.values()):
+        depth += 1
+        parents.update(_parents(set().union(*frontiers.values()) - parents.keys()))
+        for component, frontier in frontiers.items():
+            found = ancestors[component]
+            frontiers[component] = set()
+            for parent in set().union(*(parents[node] for node in frontier)):
+                if parent != component and parent not in found:
+                    found[parent] = depth
+                    frontiers[component].add(parent)
+
+    _save({
+        (ancestor, descendant): depth
+        for descendant, found in ancestors.items() for ancestor, depth in found.items()
+    }, {})
+
+
+def rebuild():
+    """
+    Rebuild the whole ComponentLineage table from the inputs and outputs of every CodeRun.
+    """
+    models.ComponentLineage.objects.all().delete()
+    recompute(set(models.CodeRun.outputs.through.objects.values_list('objectcomponent_id', flat=True)))
+
+
+def _components_removed(code_run_ids, component_ids, is_input):
+    """
+    Return the ObjectComponents whose ancestors may change when the given components are removed from the inputs or
+    outputs of the given CodeRuns.
+    """
+    return _outputs(code_run_ids) if is_input else set(component_ids)
+
+
+def code_run_components_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Keep the ComponentLineage table up to date as the inputs and outputs of CodeRuns change. Additions only add paths
+    and are applied directly, while removals recompute the ancestors of everything downstream of them.
+    """
+    is_input = sender is models.CodeRun.inputs.through
+    if reverse:
+        code_run_ids = pk_set
+        component_ids = {instance.pk}
+    else:
+        code_run_ids = {instance.pk}
+        component_ids = pk_set
+
+    if action == 'post_add':
+        for code_run_id in code_run_ids:
+            if is_input:
+                link(component_ids, _outputs([code_run_id]))
+            else:
+                link(_inputs([code_run_id]), component_ids)
+    elif action == 'post_remove':
+        recompute(_components_removed(code_run_ids, component_ids, is_input))
+    elif action == 'pre_clear':
+        if reverse:
+            through = sender.objects.filter(objectcomponent_id=instance.pk)
+            code_run_ids = set(through.values_list('coderun_id', flat=True))
+        else:
+            through = sender.objects.filter(coderun_id=instance.pk)
+            component_ids = set(through.values_list('objectcomponent_id', flat=True))
+        instance._lineage_cleared = _components_removed(code_run_ids, component_ids, is_input)
+    elif action == 'post_clear':
+        recompute(getattr(instance, '_lineage_cleared', ()))
+
+
+def code_run_pre_delete(sender, instance, **kwargs):
+    instance._lineage_removed = _outputs([instance.pk])
+
+
+def code_run_post_delete(sender, instance, **kwargs):
+    recompute(getattr(instance, '_lineage_removed', ()))
+
+
+def object_component_pre_delete(sender, instance, **kwargs):
+    instance._lineage_removed = _outputs(models.CodeRun.inputs.through.objects.filter(
+        objectcomponent_id=instance.pk).values_list('coderun_id', flat=True)) - {instance.pk}
+
+
+def object_component_post_delete(sender, instance, **kwargs):
+    recompute(getattr(instance, '_lineage_removed', ()))
@@ -0,0 +1,215 @@
+import fnmatch
+
+from django.db.models import Lookup, lookups
+from django.db.models.sql.where import AND, WhereNode
+
+STAR = '*'
+ANY = '?'
+
+
+def _parse_class(body):
+    """
+    Parse the text between the brackets of a character class, following the rules used by fnmatch.translate.
+
+    :param body: The text between the brackets, including any leading !
+    :return: A tuple of (negated, ranges) where ranges is a list of (first, last) character pairs
+    """
+    if '-' not in body:
+        chunks = [body]
+    else:
+        chunks = []
+        i = 0
+        k = 2 if body[0] == '!' else 1
+        while True:
+            k = body.find('-', k)
+            if k < 0:
+                break
+            chunks.append(body[i:k])
+            i = k + 1
+            k = k + 3
+        chunk = body[i:]
+        if chunk:
+            chunks.append(chunk)
+        else:
+            chunks[-1] += '-'
+        # Remove empty ranges
+        for k in range(len(chunks) - 1, 0, -1):
+            if chunks[k - 1][-1] > chunks[k][0]:
+                chunks[k - 1] = chunks[k - 1][:-1] + chunks[k][1:]
+                del chunks[k]
+    negated = chunks[0].startswith('!')
+    if negated:
+        chunks[0] = chunks[0][1:]
+    ranges = []
+    for index, chunk in enumerate(chunks):
+        chars = list(chunk)
+        if index > 0:
+            first, _ = ranges.pop()
+            ranges.append((first, chars.pop(0)))
+        ranges.extend((char, char) for char in chars)
+    return negated, ranges
+
+
+def parse_glob(pattern):
+    """
+    Split a Unix glob style pattern into a list of tokens, following the rules used by fnmatch.
+
+    Each token is either a literal string, STAR, ANY or a character class given as a tuple of (negated, ranges), where
+    ranges is a list of (first, last) character pairs. Consecutive literal characters are combined into a single
+    string and an opening bracket with no closing bracket is treated as a literal.
+
+    :param pattern: The glob pattern
+    :return: A list of tokens
+    """
+    tokens = []
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        i += 1
+        if c == '*':
+            if not tokens or tokens[-1] is not STAR:
+                tokens.append(STAR)
+            continue
+        if c == '?':
+            tokens.append(ANY)
+            continue
+        if c == '[':
+            j = i
+            if j < n and pattern[j] == '!':
+                j += 1
+            if j < n and pattern[j] == ']':
+                j += 1
+            while j < n and pattern[j] != ']':
+                j += 1
+            if j < n:
+                tokens.append(_parse_class(pattern[i:j]))
+                i = j + 1
+                continue
+        if tokens and _is_literal(tokens[-1]):
+            tokens[-1] += c
+        else:
+            tokens.append(c)
+    return tokens
+
+
+def _is_literal(token):
+    return isinstance(token, str) and token is not STAR and token is not ANY
+
+
+def _sqlite_glob_literal(text):
+    return ''.join('[%s]' % c if c in '*?[' else c for c in text)
+
+
+def _sqlite_glob_class(negated, ranges):
+    """
+    Write a character class in SQLite GLOB syntax, returning None if the class cannot match any character.
+
+    SQLite only treats ] as a member of a class when it comes first, - when it does not follow a character and ^ when
+    it does not come first, so these are split out of the ranges and placed accordingly.
+    """
+    intervals = []
+    for first, last in sorted((ord(first), ord(last)) for first, last in ranges):
+        if intervals and first <= intervals[-1][1] + 1:
+            intervals[-1][1] = max(intervals[-1][1], last)
+        else:
+            intervals.append([first, last])
+    if not intervals:
+        return '?' if negated else None
+    if not negated and len(intervals) == 1 and intervals[0][0] == intervals[0][1]:
+        return _sqlite_glob_literal(chr(intervals[0][0]))
+
+    def remove(char):
+        for index, (first, last) in enumerate(intervals):
+            if first <= ord(char) <= last:
+                del intervals[index]
+                intervals[index:index] = [
+                    [a, b] for a, b in ((first, ord(char) - 1), (ord(char) + 1, last)) if a <= b
+                ]
+                return True
+        return False
+
+    bracket = remove(']')
+    hyphen = remove('-')
+    caret = not negated and not bracket and not hyphen and remove('^')
+    items = [chr(first) if first == last else '%s-%s' % (chr(first), chr(last)) for first, last in intervals]
+    return '[%s%s%s%s%s]' % ('^' if negated else '', ']' if bracket else '', '-' if hyphen else '', ''.join(items),
+                             '^' if caret else '')
+
+
+def sqlite_glob(pattern):
+    """
+    Translate a glob, as understood by fnmatch, into the syntax used by the SQLite GLOB operator.
+
+    :param pattern: The glob pattern
+    :return: The SQLite GLOB pattern, or None if the glob cannot match anything
+    """
+    parts = []
+    for token in parse_glob(pattern):
+        if token is STAR or token is ANY:
+            parts.append(token)
+        elif isinstance(token, str):
+            parts.append(_sqlite_glob_literal(token))
+        else:
+            part = _sqlite_glob_class(*token)
+            if part is None:
+                return None
+            parts.append(part)
+    return ''.join(parts)
+
+
+def glob_regex(pattern, vendor):
+    """
+    Return an anchored regular expression which matches the same strings as a glob.
+    """
+    regex = fnmatch.translate(pattern)
+    if vendor == 'postgresql':
+        # The regex generated by fnmatch is not compatible with PostgreSQL so we need to do remove the ?s: characters,
+        # PostgreSQL matches newlines with . by default anyway.
+        regex = regex.replace('?s:', '')
+    # We also add a \A at the start so that it matches on the entire string.
+    return '\\A' + regex
+
+
+class Glob(Lookup):
+    """
+    Lookup matching a field against a Unix glob style pattern, with the same semantics as fnmatch.fnmatchcase.
+
+    On SQLite this uses the native, case sensitive GLOB operator. Elsewhere the glob is compiled into the cheapest
+    equivalent predicate: an exact match for a glob without wildcards and, on PostgreSQL, a LIKE for a literal and a
+    single * or a regular expression restricted by any literal prefix, which can all use the indexes on NameField
+    columns. Other databases match LIKE case-insensitively, so these use a regular expression for anything but an
+    exact match.
+    """
+    lookup_name = 'glob'
+    prepare_rhs = False
+
+    def as_sqlite(self, compiler, connection):
+        pattern = sqlite_glob(self.rhs)
+        if pattern is None:
+            return '0 = 1', []
+        lhs_sql, params = self.process_lhs(compiler, connection)
+        return '%s GLOB %%s' % lhs_sql, params + [pattern]
+
+    def as_postgresql(self, compiler, connection):
+        return compiler.compile(self._compile(connection.vendor, like=True))
+
+    def as_sql(self, compiler, connection):
+        return compiler.compile(self._compile(connection.vendor, like=False))
+
+    def _compile(self, vendor, like):
+        tokens = parse_glob(self.rhs)
+        if all(_is_literal(token) for token in tokens):
+            return lookups.Exact(self.lhs, ''.join(tokens))
+
+        regex = lookups.Regex(self.lhs, glob_regex(self.rhs, vendor))
+        if not like:
+            return regex
+        if len(tokens) == 2 and _is_literal(tokens[0]) and tokens[1] is STAR:
+            return lookups.StartsWith(self.lhs, tokens[0])
+        if len(tokens) == 2 and tokens[0] is STAR and _is_literal(tokens[1]):
+            return lookups.EndsWith(self.lhs, tokens[1])
+        if len(tokens) == 3 and tokens[0] is STAR and _is_literal(tokens[1]) and tokens[2] is STAR:
+            return lookups.Contains(self.lhs, tokens[1])
+        if _is_literal(tokens[0]):
+            return WhereNode([lookups.StartsWith(self.lhs, tokens[0]), regex], AND)
+        return regex
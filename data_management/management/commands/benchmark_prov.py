@@ -0,0 +1,45 @@
+import timeit
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from data_management import models
+from data_management.prov import build_prov_document
+
+
+def _build_graph(size):
+    """
+    Build an unsaved CodeRun graph with the given number of inputs and outputs, each with its own Object, StorageLocation
+    and DataProduct.
+    """
+    root = models.StorageRoot(id=1, root='https://data.scrc.uk/')
+    namespace = models.Namespace(id=1, name='benchmark')
+    code_run = models.CodeRun(id=1, run_date=timezone.now(), description='Benchmark run')
+    components = []
+    data_products = {}
+    for i in range(1, 2 * size + 1):
+        location = models.StorageLocation(id=i, path='benchmark/%d' % i, hash='%040x' % i, storage_root=root)
+        obj = models.Object(id=i, storage_location=location)
+        data_product = models.DataProduct(id=i, object=obj, namespace=namespace, name='benchmark/%d' % i,
+                                          version='0.1.0')
+        # Mark the reverse one-to-one relations as loaded and empty, as select_related would, so nothing is queried
+        models.Object.code_repo_release.related.set_cached_value(obj, None)
+        models.DataProduct.external_object.related.set_cached_value(data_product, None)
+        data_products[i] = [data_product]
+        components.append(models.ObjectComponent(id=i, object=obj, name='component'))
+    return code_run, components[:size], components[size:], data_products
+
+
+class Command(BaseCommand):
+    help = 'Time the in-memory assembly of a PROV document for a CodeRun with many inputs and outputs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--components', type=int, default=10000,
+                            help='Number of inputs and of outputs in the CodeRun')
+        parser.add_argument('--repeat', type=int, default=3, help='Number of times to build the document')
+
+    def handle(self, **options):
+        graph = _build_graph(options['components'])
+        times = timeit.repeat(lambda: build_prov_document(*graph), number=1, repeat=options['repeat'])
+        self.stdout.write('Built PROV document for %d components in %.3fs (best of %d)' % (
+            2 * options['components'], min(times), options['repeat']))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from data_management import snapshot
+
+
+class Command(BaseCommand):
+    help = 'Write a snapshot of every object in the registry to a gzipped archive, to be loaded with import_registry'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to write the snapshot to')
+
+    def handle(self, path, **options):
+        with open(path, 'wb') as fileobj:
+            counts = snapshot.export(fileobj)
+        for name, count in counts.items():
+            self.stdout.write('%s: %d' % (name, count))
+        self.stdout.write('Exported %d rows to %s' % (sum(counts.values()), path))
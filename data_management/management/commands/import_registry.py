@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from data_management import snapshot
+
+
+class Command(BaseCommand):
+    help = 'Load a snapshot written by export_registry, updating any objects which are already in the registry to match'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to read the snapshot from')
+
+    def handle(self, path, **options):
+        try:
+            with open(path, 'rb') as fileobj:
+                counts = snapshot.import_(fileobj)
+        except (OSError, snapshot.SnapshotError) as exc:
+            raise CommandError(exc)
+        for name, count in counts.items():
+            self.stdout.write('%s: %d' % (name, count))
+        self.stdout.write('Imported %s' % path)
@@ -0,0 +1,53 @@
+import tempfile
+from urllib.parse import urljoin
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from data_management import models, snapshot
+
+# UserAuthors link authors to the users of this registry, so they are not pushed
+PUSHED_MODELS = [model for model in snapshot.dependency_order() if model is not models.UserAuthor]
+
+
+class Command(BaseCommand):
+    help = 'Push the objects created or updated since the last push to a remote registry, such as the central one'
+
+    def add_arguments(self, parser):
+        parser.add_argument('remote', help='URL of the API of the remote registry, e.g. https://data.scrc.uk/api/')
+        parser.add_argument('--token', required=True, help='API token of a staff user of the remote registry')
+        parser.add_argument('--all', action='store_true', help='Push every object, not only those updated since the '
+                                                                'last push')
+        parser.add_argument('--timeout', type=int, default=600,
+                            help='Seconds to wait for the remote registry to load the objects')
+
+    def handle(self, remote, token, **options):
+        remote = remote if remote.endswith('/') else remote + '/'
+        watermark = models.PushWatermark.objects.filter(remote=remote).first()
+        since = watermark.last_updated if watermark is not None and not options['all'] else None
+        # Objects updated while the snapshot is being written may or may not be in it, so they are pushed again next
+        # time, when the remote registry updates the copies it already has
+        pushed_until = timezone.now()
+
+        with tempfile.TemporaryFile() as fileobj:
+            counts = snapshot.export(fileobj, since=since, only=PUSHED_MODELS)
+            if not any(counts[model.__name__] for model in PUSHED_MODELS):
+                self.stdout.write('Nothing to push to %s' % remote)
+                return
+            fileobj.seek(0)
+            try:
+                response = requests.post(
+                    urljoin(remote, 'import/'), data=fileobj, timeout=options['timeout'],
+                    headers={'Authorization': 'token %s' % token, 'Content-Type': 'application/gzip'})
+            except requests.RequestException as ex:
+                raise CommandError('Could not push to %s: %s' % (remote, ex))
+        if response.status_code != 200:
+            raise CommandError('%s rejected the push with status %d: %s' % (
+                remote, response.status_code, response.text))
+
+        models.PushWatermark.objects.update_or_create(remote=remote, defaults={'last_updated': pushed_until})
+        for name, count in response.json().items():
+            self.stdout.write('%s: %d' % (name, count))
+        self.stdout.write('Pushed %d objects to %s' % (
+            sum(counts[model.__name__] for model in PUSHED_MODELS), remote))
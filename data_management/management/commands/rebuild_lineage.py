@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from data_management import lineage, models
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the ObjectComponent lineage table from the inputs and outputs of every CodeRun'
+
+    def handle(self, **options):
+        with transaction.atomic():
+            lineage.rebuild()
+        self.stdout.write('Rebuilt lineage with %d paths' % models.ComponentLineage.objects.count())
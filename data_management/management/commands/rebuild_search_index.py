@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from data_management import models, search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search documents for every DataProduct, ExternalObject and CodeRepoRelease'
+
+    def handle(self, **options):
+        with transaction.atomic():
+            search.rebuild()
+        self.stdout.write('Rebuilt search index with %d documents' % models.SearchDocument.objects.count())
@@ -7,7 +7,7 @@ from django.urls import reverse
 from dynamic_validator import ModelFieldRequiredMixin
 from django.contrib.auth import get_user_model
 
-from . import validators
+from . import lookups, validators, versions
 
 
 PATH_FIELD_LENGTH = 1024 * 8
@@ -27,12 +27,15 @@ class BaseModel(ModelFieldRequiredMixin, models.Model):
             editable=False,
             verbose_name='last updated by',
             )
-    last_updated = models.DateTimeField(auto_now=True)
+    last_updated = models.DateTimeField(auto_now=True, db_index=True)
 
     EXTRA_DISPLAY_FIELDS = ()
     REQUIRED_FIELDS = ()
     FILTERSET_FIELDS = '__all__'
     ADMIN_LIST_FIELDS = ()
+    VERSION_GROUP_FIELDS = ()
+    TABLE_RELATED_FIELDS = ()
+    IDENTITY_FIELDS = ()
 
     def reverse_name(self):
         return self.__class__.__name__.lower()
@@ -40,7 +43,10 @@ class BaseModel(ModelFieldRequiredMixin, models.Model):
     @classmethod
     def field_names(cls):
         if cls._field_names is None:
-            cls._field_names = tuple(field.name for field in cls._meta.get_fields() if field.name != 'id')
+            cls._field_names = tuple(
+                field.name for field in cls._meta.get_fields()
+                if field.name != 'id' and not isinstance(field, SortKeyField)
+            )
         return cls._field_names
 
     class Meta:
@@ -63,23 +69,67 @@ class URIField(models.CharField):
 class NameField(models.CharField):
     """
     A field type used to specify that a field holds a simple name, one that we can apply a glob filter to
-    when filtering the query.
+    when filtering the query. The column is indexed so that globs with a literal prefix can use the index.
     """
     def __init__(self, *args, **kwargs):
         kwargs['max_length'] = 1024
+        kwargs['db_index'] = True
         kwargs['validators'] = (validators.NameValidator(),)
         super().__init__(*args, **kwargs)
 
 
+NameField.register_lookup(lookups.Glob)
+
+
 class VersionField(models.CharField):
     """
     A field type used to specify that a field holds a semantic version.
+
+    If the model also has <name>_major, <name>_minor, <name>_patch and <name>_prerelease sort key fields, declared
+    after this field, these are filled in on save so that versions can be ordered and compared in the database.
     """
     def __init__(self, *args, **kwargs):
         kwargs['max_length'] = 1024
         kwargs['validators'] = (validators.VersionValidator(),)
         super().__init__(*args, **kwargs)
 
+    def pre_save(self, model_instance, add):
+        value = super().pre_save(model_instance, add)
+        names = ['%s_%s' % (self.attname, key) for key in versions.KEYS]
+        if hasattr(model_instance, names[0]):
+            try:
+                keys = versions.sort_key(value)
+            except (TypeError, ValueError):
+                keys = (None,) * len(names)
+            for name, key in zip(names, keys):
+                setattr(model_instance, name, key)
+        return value
+
+
+class SortKeyField:
+    """
+    Mixin for fields holding a sort key derived from another field, which are not shown in the API.
+    """
+    def __init__(self, *args, **kwargs):
+        kwargs['editable'] = False
+        kwargs['null'] = True
+        super().__init__(*args, **kwargs)
+
+
+class VersionNumberField(SortKeyField, models.PositiveBigIntegerField):
+    """
+    A field type holding the major, minor or patch number of a VersionField.
+    """
+
+
+class VersionPrereleaseField(SortKeyField, models.CharField):
+    """
+    A field type holding the sort key of the prerelease part of a VersionField.
+    """
+    def __init__(self, *args, **kwargs):
+        kwargs['max_length'] = PATH_FIELD_LENGTH
+        super().__init__(*args, **kwargs)
+
 
 ###############################################################################
 # Traceablity objects
@@ -255,6 +305,7 @@ class Object(BaseModel):
         'keywords',
     )
     ADMIN_LIST_FIELDS = ('name', 'is_orphan')
+    TABLE_RELATED_FIELDS = ('storage_location__storage_root',)
 
     storage_location = models.ForeignKey('StorageLocation', on_delete=models.PROTECT, null=True, blank=True,
                                          related_name='location_for_object')
@@ -395,6 +446,7 @@ class CodeRun(BaseModel):
     """
     EXTRA_DISPLAY_FIELDS = ('prov_report',)
     ADMIN_LIST_FIELDS = ('description',)
+    TABLE_RELATED_FIELDS = ('code_repo__storage_location__storage_root',)
 
     code_repo = models.ForeignKey(Object, on_delete=models.PROTECT, related_name='code_repo_of', null=True, blank=True)
     model_config = models.ForeignKey(Object, on_delete=models.PROTECT, related_name='config_of', null=True, blank=True)
@@ -476,6 +528,7 @@ class StorageLocation(BaseModel):
     `updated_by`: Reference to the user that updated this record
     """
     ADMIN_LIST_FIELDS = ('storage_root', 'path')
+    TABLE_RELATED_FIELDS = ('storage_root',)
 
     path = models.CharField(max_length=PATH_FIELD_LENGTH, null=False, blank=False)
     hash = models.CharField(max_length=CHAR_FIELD_LENGTH, null=False, blank=False)
@@ -557,15 +610,22 @@ class DataProduct(BaseModel):
     `external_object`: `ExternalObject` API URL associated with this `DataProduct`
     """
     ADMIN_LIST_FIELDS = ('namespace', 'name', 'version')
+    TABLE_RELATED_FIELDS = ('namespace',)
 
     EXTRA_DISPLAY_FIELDS = (
         'external_object',
     )
 
+    VERSION_GROUP_FIELDS = ('namespace', 'name')
+
     object = models.ForeignKey(Object, on_delete=models.PROTECT, related_name='data_products')
     namespace = models.ForeignKey(Namespace, on_delete=models.PROTECT, related_name='data_products')
     name = NameField(null=False, blank=False)
     version = VersionField()
+    version_major = VersionNumberField()
+    version_minor = VersionNumberField()
+    version_patch = VersionNumberField()
+    version_prerelease = VersionPrereleaseField()
 
     class Meta:
         constraints = [
@@ -573,6 +633,12 @@ class DataProduct(BaseModel):
                 fields=('namespace', 'name', 'version'),
                 name='unique_data_product'),
         ]
+        indexes = [
+            models.Index(
+                fields=('namespace', 'name', 'version_major', 'version_minor', 'version_patch', 'version_prerelease'),
+                name='data_product_version_idx'),
+            models.Index(fields=('name', 'id'), name='data_product_name_sort_idx'),
+        ]
 
     def __str__(self):
         return '%s:%s version %s' % (self.namespace, self.name, self.version)
@@ -645,6 +711,11 @@ class ExternalObject(BaseModel):
                 ),
             )
         ]
+        indexes = [
+            models.Index(fields=('alternate_identifier', 'id'), name='ext_obj_alt_id_sort_idx'),
+            models.Index(fields=('release_date', 'id'), name='ext_obj_release_sort_idx'),
+            models.Index(fields=('title', 'id'), name='ext_obj_title_sort_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         # If version is not defined or is empty, use the version from the associated data product
@@ -734,6 +805,8 @@ class Licence(BaseModel):
     `updated_by`: Reference to the user that updated this record
     """
     ADMIN_LIST_FIELDS = ('object',)
+    # Licences have no unique fields, so are matched across registries by their object and text
+    IDENTITY_FIELDS = ('object', 'licence_info')
 
     object = models.ForeignKey(Object, on_delete=models.PROTECT, related_name='licences')
     licence_info = models.TextField()
@@ -763,9 +836,15 @@ class CodeRepoRelease(BaseModel):
     """
     ADMIN_LIST_FIELDS = ('name', 'version')
 
+    VERSION_GROUP_FIELDS = ('name',)
+
     object = models.OneToOneField(Object, on_delete=models.PROTECT, related_name='code_repo_release')
     name = NameField(null=False, blank=False)
     version = VersionField()
+    version_major = VersionNumberField()
+    version_minor = VersionNumberField()
+    version_patch = VersionNumberField()
+    version_prerelease = VersionPrereleaseField()
     website = models.URLField(null=True, blank=True)
 
     class Meta:
@@ -774,6 +853,11 @@ class CodeRepoRelease(BaseModel):
                 fields=('name', 'version'),
                 name='unique_code_repo_release'),
         ]
+        indexes = [
+            models.Index(
+                fields=('name', 'version_major', 'version_minor', 'version_patch', 'version_prerelease'),
+                name='code_repo_release_version_idx'),
+        ]
 
     def __str__(self):
         return '%s version %s' % (self.name, self.version)
@@ -814,6 +898,88 @@ class KeyValue(BaseModel):
         return self.key
 
 
+###############################################################################
+# Internal objects, not exposed through the API
+
+class RenderedProvReport(models.Model):
+    """
+    A PROV report for a `CodeRun` rendered in one format, stored with the fingerprint of the provenance graph it was
+    rendered from so that it can be reused until the inputs or outputs of the run change.
+    """
+    code_run = models.ForeignKey(CodeRun, on_delete=models.CASCADE, related_name='+')
+    format = models.CharField(max_length=16)
+    fingerprint = models.CharField(max_length=64)
+    content = models.BinaryField()
+    rendered = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=('code_run', 'format'), name='unique_rendered_prov_report'),
+        ]
+
+
+class ComponentLineage(models.Model):
+    """
+    Closure of the derivation graph formed by `CodeRun` inputs and outputs: a row for each `ObjectComponent` that is
+    an ancestor of another, with the number of runs on the shortest path between them. Maintained by
+    `data_management.lineage`.
+    """
+    ancestor = models.ForeignKey(ObjectComponent, on_delete=models.CASCADE, related_name='+')
+    descendant = models.ForeignKey(ObjectComponent, on_delete=models.CASCADE, related_name='+')
+    depth = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=('ancestor', 'descendant'), name='unique_component_lineage'),
+        ]
+        indexes = [
+            models.Index(fields=('ancestor', 'depth')),
+            models.Index(fields=('descendant', 'depth')),
+        ]
+
+
+class SearchDocument(models.Model):
+    """
+    The searchable text of a `DataProduct`, `ExternalObject` or `CodeRepoRelease`, indexed for full-text search.
+    Maintained by `data_management.search`.
+    """
+    model = models.CharField(max_length=64)
+    object_id = models.PositiveIntegerField()
+    title = models.CharField(max_length=CHAR_FIELD_LENGTH)
+    body = models.TextField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=('model', 'object_id'), name='unique_search_document'),
+        ]
+
+
+class PushWatermark(models.Model):
+    """
+    The time up to which the objects in the registry have been pushed to a remote registry by `push_registry`.
+    """
+    remote = models.URLField(unique=True)
+    last_updated = models.DateTimeField()
+
+
+class ChangeLogEntry(models.Model):
+    """
+    A row of a registry model, or of one of their many-to-many relations, being created, updated or deleted. Written
+    by database triggers in the transaction making the change, recording the id of the transaction on PostgreSQL.
+    Maintained by `data_management.changes`.
+    """
+    model = models.CharField(max_length=64)
+    object_id = models.PositiveIntegerField()
+    action = models.CharField(max_length=8)
+    timestamp = models.DateTimeField()
+    txid = models.BigIntegerField(null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=('txid', 'id'), name='change_log_txid_idx'),
+        ]
+
+
 def _is_base_model_subclass(name, cls):
     """
     Test if given class is a non-abstract subclasses of BaseModel
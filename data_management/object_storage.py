@@ -1,9 +1,18 @@
 from hashlib import sha1
 import hmac
+import json
+import math
 import time
 
+import requests
+
 from . import settings
 
+SEGMENT_SIZE = 1024 ** 3
+MIN_SEGMENT_SIZE = 1024 ** 2
+MAX_SEGMENTS = 1000
+
+
 def create_url(path, method, filename=None):
     expiry_time = int(time.time() + int(settings.CONFIG.get('storage', 'duration')))
     path = '/v1/' + settings.CONFIG.get('storage', 'bucket') + '/' + path
@@ -16,3 +25,62 @@ def create_url(path, method, filename=None):
     if filename:
         url = '%s&filename=%s' % (url, filename)
     return url
+
+
+def max_segment_size():
+    """
+    Return the largest segment to upload in a single PUT, set by segment_size in the storage config.
+    """
+    return settings.CONFIG.getint('storage', 'segment_size', fallback=SEGMENT_SIZE)
+
+
+def max_segments():
+    """
+    Return the largest number of segments a file can be uploaded in, which is the most a static large object manifest
+    can list, set by max_segments in the storage config.
+    """
+    return settings.CONFIG.getint('storage', 'max_segments', fallback=MAX_SEGMENTS)
+
+
+def fit_segment_size(size, segment_size):
+    """
+    Return the segment size to upload a file in, which is the given size unless the file would then need more segments
+    than a manifest can list.
+    """
+    return max(segment_size, math.ceil(size / max_segments()))
+
+
+def segment_path(path, index):
+    return '%s.segments/%08d' % (path, index)
+
+
+def create_segment_urls(path, size, segment_size):
+    """
+    Create the URLs to upload a file in segments, which can be uploaded in parallel and joined together with
+    create_manifest once they have all been uploaded.
+
+    :param path: The path of the file in object storage
+    :param size: The size of the file in bytes
+    :param segment_size: The size of each segment, apart from the last which holds whatever is left
+    :return: A list of URLs to PUT each segment to
+    """
+    count = max(1, math.ceil(size / segment_size))
+    return [create_url(segment_path(path, index), 'PUT') for index in range(count)]
+
+
+def create_manifest(path, segments):
+    """
+    Finish a segmented upload by storing a Swift static large object manifest, which makes the segments available as
+    a single file.
+
+    :param path: The path of the file in object storage
+    :param segments: A list of (etag, size) pairs for each segment in order, as returned when uploading them
+    :raises requests.RequestException: If the object store rejects the manifest
+    """
+    bucket = settings.CONFIG.get('storage', 'bucket')
+    manifest = [
+        {'path': '/%s/%s' % (bucket, segment_path(path, index)), 'etag': etag, 'size_bytes': size}
+        for index, (etag, size) in enumerate(segments)
+    ]
+    response = requests.put(create_url(path, 'PUT') + '&multipart-manifest=put', data=json.dumps(manifest), timeout=60)
+    response.raise_for_status()
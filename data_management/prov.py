@@ -1,24 +1,38 @@
 import prov.model
 import prov.serializers
 import prov.dot
+from concurrent import futures
+import hashlib
 import io
 import json
+import logging
+import threading
+
+from django.conf import settings
+from django.db import connection, transaction
 
 from . import models
 
+logger = logging.getLogger(__name__)
+
+PROV_REPORT_FORMATS = ('json', 'jpg', 'svg', 'xml', 'provn')
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending = {}
+_pending_lock = threading.Lock()
 
-def _generate_object_meta(obj):
+
+def _generate_object_meta(obj, data_products):
     data = []
 
     if obj.storage_location:
         data.append(('storage', str(obj.storage_location)))
 
-    try:
-        data.append(('namespace', str(obj.data_product.namespace)))
-        data.append(('name', str(obj.data_product.name)))
-        data.append(('version', str(obj.data_product.version)))
-    except models.DataProduct.DoesNotExist:
-        pass
+    for data_product in data_products:
+        data.append(('namespace', str(data_product.namespace)))
+        data.append(('name', str(data_product.name)))
+        data.append(('version', str(data_product.version)))
 
     try:
         data.append(('name', str(obj.code_repo_release.name)))
@@ -27,23 +41,46 @@ def _generate_object_meta(obj):
     except models.CodeRepoRelease.DoesNotExist:
         pass
 
-    try:
-        data.append(('title', str(obj.external_object.title)))
-        data.append(('version', str(obj.external_object.version)))
-        data.append(('release_date', str(obj.external_object.release_date)))
-    except models.ExternalObject.DoesNotExist:
-        pass
+    for data_product in data_products:
+        try:
+            data.append(('title', str(data_product.external_object.title)))
+            data.append(('version', str(data_product.external_object.version)))
+            data.append(('release_date', str(data_product.external_object.release_date)))
+        except models.ExternalObject.DoesNotExist:
+            pass
 
     return data
 
 
-def generate_prov_document(code_run):
+def fetch_prov_graph(code_run):
     """
-    Generate a PROV document for a CodeRun detailing all the input and outputs and how they were generated.
+    Fetch everything needed to generate the PROV document for a CodeRun using a fixed number of queries, however many
+    inputs and outputs it has.
 
-    This uses the W3C PROV ontology (https://www.w3.org/TR/prov-o/).
+    :param code_run: The CodeRun to fetch the inputs and outputs of
+    :return: A tuple of the inputs, the outputs and a dictionary mapping Object ids to lists of their DataProducts
+    """
+    related = ('object__storage_location__storage_root', 'object__code_repo_release')
+    inputs = list(code_run.inputs.select_related(*related))
+    outputs = list(code_run.outputs.select_related(*related))
+    object_ids = {component.object_id for component in inputs + outputs}
+    data_products = {}
+    if object_ids:
+        query = models.DataProduct.objects.filter(object_id__in=object_ids).select_related(
+            'namespace', 'external_object').order_by('id')
+        for data_product in query:
+            data_products.setdefault(data_product.object_id, []).append(data_product)
+    return inputs, outputs, data_products
+
+
+def build_prov_document(code_run, inputs, outputs, data_products):
+    """
+    Assemble the PROV document for a CodeRun from its prefetched inputs and outputs, without querying the database.
 
     :param code_run: The CodeRun to generate the PROV document for
+    :param inputs: The ObjectComponents used as inputs, with their objects loaded
+    :param outputs: The ObjectComponents produced as outputs, with their objects loaded
+    :param data_products: A dictionary mapping Object ids to lists of their DataProducts
     :return: A PROV-O document
     """
     doc = prov.model.ProvDocument()
@@ -59,49 +96,94 @@ def generate_prov_document(code_run):
     )
     prov_objects = {}
     prov_object_components = {}
-    for input in code_run.inputs.all():
-        if input.id in prov_object_components:
-            i = prov_object_components[input.id]
+    for component in (*inputs, *outputs):
+        if component.id in prov_object_components:
+            c = prov_object_components[component.id]
         else:
-            i = doc.entity('/api/object_component/' + str(input.id), (
+            c = doc.entity('/api/object_component/' + str(component.id), (
                 (prov.model.PROV_TYPE, 'file'),
-                ('name', input.name)
+                ('name', component.name)
             ))
-            prov_object_components[input.id] = i
-        doc.association(cr, i)
+            prov_object_components[component.id] = c
+        doc.association(cr, c)
 
-        if input.object.id in prov_objects:
-            obj = prov_objects[input.object.id]
+        if component.object_id in prov_objects:
+            obj = prov_objects[component.object_id]
         else:
-            obj = doc.entity('/api/object/' + str(input.object.id), (
+            obj = doc.entity('/api/object/' + str(component.object_id), (
                 (prov.model.PROV_TYPE, 'file'),
-                *_generate_object_meta(input.object)
+                *_generate_object_meta(component.object, data_products.get(component.object_id, ()))
             ))
-            prov_objects[input.object.id] = obj
-        doc.association(i, obj)
+            prov_objects[component.object_id] = obj
+        doc.association(c, obj)
 
-    for output in code_run.outputs.all():
-        if output.id in prov_object_components:
-            o = prov_object_components[output.id]
-        else:
-            o = doc.entity('/api/object_component/' + str(output.id), (
-                (prov.model.PROV_TYPE, 'file'),
-                ('name', output.name)
-            ))
-            prov_object_components[output.id] = o
-        doc.association(cr, o)
+    return doc
 
-        if output.object.id in prov_objects:
-            obj = prov_objects[output.object.id]
-        else:
-            obj = doc.entity('/api/object/' + str(output.object.id), (
-                (prov.model.PROV_TYPE, 'file'),
-                *_generate_object_meta(output.object)
-            ))
-            prov_objects[output.object.id] = obj
-        doc.association(o, obj)
 
-    return doc
+def generate_prov_document(code_run):
+    """
+    Generate a PROV document for a CodeRun detailing all the input and outputs and how they were generated.
+
+    This uses the W3C PROV ontology (https://www.w3.org/TR/prov-o/).
+
+    :param code_run: The CodeRun to generate the PROV document for
+    :return: A PROV-O document
+    """
+    return build_prov_document(code_run, *fetch_prov_graph(code_run))
+
+
+def prov_graph_fingerprint(code_run, inputs, outputs, data_products):
+    """
+    Return a fingerprint of everything in the provenance graph of a CodeRun that appears in its PROV report, which
+    changes whenever the run, its inputs or outputs or the metadata of their objects change.
+
+    :param code_run: The CodeRun
+    :param inputs: The ObjectComponents used as inputs, with their objects loaded
+    :param outputs: The ObjectComponents produced as outputs, with their objects loaded
+    :param data_products: A dictionary mapping Object ids to lists of their DataProducts
+    :return: A SHA-256 hex digest
+    """
+    def components(items):
+        return [
+            (c.id, c.name, c.object_id, _generate_object_meta(c.object, data_products.get(c.object_id, ())))
+            for c in items
+        ]
+
+    graph = (code_run.id, str(code_run.run_date), code_run.description, components(inputs), components(outputs))
+    return hashlib.sha256(json.dumps(graph).encode('utf-8')).hexdigest()
+
+
+def render_prov_document(doc, format):
+    """
+    Render a PROV document as either a JPEG or SVG image or a JSON, XML or PROV-N report.
+
+    :param doc: A PROV-O document
+    :param format: The format to generate: jpg, svg, json, xml or provn
+    :return: The rendered report as bytes
+    """
+    if format in ('jpg', 'svg'):
+        dot = prov.dot.prov_to_dot(doc)
+        if format == 'jpg':
+            return dot.create_jpg()
+        return dot.create_svg()
+    with io.StringIO() as buf:
+        serializer = prov.serializers.get(format if format in ('xml', 'provn') else 'json')
+        serializer(doc).serialize(buf)
+        return buf.getvalue().encode('utf-8')
+
+
+def decode_prov_report(content, format):
+    """
+    Convert a rendered PROV report into the value returned by the API: bytes for images, text for XML and PROV-N
+    and the decoded data for JSON.
+    """
+    content = bytes(content)
+    if format in ('jpg', 'svg'):
+        return content
+    elif format in ('xml', 'provn'):
+        return content.decode('utf-8')
+    else:
+        return json.loads(content.decode('utf-8'))
 
 
 def serialize_prov_document(doc, format):
@@ -112,31 +194,100 @@ def serialize_prov_document(doc, format):
     :param format: The format to generate: jpg, svg, xml or provn
     :return: The PROV report in the specified format
     """
-    if format in ('jpg', 'svg'):
-        dot = prov.dot.prov_to_dot(doc)
-        with io.BytesIO() as buf:
-            if format == 'jpg':
-                buf.write(dot.create_jpg())
-            else:
-                buf.write(dot.create_svg())
-            buf.seek(0)
-            return buf.read()
-    elif format == 'xml':
-        with io.StringIO() as buf:
-            serializer = prov.serializers.get('xml')
-            serializer(doc).serialize(buf)
-            buf.seek(0)
-            return buf.read()
-    elif format == 'provn':
-        with io.StringIO() as buf:
-            serializer = prov.serializers.get('provn')
-            serializer(doc).serialize(buf)
-            buf.seek(0)
-            return buf.read()
-    else:
-        with io.StringIO() as buf:
-            serializer = prov.serializers.get('json')
-            serializer(doc).serialize(buf)
-            buf.seek(0)
-            return json.loads(buf.read())
+    return decode_prov_report(render_prov_document(doc, format), format)
+
+
+def _get_executor():
+    """
+    Return the pool of threads used to render PROV reports, which is limited to PROV_REPORT_WORKERS threads so that
+    a burst of requests for large reports cannot tie up every server worker.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = futures.ThreadPoolExecutor(
+                max_workers=getattr(settings, 'PROV_REPORT_WORKERS', 2), thread_name_prefix='prov-report')
+        return _executor
+
+
+def _store_prov_report(code_run, format, fingerprint, content):
+    models.RenderedProvReport.objects.update_or_create(
+        code_run=code_run, format=format, defaults={'fingerprint': fingerprint, 'content': content})
+
+
+def _stored_prov_report(code_run, format, fingerprint):
+    return models.RenderedProvReport.objects.filter(
+        code_run=code_run, format=format, fingerprint=fingerprint).values_list('content', flat=True).first()
+
+
+def get_prov_report(code_run, format):
+    """
+    Return the PROV report for a CodeRun, rendering it only if there is no stored report for the current state of its
+    provenance graph.
+
+    Rendering is done in the worker pool. If it takes longer than PROV_REPORT_TIMEOUT seconds a
+    concurrent.futures.TimeoutError is raised, but the rendering carries on and a later request for the same report
+    picks up the result rather than starting again.
+
+    :param code_run: The CodeRun to return the PROV report for
+    :param format: The format of the report: jpg, svg, json, xml or provn
+    :return: The PROV report in the specified format
+    """
+    if format not in PROV_REPORT_FORMATS:
+        format = 'json'
+    graph = fetch_prov_graph(code_run)
+    fingerprint = prov_graph_fingerprint(code_run, *graph)
+    content = _stored_prov_report(code_run, format, fingerprint)
+    if content is None:
+        key = (code_run.id, format)
+        with _pending_lock:
+            pending = _pending.get(key)
+            if pending is None or pending[0] != fingerprint:
+                future = _get_executor().submit(
+                    lambda: render_prov_document(build_prov_document(code_run, *graph), format))
+                pending = _pending[key] = (fingerprint, future)
+        future = pending[1]
+        try:
+            content = future.result(timeout=getattr(settings, 'PROV_REPORT_TIMEOUT', 60))
+        finally:
+            if future.done():
+                with _pending_lock:
+                    if _pending.get(key) is pending:
+                        del _pending[key]
+        _store_prov_report(code_run, format, fingerprint, content)
+    return decode_prov_report(content, format)
+
+
+def precompute_prov_reports(code_run, formats):
+    """
+    Render and store the PROV reports for a CodeRun in the given formats, skipping any that are already up to date.
+    """
+    graph = fetch_prov_graph(code_run)
+    fingerprint = prov_graph_fingerprint(code_run, *graph)
+    doc = None
+    for format in formats:
+        if _stored_prov_report(code_run, format, fingerprint) is None:
+            if doc is None:
+                doc = build_prov_document(code_run, *graph)
+            _store_prov_report(code_run, format, fingerprint, render_prov_document(doc, format))
+
+
+def schedule_prov_reports(code_run_ids):
+    """
+    Precompute the PROV reports for the given CodeRuns in the PROV_REPORT_PRECOMPUTE formats using the worker pool,
+    once the current transaction has been committed. Does nothing if PROV_REPORT_PRECOMPUTE is empty, the default.
+    """
+    formats = getattr(settings, 'PROV_REPORT_PRECOMPUTE', ())
+    if not formats or not code_run_ids:
+        return
+
+    def precompute():
+        try:
+            for code_run in models.CodeRun.objects.filter(id__in=code_run_ids):
+                precompute_prov_reports(code_run, formats)
+        except Exception:
+            logger.exception('Failed to precompute PROV reports for CodeRuns %s', code_run_ids)
+        finally:
+            connection.close()
 
+    transaction.on_commit(lambda: _get_executor().submit(precompute))
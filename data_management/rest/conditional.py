@@ -0,0 +1,153 @@
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+from data_management import caching
+from data_management.rest import serializers
+
+
+def related_models(model):
+    """
+    Return the models, other than users, whose rows can appear in the serialized form of a model's objects without
+    changing the objects' last_updated.
+    """
+    user_model = get_user_model()
+    return sorted({
+        field.related_model for field in model._meta.get_fields()
+        if field.is_relation and field.related_model not in (None, model, user_model)
+    }, key=lambda related: related._meta.label_lower)
+
+
+def dependent_models(model, expanded=()):
+    """
+    Return the models, other than users and the model itself, whose rows can appear in the serialized form of a
+    model's objects without changing the objects' last_updated, including the given models of related objects embedded
+    in them and the models related to those, and the models their serializers declare they read.
+    """
+    found = set(related_models(model)).union(serializers.serializer_for(model).READ_MODELS)
+    for related in expanded:
+        found.add(related)
+        found.update(related_models(related))
+        found.update(serializers.serializer_for(related).READ_MODELS)
+    found.discard(model)
+    return sorted(found, key=lambda related: related._meta.label_lower)
+
+
+def _validators(request, model, last_updated, parts, expanded=()):
+    """
+    Return the ETag and Last-Modified timestamp of a response.
+
+    The ETag covers the request URL and format, the given parts identifying the state of the objects in the response
+    and the generations of the related models, including those of any embedded objects. Generations are kept close to
+    the time of the last change to their model, so the latest of them also bounds when anything in the response last
+    changed.
+    """
+    params = sorted((key, value) for key, values in request.query_params.lists() for value in values)
+    generations = caching.generations(dependent_models(model, expanded))
+    digest = hashlib.sha1(repr((
+        request.path, params, request.accepted_media_type, last_updated, parts, generations,
+    )).encode('utf-8')).hexdigest()
+    timestamps = [int(generation / 1000) for generation in generations]
+    if last_updated is not None:
+        timestamps.append(int(last_updated.timestamp()))
+    return '"%s"' % digest, max(timestamps, default=None)
+
+
+def list_validators(request, queryset, expanded=()):
+    """
+    Return the ETag and Last-Modified timestamp of a list of objects, found with a single aggregate query over the
+    filtered queryset. The most recent last_updated moves forward when any object in the list changes and the count
+    changes when one is removed.
+    """
+    values = queryset.order_by().aggregate(last_updated=Max('last_updated'), count=Count('pk'))
+    return _validators(request, queryset.model, values['last_updated'], (values['count'],), expanded)
+
+
+def detail_validators(request, queryset, pk, expanded=()):
+    """
+    Return the ETag and Last-Modified timestamp of an object, or None if it does not exist.
+    """
+    try:
+        last_updated = queryset.order_by().filter(pk=pk).values_list('last_updated', flat=True).first()
+    except (TypeError, ValueError, ValidationError):
+        return None
+    if last_updated is None:
+        return None
+    return _validators(request, queryset.model, last_updated, (pk,), expanded)
+
+
+def conditional_response(request, validators, respond):
+    """
+    Answer a GET or HEAD request which has already been validated, returning 304 Not Modified if the client has the
+    current version of the response. The response is only built, with respond, when the body is needed.
+
+    :param request: The request
+    :param validators: The ETag and Last-Modified timestamp of the response, or None to skip conditional handling
+    :param respond: Function building the response
+    :return: The response
+    """
+    if validators is None:
+        return respond()
+    etag, last_modified = validators
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = Response() if request.method == 'HEAD' else respond()
+        if response.status_code != 200:
+            return response
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def _response_cache_key(request, model, expanded):
+    """
+    Return the key a response is cached under. It includes the generations of the model and of the same dependent
+    models as the ETag, including those its serializer reads, so any write to them moves the response to a new key.
+    """
+    models = [model] + dependent_models(model, expanded)
+    digest = hashlib.sha1(repr((
+        request.build_absolute_uri(), request.accepted_media_type, caching.generations(models),
+    )).encode('utf-8')).hexdigest()
+    return 'api-response:%s:%s' % (model._meta.label_lower, digest)
+
+
+def cached_response(request, model, validators, respond, expanded=()):
+    """
+    Answer a GET or HEAD request from the response cache, falling back to building the response and caching it.
+
+    Responses are cached for API_RESPONSE_CACHE_TIMEOUT seconds (600 by default), or indefinitely if this is None, as
+    writes to the models they are built from invalidate them. Setting it to 0 disables the cache.
+
+    :param request: The request
+    :param model: The model the response lists or shows the objects of
+    :param validators: Function returning the ETag and Last-Modified timestamp of the response, or None
+    :param respond: Function building the response
+    :param expanded: The models of any related objects embedded in the response
+    :return: The response
+    """
+    timeout = getattr(settings, 'API_RESPONSE_CACHE_TIMEOUT', 600)
+    if timeout == 0:
+        return conditional_response(request, validators(), respond)
+    key = _response_cache_key(request, model, expanded)
+    entry = cache.get(key)
+    if entry is not None:
+        content, content_type, entry_validators = entry
+        return conditional_response(
+            request, entry_validators, lambda: HttpResponse(content, content_type=content_type))
+
+    response_validators = validators()
+    response = conditional_response(request, response_validators, respond)
+    if request.method == 'GET' and response.status_code == 200 and hasattr(response, 'add_post_render_callback'):
+        def store(rendered):
+            cache.set(key, (rendered.content, rendered['Content-Type'], response_validators), timeout)
+        response.add_post_render_callback(store)
+    return response
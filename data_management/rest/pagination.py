@@ -1,19 +1,81 @@
 from collections import OrderedDict
-from rest_framework import pagination, response
+
+from django.conf import settings
+from django.db import connection
+from rest_framework import exceptions, pagination, response
+
+from data_management import caching
+
+COUNT_MODES = ('none', 'estimate', 'exact')
+NON_FILTER_QUERY_PARAMS = ('count', 'cursor', 'format', 'ordering', 'page_size')
+
+
+def cached_count(queryset, key):
+    """
+    Count the objects in a queryset, caching the result under the given key for API_COUNT_CACHE_TIMEOUT seconds or
+    until the model's objects change.
+    """
+    timeout = getattr(settings, 'API_COUNT_CACHE_TIMEOUT', 60)
+    return caching.cached('count:%s' % queryset.model._meta.label_lower, [queryset.model], [key], queryset.count,
+                          timeout)
+
+
+def estimated_count(queryset):
+    """
+    Return the PostgreSQL planner's estimate of the number of rows in the table behind an unfiltered queryset, or None
+    if no estimate is available.
+    """
+    if connection.vendor != 'postgresql' or queryset.query.where:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [queryset.model._meta.db_table])
+        row = cursor.fetchone()
+    if row is None or row[0] <= 0:
+        return None
+    return int(row[0])
 
 
 class CustomPagination(pagination.CursorPagination):
+    """
+    Cursor pagination which also returns the number of objects matching the query.
+
+    How the count is found is set by the count query argument: exact (the default) counts the matching objects,
+    estimate uses the database statistics where the list is not filtered, and otherwise a count cached for the set of
+    filters used, and none skips the count, returning null.
+    """
     ordering = '-id'
     page_size_query_param = 'page_size'
+    count_query_param = 'count'
 
     def paginate_queryset(self, queryset, request, view=None):
-        self.count = queryset.count()
+        mode = request.query_params.get(self.count_query_param, 'exact')
+        if mode not in COUNT_MODES:
+            raise exceptions.ValidationError(
+                {self.count_query_param: 'Must be one of [%s]' % ', '.join(COUNT_MODES)})
+        if mode == 'none':
+            self.count = None
+        elif mode == 'estimate':
+            self.count = estimated_count(queryset)
+            if self.count is None:
+                self.count = cached_count(queryset, self.get_filter_key(request))
+        else:
+            self.count = queryset.count()
         return super().paginate_queryset(queryset, request, view)
 
+    def get_filter_key(self, request):
+        """
+        Return a key identifying the set of filters applied to the list.
+        """
+        params = sorted(
+            (key, value) for key, values in request.query_params.lists() if key not in NON_FILTER_QUERY_PARAMS
+            for value in values
+        )
+        return request.path + '?' + '&'.join('%s=%s' % param for param in params)
+
     def get_paginated_response(self, data):
         return response.Response(OrderedDict([
             ('count', self.count),
             ('next', self.get_next_link()),
             ('previous', self.get_previous_link()),
             ('results', data),
-        ]))
\ No newline at end of file
+        ]))
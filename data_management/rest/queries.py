@@ -0,0 +1,91 @@
+from django.db.models import Prefetch
+
+from data_management.rest import serializers
+
+
+def _related_only(field):
+    """
+    Return a queryset for the model at the other end of a relation which loads only the columns needed to render a
+    hyperlink to each related object and to match it up with the object it was prefetched for.
+    """
+    names = ['pk']
+    if field.one_to_many:
+        names.append(field.field.attname)
+    return field.related_model.objects.only(*names)
+
+
+def _is_plain(queryset):
+    """
+    Return whether a queryset loads nothing beyond the columns of its model, so it can be replaced by a join.
+    """
+    return not queryset._prefetch_related_lookups and not queryset.query.annotations and \
+        not queryset.query.select_related
+
+
+def optimise_queryset(queryset, serializer_class, fields=None, expand=None):
+    """
+    Plan the joins and prefetches needed to serialize every object in a queryset with a fixed number of queries.
+
+    Forward foreign keys need nothing as their hyperlinks are built from the key column. Forward many-to-many fields
+    and any reverse relations listed in the models EXTRA_DISPLAY_FIELDS are prefetched, apart from reverse one-to-one
+    relations which are joined. Anything else the serializer needs is added by its annotate_queryset method.
+
+    When only some fields will be serialized, relations which are not among them are neither joined nor prefetched
+    and only the columns of the fields, and the primary key, are loaded.
+
+    Related objects which are embedded rather than linked to are loaded along with everything needed to serialize
+    them, planned in the same way: with a join for a single object which needs nothing more, and otherwise with a
+    prefetch.
+
+    :param queryset: The queryset to optimise
+    :param serializer_class: The serializer that will be used to serialize the objects in the queryset
+    :param fields: The names of the fields which will be serialized, or None for all of them
+    :param expand: The tree of related objects which will be embedded, as returned by the serializer's expansions
+    :return: The optimised queryset
+    """
+    model = queryset.model
+    extra_fields = getattr(model, 'EXTRA_DISPLAY_FIELDS', ())
+    expand = {name: tree for name, tree in (expand or {}).items() if fields is None or name in fields}
+    select_related = []
+    prefetch_related = []
+    for field in model._meta.get_fields():
+        if not field.is_relation:
+            continue
+        if field.auto_created and not field.concrete:
+            name = field.get_accessor_name()
+            if name not in extra_fields or name in expand or (fields is not None and name not in fields):
+                continue
+            if field.one_to_one:
+                select_related.append(name)
+            else:
+                prefetch_related.append(Prefetch(name, queryset=_related_only(field)))
+        elif field.many_to_many and field.name not in expand and (fields is None or field.name in fields):
+            prefetch_related.append(Prefetch(field.name, queryset=_related_only(field)))
+
+    joined = []
+    relations = serializers.related_fields(model)
+    for name, tree in expand.items():
+        field = relations[name]
+        related = optimise_queryset(
+            field.related_model.objects.all(), serializers.serializer_for(field.related_model), expand=tree)
+        if not (field.many_to_many or field.one_to_many) and _is_plain(related):
+            joined.append(name)
+        else:
+            prefetch_related.append(Prefetch(name, queryset=related))
+
+    if fields is not None:
+        names = [model._meta.pk.name] + [field.name for field in model._meta.concrete_fields if field.name in fields]
+        # The joined reverse one-to-one relations are only needed for their primary keys
+        names.extend('%s__%s' % (name, model._meta.get_field(name).related_model._meta.pk.name)
+                     for name in select_related)
+        names.extend('%s__%s' % (name, related_field.name) for name in joined
+                     for related_field in relations[name].related_model._meta.concrete_fields)
+        queryset = queryset.only(*names)
+    if select_related or joined:
+        queryset = queryset.select_related(*(select_related + joined))
+    if prefetch_related:
+        queryset = queryset.prefetch_related(*prefetch_related)
+    annotate_queryset = getattr(serializer_class, 'annotate_queryset', None)
+    if annotate_queryset is not None:
+        queryset = annotate_queryset(queryset, fields)
+    return queryset
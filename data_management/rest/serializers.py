@@ -1,13 +1,28 @@
+from collections import OrderedDict
 from uuid import uuid4
 
 from django.contrib.auth.models import Group
 from django.contrib.auth import get_user_model
+from django.db.models import Exists, Manager, OuterRef
 from rest_framework import serializers
 from rest_framework.reverse import reverse
+from rest_framework.validators import UniqueValidator
 
 from data_management import models
 
 
+class UserListSerializer(serializers.ListSerializer):
+    """
+    Class for serializing a list of Users, looking up the details of all of them in the personnel database at once.
+    """
+    def to_representation(self, data):
+        users = list(data.all() if isinstance(data, Manager) else data)
+        prefetch = getattr(get_user_model(), 'prefetch_directory', None)
+        if prefetch is not None:
+            prefetch(users)
+        return super().to_representation(users)
+
+
 class UserSerializer(serializers.HyperlinkedModelSerializer):
     """
     Class for serializing the User model.
@@ -15,6 +30,7 @@ class UserSerializer(serializers.HyperlinkedModelSerializer):
     class Meta:
         model = get_user_model()
         fields = ['url', 'username', 'full_name', 'email', 'orgs']
+        list_serializer_class = UserListSerializer
 
 
 class GroupSerializer(serializers.HyperlinkedModelSerializer):
@@ -26,21 +42,131 @@ class GroupSerializer(serializers.HyperlinkedModelSerializer):
         fields = ['url', 'name']
 
 
+def related_fields(model):
+    """
+    Return the relations of a model to other registry objects, keyed by the name they are serialized under.
+    """
+    fields = {}
+    for field in model._meta.get_fields():
+        if field.is_relation and field.related_model in models.all_models.values():
+            fields[field.get_accessor_name() if field.auto_created and not field.concrete else field.name] = field
+    return fields
+
+
+def serializer_for(model):
+    """
+    Return the serializer class for a registry model.
+    """
+    return globals()[model.__name__ + 'Serializer']
+
+
 class BaseSerializer(serializers.HyperlinkedModelSerializer):
     """
     Base class for serializing the data management objects.
 
     Serializes all the defined fields on the model as well as any non-database field or method specified in the models
     EXTRA_DISPLAY_FIELDS.
+
+    READ_MODELS lists any models, beyond the model's relations, whose rows the serializer's annotations and method
+    fields read, so that the ETags and cached responses of the model depend on them too.
     """
+    READ_MODELS = ()
+
     class Meta:
         model = models.BaseModel
         fields = '__all__'
 
+    def __init__(self, *args, **kwargs):
+        self.selected_fields = kwargs.pop('fields', None)
+        self.expand = kwargs.pop('expand', None) or {}
+        super().__init__(*args, **kwargs)
+
     def get_field_names(self, declared_fields, info):
-        expanded_fields = super().get_field_names(declared_fields, info)
+        expanded_fields = [
+            name for name in super().get_field_names(declared_fields, info)
+            if not isinstance(info.fields.get(name), models.SortKeyField)
+        ]
         return expanded_fields + list(self.Meta.model.EXTRA_DISPLAY_FIELDS)
 
+    def get_fields(self):
+        fields = super().get_fields()
+        if self.context.get('bulk'):
+            # When creating objects in bulk uniqueness is left to the database rather than checked item by item
+            for field in fields.values():
+                field.validators = [v for v in field.validators if not isinstance(v, UniqueValidator)]
+        if self.selected_fields is not None:
+            fields = OrderedDict((name, field) for name, field in fields.items() if name in self.selected_fields)
+        relations = related_fields(self.Meta.model)
+        for name, expand in self.expand.items():
+            if name in fields:
+                field = relations[name]
+                fields[name] = serializer_for(field.related_model)(
+                    many=field.many_to_many or field.one_to_many, read_only=True, expand=expand)
+        return fields
+
+    @classmethod
+    def select_fields(cls, fields=None, omit=None):
+        """
+        Return the names of the fields to serialize given the names asked for and the names to leave out, or None for
+        every field.
+
+        :param fields: The names of the fields to serialize, or None for all of them
+        :param omit: The names of the fields to leave out, or None
+        :return: The set of names
+        :raises ValueError: If any of the names is not a field of the serializer
+        """
+        if fields is None and not omit:
+            return None
+        names = list(cls().fields)
+        unknown = set(fields or ()).union(omit or ()) - set(names)
+        if unknown:
+            raise ValueError('Unknown fields [%s], must be from [%s]' % (', '.join(sorted(unknown)), ', '.join(names)))
+        return set(names if fields is None else fields) - set(omit or ())
+
+    @classmethod
+    def expansions(cls, paths):
+        """
+        Return the tree of related objects to embed in place of their hyperlinks, given as dotted paths of field names
+        such as `object.storage_location`. Embedding a related object through a path also embeds the objects before
+        it on the path.
+
+        :param paths: The paths to the related objects
+        :return: A dictionary of the subtrees of the related objects to embed, keyed by field name
+        :raises ValueError: If any of the paths does not lead through relations to registry objects
+        """
+        tree = {}
+        for path in paths:
+            serializer_class, node = cls, tree
+            for name in path.split('.'):
+                field = related_fields(serializer_class.Meta.model).get(name)
+                if field is None or name not in serializer_class().fields:
+                    raise ValueError('Cannot expand %s, %s is not a related object of %s' % (
+                        path, name, serializer_class.Meta.model.__name__))
+                serializer_class, node = serializer_for(field.related_model), node.setdefault(name, {})
+        return tree
+
+    @classmethod
+    def expanded_models(cls, tree):
+        """
+        Return the models of the related objects embedded by a tree of expansions.
+        """
+        found = []
+        for name, subtree in tree.items():
+            serializer_class = serializer_for(related_fields(cls.Meta.model)[name].related_model)
+            found.extend([serializer_class.Meta.model] + serializer_class.expanded_models(subtree))
+        return found
+
+    @classmethod
+    def annotate_queryset(cls, queryset, fields=None):
+        """
+        Add any annotations needed by the serializer method fields to a queryset, so that they are not calculated with
+        a query per object.
+
+        :param queryset: The queryset to annotate
+        :param fields: The names of the fields which will be serialized, or None for all of them
+        """
+        return queryset
+
 class BaseSerializerUUID(BaseSerializer):
     uuid = serializers.UUIDField(initial=uuid4, default=uuid4)
 
@@ -67,16 +193,24 @@ class CodeRunSerializer(BaseSerializer):
 
 class DataProductSerializer(BaseSerializer):
     internal_format = serializers.SerializerMethodField()
+    READ_MODELS = (models.ObjectComponent,)
 
     class Meta(BaseSerializer.Meta):
         model = models.DataProduct
         fields = '__all__'
         read_only_fields = model.EXTRA_DISPLAY_FIELDS
 
+    @classmethod
+    def annotate_queryset(cls, queryset, fields=None):
+        if fields is not None and 'internal_format' not in fields:
+            return queryset
+        components = models.ObjectComponent.objects.filter(object=OuterRef('object'), whole_object=False)
+        return queryset.annotate(internal_format=Exists(components))
+
     def get_internal_format(self, obj):
-        internal_format = serializers.BooleanField()
-        internal_format = any([component.whole_object == False for component in obj.object.components.all()])
-        return internal_format
+        if hasattr(obj, 'internal_format'):
+            return obj.internal_format
+        return obj.object.components.filter(whole_object=False).exists()
 
 
 for name, cls in models.all_models.items():
@@ -1,25 +1,35 @@
+from concurrent import futures
+import configparser
 from copy import deepcopy
-import fnmatch
+import csv
+import json
+
+import requests
 
 from django import forms, db
+from django.db import transaction
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models.signals import post_save
+from django.http import StreamingHttpResponse
 from rest_framework.authentication import SessionAuthentication, BasicAuthentication, TokenAuthentication
-from rest_framework.decorators import renderer_classes
+from rest_framework.decorators import action, renderer_classes
 from rest_framework.exceptions import APIException, ValidationError
 from rest_framework.permissions import IsAuthenticatedOrReadOnly
 from rest_framework import viewsets, permissions, views, renderers, mixins, exceptions, status, filters as rest_filters
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
 from django.db import IntegrityError
 from django_filters.rest_framework import DjangoFilterBackend, filterset
 from django_filters import constants, filters
 from django.contrib.auth.models import Group
 from django.contrib.auth import get_user_model
 from django.shortcuts import get_object_or_404
-from django.db.models import Q
 
-from data_management import models, object_storage, settings
+from data_management import changes, models, object_storage, search, settings, snapshot, versions
 from data_management import object_storage
-from data_management.rest import serializers
-from data_management.prov import generate_prov_document, serialize_prov_document
+from data_management.rest import conditional, serializers
+from data_management.rest.queries import optimise_queryset
+from data_management.prov import get_prov_report, schedule_prov_reports
 
 
 class BadQuery(APIException):
@@ -27,6 +37,18 @@ class BadQuery(APIException):
     default_code = 'bad_query'
 
 
+class StorageError(APIException):
+    status_code = 502
+    default_detail = 'The object store could not complete the request.'
+    default_code = 'storage_error'
+
+
+class ReportUnavailable(APIException):
+    status_code = 503
+    default_detail = 'The report is still being generated, try again later.'
+    default_code = 'report_unavailable'
+
+
 class JPEGRenderer(renderers.BaseRenderer):
     """
     Custom rendered for returning JPEG images.
@@ -79,6 +101,58 @@ class ProvnRenderer(renderers.BaseRenderer):
         return data
 
 
+class NDJSONRenderer(renderers.BaseRenderer):
+    """
+    Custom renderer for returning newline delimited JSON, one object per line.
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf8'
+    render_style = 'text'
+
+    def render(self, data, media_type=None, renderer_context=None):
+        return json.dumps(data, cls=DjangoJSONEncoder) + '\n'
+
+
+class CSVRenderer(renderers.BaseRenderer):
+    """
+    Custom renderer for returning CSV data, with a header row naming the columns.
+    """
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf8'
+    render_style = 'text'
+
+    def render(self, data, media_type=None, renderer_context=None):
+        return ''.join(csv_lines(list(data.keys()), [data.values()]))
+
+
+class _Echo:
+    """
+    File-like object returning what is written to it, so csv.writer can produce one line at a time.
+    """
+    def write(self, value):
+        return value
+
+
+def csv_lines(names, rows):
+    """
+    Yield the lines of a CSV file with the given column names and rows.
+    """
+    writer = csv.writer(_Echo())
+    yield writer.writerow(names)
+    for row in rows:
+        yield writer.writerow(['' if value is None else value for value in row])
+
+
+def ndjson_lines(names, rows):
+    """
+    Yield the lines of newline delimited JSON with an object for each row.
+    """
+    for row in rows:
+        yield json.dumps(dict(zip(names, row)), cls=DjangoJSONEncoder) + '\n'
+
+
 class TextRenderer(renderers.BaseRenderer):
     """
     Custom renderer for returning plain text data.
@@ -99,16 +173,128 @@ class ProvReportView(views.APIView):
     """
     API view for returning a PROV report for a CodeRun.
 
-    This report can be returned as JSON (default) or JPEG, SVG, XML or PROV-N using the custom renderers.
+    This report can be returned as JSON (default) or JPEG, SVG, XML or PROV-N using the custom renderers. Rendered
+    reports are stored until the CodeRun's inputs or outputs change.
     """
 
     def get(self, request, pk, format=None):
         code_run = get_object_or_404(models.CodeRun, pk=pk)
-        doc = generate_prov_document(code_run)
-        value = serialize_prov_document(doc, request.accepted_renderer.format)
+        try:
+            value = get_prov_report(code_run, request.accepted_renderer.format)
+        except futures.TimeoutError:
+            raise ReportUnavailable()
         return Response(value)
 
 
+class SearchView(views.APIView):
+    """
+    API view for searching the text of DataProducts, ExternalObjects and CodeRepoReleases.
+
+    Every term in `q` must match the start of a term in the namespace, name, title, identifiers, version, description
+    or keywords of an object. Results are given best match first and can be restricted to one kind of object with
+    `type`, and paged through with `limit` and `offset`.
+    """
+    TYPES = {
+        'data_product': models.DataProduct,
+        'external_object': models.ExternalObject,
+        'code_repo_release': models.CodeRepoRelease,
+    }
+    MAX_LIMIT = 100
+
+    def get(self, request, format=None):
+        if set(request.query_params.keys()) - {'q', 'type', 'limit', 'offset', 'format'}:
+            raise BadQuery(detail='Invalid query arguments, only query arguments [q, type, limit, offset] are allowed')
+        query = request.query_params.get('q', '')
+        if not search.terms(query):
+            raise BadQuery(detail='A search query must be given in q')
+        types = request.query_params.getlist('type')
+        if set(types) - set(self.TYPES):
+            raise BadQuery(detail='Invalid type, must be one of [%s]' % ', '.join(self.TYPES))
+        try:
+            limit = int(request.query_params.get('limit', 20))
+            offset = int(request.query_params.get('offset', 0))
+        except ValueError:
+            raise BadQuery(detail='limit and offset must be integers')
+        if not 0 < limit <= self.MAX_LIMIT or offset < 0:
+            raise BadQuery(detail='limit must be between 1 and %d and offset must not be negative' % self.MAX_LIMIT)
+
+        names = {model._meta.model_name: name for name, model in self.TYPES.items()}
+        model_names = [self.TYPES[name]._meta.model_name for name in types]
+        results = [
+            {
+                'type': names[document.model],
+                'url': reverse(document.model + '-detail', args=[document.object_id], request=request),
+                'title': document.title,
+                'rank': document.rank,
+            } for document in search.search(query, model_names, limit, offset)
+        ]
+        return Response({'results': results})
+
+
+class ChangesView(views.APIView):
+    """
+    API view for the feed of changes to every model, oldest first.
+
+    Each change gives the type and id of the object which was created, updated or deleted, and the URL of the object
+    unless it has been deleted. Pass the `next` value of a response as `since` to get the changes made after it, and
+    restrict the feed to some models with `type`.
+    """
+    MAX_LIMIT = 1000
+
+    def get(self, request, format=None):
+        if set(request.query_params.keys()) - {'since', 'type', 'limit', 'format'}:
+            raise BadQuery(detail='Invalid query arguments, only query arguments [since, type, limit] are allowed')
+        type_names = {changes.type_name(model) for model in models.all_models.values()}
+        types = request.query_params.getlist('type')
+        if set(types) - type_names:
+            raise BadQuery(detail='Invalid type, must be one of [%s]' % ', '.join(sorted(type_names)))
+        try:
+            since = int(request.query_params.get('since', 0))
+            limit = int(request.query_params.get('limit', 100))
+        except ValueError:
+            raise BadQuery(detail='since and limit must be integers')
+        if not 0 < limit <= self.MAX_LIMIT or since < 0:
+            raise BadQuery(detail='limit must be between 1 and %d and since must not be negative' % self.MAX_LIMIT)
+
+        entries = changes.changes(since, limit, types or None)
+        results = [
+            {
+                'id': entry.id,
+                'type': changes.type_name(model),
+                'object_id': entry.object_id,
+                'action': entry.action,
+                'timestamp': entry.timestamp,
+                'url': None if entry.action == changes.DELETED else reverse(
+                    model._meta.model_name + '-detail', args=[entry.object_id], request=request),
+            } for entry, model in entries if model is not None
+        ]
+        return Response({'results': results, 'next': entries[-1][0].id if entries else since})
+
+
+class ImportView(views.APIView):
+    """
+    API view for loading a registry snapshot, as pushed by the push_registry command of another registry.
+
+    The request body is the gzipped snapshot, which is read as it arrives. Objects already in the registry are updated
+    to match, unless they are only sent as references, and the objects created or updated are attributed to the user
+    making the request. Returns the number of objects created or updated for each model.
+
+    Imports can change any object in the registry, including those the rest of the API does not allow to be updated,
+    so only staff users can make them.
+    """
+    authentication_classes = [SessionAuthentication, BasicAuthentication, TokenAuthentication]
+    permission_classes = [permissions.IsAdminUser]
+
+    def post(self, request, format=None):
+        try:
+            counts = snapshot.import_(request._request, user=request.user)
+        except snapshot.SnapshotError as ex:
+            raise BadQuery(detail=str(ex))
+        except IntegrityError as ex:
+            raise BadQuery(detail='The snapshot conflicts with objects in the registry: %s' % ex)
+        return Response(counts)
+
+
 class UserViewSet(viewsets.ReadOnlyModelViewSet):
     """
     API views (GET only) for the User model.
@@ -121,7 +307,7 @@ class UserViewSet(viewsets.ReadOnlyModelViewSet):
     filterset_fields = ['username']
 
     def list(self, request, *args, **kwargs):
-        if set(request.query_params.keys()) - {'username', 'cursor', 'format'}:
+        if set(request.query_params.keys()) - {'username', 'count', 'cursor', 'format'}:
             raise BadQuery(detail='Invalid query arguments, only query arguments [username] are allowed')
         return super().list(request, *args, **kwargs)
 
@@ -136,7 +322,7 @@ class GroupViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
 
     def list(self, request, *args, **kwargs):
-        if set(request.query_params.keys()) - {'cursor', 'format'}:
+        if set(request.query_params.keys()) - {'count', 'cursor', 'format'}:
             raise BadQuery(detail='Invalid query arguments, no query arguments are allowed')
         return super().list(request, *args, **kwargs)
 
@@ -163,27 +349,53 @@ class GlobFilter(filters.Filter):
             return qs
         if self.distinct:
             qs = qs.distinct()
-        # The regex generated by fnmatch is not compatible with PostgreSQL so we need to do remove the ?s: characters
-        # and we also add a \A at the start so that it matches on the entire string.
-        regex_value = '\\A' + fnmatch.translate(value).replace('?s:', '')
-        lookup = '%s__regex' % (self.field_name,)
-        qs = self.get_method(qs)(**{lookup: regex_value})
+        lookup = '%s__%s' % (self.field_name, self.lookup_expr)
+        qs = self.get_method(qs)(**{lookup: value})
         return qs
 
     field_class = forms.CharField
 
 
+class VersionFilter(filters.CharFilter):
+    """
+    Custom API filter for VersionField fields. As well as matching a version exactly this accepts latest, to match the
+    latest version of each object, or a range such as >=1.2.0, ^1.2.0, ~1.2.0 or >=1.0.0,<1.4.0 for models which store
+    sort keys for their versions.
+    """
+    def filter(self, qs, value):
+        if value in constants.EMPTY_VALUES:
+            return qs
+        if not qs.model.VERSION_GROUP_FIELDS or (value != 'latest' and value[0] not in '<>=^~' and ',' not in value):
+            return super().filter(qs, value)
+        if value == 'latest':
+            return versions.latest(qs, self.field_name, qs.model.VERSION_GROUP_FIELDS)
+        try:
+            return qs.filter(versions.range_q(self.field_name, value))
+        except ValueError as ex:
+            raise BadQuery(detail=str(ex))
+
+
 class CustomFilterSet(filterset.FilterSet):
     """
-    Custom filters which we use to add glob filtering to all NameField fields.
+    Custom filters which we use to add glob filtering to all NameField fields and version filtering to all VersionField
+    fields.
     """
     FILTER_DEFAULTS = deepcopy(filterset.FILTER_FOR_DBFIELD_DEFAULTS)
     FILTER_DEFAULTS.update({
         models.NameField: {'filter_class': GlobFilter},
+        models.VersionField: {'filter_class': VersionFilter},
         db.models.OneToOneField: {'filter_class': filters.NumberFilter},
         db.models.ForeignKey: {'filter_class': filters.NumberFilter},
     })
 
+    @classmethod
+    def get_fields(cls):
+        fields = super().get_fields()
+        sort_keys = [field.name for field in cls._meta.model._meta.fields if isinstance(field, models.SortKeyField)]
+        for name in sort_keys:
+            fields.pop(name, None)
+        return fields
+
 
 class CustomDjangoFilterBackend(DjangoFilterBackend):
     """
@@ -192,36 +404,143 @@ class CustomDjangoFilterBackend(DjangoFilterBackend):
     default_filter_set = CustomFilterSet
 
 
+BULK_CREATE_BATCH_SIZE = 500
+EXPORT_CHUNK_SIZE = 2000
+# Kept below SQLite's default limit on the number of parameters in a query
+CHECKSUM_BATCH_SIZE = 500
+
+
+def _names(params, key):
+    """
+    Return the comma separated names given in a query argument, which may be repeated, or None if it is not given.
+    """
+    if key not in params:
+        return None
+    return [name for value in params.getlist(key) for name in value.split(',') if name]
+
+
 class BaseViewSet(mixins.CreateModelMixin,
                   mixins.ListModelMixin,
                   mixins.RetrieveModelMixin,
                   viewsets.GenericViewSet):
     """
     Base class for all model API views. Allows for GET to retrieve lists of objects and single object, and
-    POST to create a new object.
+    POST to create a new object, or a list of new objects.
     """
     authentication_classes = [SessionAuthentication, BasicAuthentication, TokenAuthentication]
     permission_classes = [IsAuthenticatedOrReadOnly]
     filter_backends = [CustomDjangoFilterBackend, rest_filters.OrderingFilter]
     ordering = ['-id']
 
-    def list(self, request, *args, **kwargs):
+    def check_query_params(self, request, extra_params):
+        """
+        Raise BadQuery if the request has query arguments other than the model's filters and the given arguments.
+        """
         if self.model.FILTERSET_FIELDS == '__all__':
-            filterset_fields = self.model.field_names() + ('cursor', 'format', 'ordering', 'page_size')
+            filterset_fields = self.model.field_names() + extra_params
         else:
-            filterset_fields = self.model.FILTERSET_FIELDS + ('cursor', 'format', 'ordering', 'page_size')
+            filterset_fields = self.model.FILTERSET_FIELDS + extra_params
         if set(request.query_params.keys()) - set(filterset_fields):
             args = ', '.join(filterset_fields)
             raise BadQuery(detail='Invalid query arguments, only query arguments [%s] are allowed' % args)
-        return super().list(request, *args, **kwargs)
+
+    def get_requested_fields(self):
+        """
+        Return the names of the fields asked for with the `fields` and `omit` query arguments when listing or
+        retrieving objects, or None to serialize every field.
+        """
+        if self.action not in ('list', 'retrieve'):
+            return None
+        params = self.request.query_params
+        try:
+            return self.get_serializer_class().select_fields(_names(params, 'fields'), _names(params, 'omit'))
+        except ValueError as ex:
+            raise BadQuery(detail=str(ex))
+
+    def get_expansions(self):
+        """
+        Return the tree of related objects asked for with the `expand` query argument to embed in the objects listed or
+        retrieved, in place of their hyperlinks.
+        """
+        if self.action not in ('list', 'retrieve'):
+            return {}
+        try:
+            return self.get_serializer_class().expansions(_names(self.request.query_params, 'expand') or [])
+        except ValueError as ex:
+            raise BadQuery(detail=str(ex))
+
+    def get_serializer(self, *args, **kwargs):
+        if self.action in ('list', 'retrieve'):
+            kwargs.setdefault('fields', self.get_requested_fields())
+            kwargs.setdefault('expand', self.get_expansions())
+        return super().get_serializer(*args, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        self.check_query_params(
+            request, ('count', 'cursor', 'expand', 'fields', 'format', 'omit', 'ordering', 'page_size'))
+        expanded = self.get_serializer_class().expanded_models(self.get_expansions())
+        return self.cached_response(
+            request,
+            lambda: conditional.list_validators(request, self.filter_queryset(self.model.objects.all()), expanded),
+            lambda: super(BaseViewSet, self).list(request, *args, **kwargs),
+            expanded)
+
+    def retrieve(self, request, *args, **kwargs):
+        expanded = self.get_serializer_class().expanded_models(self.get_expansions())
+        return self.cached_response(
+            request,
+            lambda: conditional.detail_validators(
+                request, self.model.objects.all(), kwargs[self.lookup_field], expanded),
+            lambda: super(BaseViewSet, self).retrieve(request, *args, **kwargs),
+            expanded)
+
+    @action(detail=False, renderer_classes=[NDJSONRenderer, CSVRenderer])
+    def export(self, request):
+        """
+        Stream every object matching the filters as newline delimited JSON or, with format=csv, as CSV. The rows are
+        read through a server-side cursor and written out as they arrive, so any number can be exported at once.
+        Related objects are given by their ids. The columns can be chosen with `fields` and `omit`.
+        """
+        self.check_query_params(request, ('fields', 'format', 'omit', 'ordering'))
+        fields = [
+            field for field in self.model._meta.concrete_fields if not isinstance(field, models.SortKeyField)
+        ]
+        requested, omitted = _names(request.query_params, 'fields'), _names(request.query_params, 'omit') or []
+        unknown = set(requested or ()).union(omitted) - {field.name for field in fields}
+        if unknown:
+            raise BadQuery(detail='Unknown fields [%s], must be from [%s]' % (
+                ', '.join(sorted(unknown)), ', '.join(field.name for field in fields)))
+        fields = [field for field in fields
+                  if (requested is None or field.name in requested) and field.name not in omitted]
+        names = [field.attname for field in fields]
+        rows = self.filter_queryset(self.model.objects.all()).values_list(*names).iterator(
+            chunk_size=EXPORT_CHUNK_SIZE)
+        renderer = request.accepted_renderer
+        lines = csv_lines(names, rows) if renderer.format == 'csv' else ndjson_lines(names, rows)
+        response = StreamingHttpResponse(lines, content_type='%s; charset=utf-8' % renderer.media_type)
+        response['Content-Disposition'] = 'attachment; filename="%s.%s"' % (
+            self.model._meta.model_name, renderer.format)
+        return response
+
+    def cached_response(self, request, validators, respond, expanded=()):
+        """
+        Answer a GET or HEAD request from the response cache, with an ETag and Last-Modified and honouring
+        conditional requests. The browsable API is excluded as its pages also depend on the user viewing them.
+        """
+        if isinstance(request.accepted_renderer, renderers.BrowsableAPIRenderer):
+            return respond()
+        return conditional.cached_response(request, self.model, validators, respond, expanded)
 
     def get_queryset(self):
-        return self.model.objects.all()
+        return optimise_queryset(
+            self.model.objects.all(), self.get_serializer_class(), self.get_requested_fields(), self.get_expansions())
 
     def create(self, request, *args, **kwargs):
         """
         Customising the create method to raise a 409 on uniqueness validation failing.
         """
+        if isinstance(request.data, list):
+            return self.bulk_create(request)
         try:
             return super().create(request, *args, **kwargs)
         except ValidationError as ex:
@@ -236,19 +555,128 @@ class BaseViewSet(mixins.CreateModelMixin,
         Customising the save method to add the current user as the models updated_by.
         """
         try:
-            return serializer.save(updated_by=self.request.user)
+            instance = serializer.save(updated_by=self.request.user)
         except IntegrityError as ex:
             raise APIIntegrityError(str(ex))
+        self.perform_created([instance])
+        return instance
+
+    def perform_created(self, instances):
+        """
+        Hook called with the objects created by a POST request, which by default does nothing.
+        """
+
+    def bulk_create(self, request):
+        """
+        Create a list of objects in a single transaction, returning a result for each item in the order given.
+
+        Items which fail validation are given a 400 result and items which clash with an existing object a 409 result,
+        neither of which prevents the remaining items from being created. Uniqueness is left to the database rather
+        than checked item by item, and where the database can return the ids of inserted rows the objects are
+        inserted in batches.
+        """
+        context = self.get_serializer_context()
+        context['bulk'] = True
+        results = [None] * len(request.data)
+        valid = []
+        for index, item in enumerate(request.data):
+            if not isinstance(item, dict):
+                results[index] = {'status': status.HTTP_400_BAD_REQUEST, 'errors': 'Expected a JSON object'}
+                continue
+            serializer = self.get_serializer_class()(data=item, context=context)
+            if serializer.is_valid():
+                valid.append((index, serializer))
+            else:
+                results[index] = {'status': status.HTTP_400_BAD_REQUEST, 'errors': serializer.errors}
+
+        with transaction.atomic():
+            for start in range(0, len(valid), BULK_CREATE_BATCH_SIZE):
+                batch = valid[start:start + BULK_CREATE_BATCH_SIZE]
+                if not self._can_batch_insert() or not self._batch_insert(batch):
+                    self._insert_each(batch, results)
+
+            created = [serializer.instance for index, serializer in valid if results[index] is None]
+            self.perform_created(created)
+
+        for index, serializer in valid:
+            if results[index] is None:
+                results[index] = {'status': status.HTTP_201_CREATED, 'data': serializer.data}
+
+        if all(result['status'] == status.HTTP_201_CREATED for result in results):
+            return Response(results, status=status.HTTP_201_CREATED)
+        return Response(results, status=status.HTTP_207_MULTI_STATUS)
+
+    def _can_batch_insert(self):
+        """
+        Batched inserts skip Model.save, so can only be used for models which do not customise it, and need the
+        database to return the ids of the new rows so that the many-to-many fields can be set.
+        """
+        return db.connection.features.can_return_rows_from_bulk_insert and self.model.save is models.BaseModel.save
+
+    def _batch_insert(self, batch):
+        """
+        Insert a batch of validated serializers with a single INSERT, returning False if the batch clashes with an
+        existing object so that the caller can fall back to inserting the items one at a time.
+        """
+        many_to_many = [field.name for field in self.model._meta.many_to_many]
+        instances = []
+        relations = []
+        for _, serializer in batch:
+            data = dict(serializer.validated_data)
+            relations.append({name: data.pop(name) for name in many_to_many if name in data})
+            instances.append(self.model(updated_by=self.request.user, **data))
+        try:
+            with transaction.atomic():
+                self.model.objects.bulk_create(instances)
+                for instance, values in zip(instances, relations):
+                    for name, value in values.items():
+                        getattr(instance, name).set(value)
+                # bulk_create does not send post_save, which keeps caches and search documents up to date
+                for instance in instances:
+                    post_save.send(sender=self.model, instance=instance, created=True, raw=False,
+                                   using=instance._state.db, update_fields=None)
+        except IntegrityError:
+            return False
+        for (_, serializer), instance in zip(batch, instances):
+            serializer.instance = instance
+        return True
+
+    def _insert_each(self, batch, results):
+        """
+        Insert a batch of validated serializers one at a time, each in its own savepoint so that a uniqueness
+        failure only affects that item.
+        """
+        for index, serializer in batch:
+            try:
+                with transaction.atomic():
+                    serializer.save(updated_by=self.request.user)
+            except IntegrityError as ex:
+                results[index] = {'status': status.HTTP_409_CONFLICT, 'detail': str(ex)}
 
 
 class ObjectStorageView(views.APIView):
     """
     API view allowing users to upload data to object storage
+
+    POST a checksum to get a URL to upload a file with that checksum to, or a 409 if a file with the same checksum is
+    already in object storage. POST a list of up to 1000 checksums as `checksums` to check them all at once, which
+    returns the checksums that are already in object storage in `exists` and an upload URL for each of the others in
+    `urls`.
+
+    Sending the `size` of the file in bytes with a checksum allows files larger than the object store's segment size to
+    be uploaded in segments, optionally of a given `segment_size`, which is increased if the file would otherwise need
+    more segments than a manifest can list. This returns the `segment_size` used, a list of URLs to upload each segment
+    to, in parallel if wanted, and a `manifest` URL to POST the `etag` and `size` of each segment to once they have all
+    been uploaded.
     """
     authentication_classes = [SessionAuthentication, BasicAuthentication, TokenAuthentication]
     permission_classes = [IsAuthenticatedOrReadOnly]
+    MAX_CHECKSUMS = 1000
 
     def post(self, request, checksum=None):
+        if not checksum and 'checksums' in request.data:
+            return self.post_many(request.data['checksums'])
+
         if 'checksum' not in request.data and not checksum:
             return Response(status=status.HTTP_400_BAD_REQUEST)
 
@@ -258,20 +686,92 @@ class ObjectStorageView(views.APIView):
         if self.check_hash(checksum):
             return Response(status=status.HTTP_409_CONFLICT)
 
+        if 'size' in request.data:
+            return self.post_segmented(request, checksum)
+
         data = {'url': object_storage.create_url(checksum, 'PUT')}
         return Response(data)
 
+    def post_segmented(self, request, checksum):
+        max_segment_size = object_storage.max_segment_size()
+        size = request.data['size']
+        segment_size = request.data.get('segment_size', max_segment_size)
+        if not isinstance(size, int) or size < 0:
+            raise BadQuery(detail='size must be a number of bytes')
+        if not isinstance(segment_size, int) or not object_storage.MIN_SEGMENT_SIZE <= segment_size <= max_segment_size:
+            raise BadQuery(detail='segment_size must be between %d and %d bytes' % (
+                object_storage.MIN_SEGMENT_SIZE, max_segment_size))
+        if size <= segment_size:
+            return Response({'url': object_storage.create_url(checksum, 'PUT')})
+        segment_size = object_storage.fit_segment_size(size, segment_size)
+        if segment_size > max_segment_size:
+            raise BadQuery(detail='size must be at most %d bytes, %d segments of %d bytes' % (
+                object_storage.max_segments() * max_segment_size, object_storage.max_segments(), max_segment_size))
+        return Response({
+            'segment_size': segment_size,
+            'segments': object_storage.create_segment_urls(checksum, size, segment_size),
+            'manifest': reverse('object_storage_manifest', kwargs={'checksum': checksum}, request=request),
+        })
+
+    def post_many(self, checksums):
+        if not isinstance(checksums, list) or not all(isinstance(c, str) and c for c in checksums):
+            raise BadQuery(detail='checksums must be a list of checksums')
+        if len(checksums) > self.MAX_CHECKSUMS:
+            raise BadQuery(detail='At most %d checksums can be checked at once' % self.MAX_CHECKSUMS)
+        checksums = list(dict.fromkeys(checksums))
+        existing = existing_hashes(checksums)
+        return Response({
+            'exists': [checksum for checksum in checksums if checksum in existing],
+            'urls': dict(
+                (checksum, object_storage.create_url(checksum, 'PUT'))
+                for checksum in checksums if checksum not in existing
+            ),
+        })
+
     def check_hash(self, checksum):
-        try:
-            storage_root = models.StorageRoot.objects.get(Q(name=settings.CONFIG.get('storage', 'storage_root')))
-            locations = models.StorageLocation.objects.filter(Q(storage_root=storage_root) & Q(hash=checksum))
-        except:
-            return False
-        else:
-            if not locations:
-                return False
+        return checksum in existing_hashes([checksum])
 
-        return True
+
+def existing_hashes(checksums):
+    """
+    Return the set of the given checksums which are already stored in the object storage root, using one query for each
+    batch of checksums.
+    """
+    try:
+        root = settings.CONFIG.get('storage', 'storage_root')
+    except configparser.Error:
+        return set()
+    existing = set()
+    for start in range(0, len(checksums), CHECKSUM_BATCH_SIZE):
+        batch = checksums[start:start + CHECKSUM_BATCH_SIZE]
+        existing.update(models.StorageLocation.objects.filter(
+            storage_root__root=root, hash__in=batch).values_list('hash', flat=True))
+    return existing
+
+
+class ObjectStorageManifestView(views.APIView):
+    """
+    API view completing a segmented upload to object storage
+
+    POST the `etag` and `size` of each uploaded segment, in order, as `segments` to join them into a single file. This
+    returns a 409 if a file with the same checksum is already in object storage.
+    """
+    authentication_classes = [SessionAuthentication, BasicAuthentication, TokenAuthentication]
+    permission_classes = [IsAuthenticatedOrReadOnly]
+
+    def post(self, request, checksum):
+        segments = request.data.get('segments')
+        if not isinstance(segments, list) or not segments or not all(
+                isinstance(segment, dict) and isinstance(segment.get('etag'), str)
+                and isinstance(segment.get('size'), int) for segment in segments):
+            raise BadQuery(detail='segments must be a list of the etag and size of each segment')
+        if existing_hashes([checksum]):
+            return Response(status=status.HTTP_409_CONFLICT)
+        try:
+            object_storage.create_manifest(checksum, [(segment['etag'], segment['size']) for segment in segments])
+        except requests.RequestException as ex:
+            raise StorageError(detail=str(ex))
+        return Response(status=status.HTTP_201_CREATED)
 
 
 class IssueViewSet(BaseViewSet, mixins.UpdateModelMixin):
@@ -281,8 +781,9 @@ class IssueViewSet(BaseViewSet, mixins.UpdateModelMixin):
     __doc__ = models.Issue.__doc__
 
     def create(self, request, *args, **kwargs):
-        if 'component_issues' not in request.data:
-            request.data['component_issues'] = []
+        for item in request.data if isinstance(request.data, list) else [request.data]:
+            if isinstance(item, dict) and 'component_issues' not in item:
+                item['component_issues'] = []
         return super().create(request, *args, **kwargs)
 
 
@@ -300,13 +801,76 @@ class CodeRunViewSet(BaseViewSet, mixins.UpdateModelMixin, mixins.DestroyModelMi
     __doc__ = models.CodeRun.__doc__
 
     def create(self, request, *args, **kwargs):
-        if 'prov_report' not in request.data:
-            request.data['prov_report'] = []
+        for item in request.data if isinstance(request.data, list) else [request.data]:
+            if isinstance(item, dict) and 'prov_report' not in item:
+                item['prov_report'] = []
         return super().create(request, *args, **kwargs)
 
+    def perform_created(self, instances):
+        schedule_prov_reports([code_run.id for code_run in instances])
+
+
+class ObjectComponentViewSet(BaseViewSet):
+    model = models.ObjectComponent
+    serializer_class = serializers.ObjectComponentSerializer
+    filterset_fields = models.ObjectComponent.FILTERSET_FIELDS
+    __doc__ = models.ObjectComponent.__doc__
+
+    @action(detail=True, methods=['get'])
+    def lineage(self, request, pk=None):
+        """
+        Return the ObjectComponents, CodeRuns and DataProducts that an ObjectComponent was derived from (the default,
+        or with direction=upstream) or that were derived from it (direction=downstream), optionally limited to those
+        within depth CodeRuns of it.
+        """
+        direction = request.query_params.get('direction', 'upstream')
+        if direction not in ('upstream', 'downstream'):
+            raise BadQuery(detail='direction must be one of [upstream, downstream]')
+        depth = request.query_params.get('depth')
+        if depth is not None:
+            try:
+                depth = int(depth)
+            except ValueError:
+                depth = 0
+            if depth < 1:
+                raise BadQuery(detail='depth must be a positive integer')
+        component = get_object_or_404(models.ObjectComponent.objects.only('id'), pk=pk)
+
+        if direction == 'upstream':
+            lineage = models.ComponentLineage.objects.filter(descendant=component)
+            related = 'ancestor_id'
+        else:
+            lineage = models.ComponentLineage.objects.filter(ancestor=component)
+            related = 'descendant_id'
+        if depth is not None:
+            lineage = lineage.filter(depth__lte=depth)
+        components = list(lineage.order_by('depth', related).values_list(related, 'depth'))
+
+        # The runs linking the component to the others are those which output (or take as input) the component or any
+        # of the others short of the depth limit
+        linked = [component.id] + [id for id, d in components if depth is None or d < depth]
+        if direction == 'upstream':
+            code_runs = models.CodeRun.objects.filter(outputs__in=linked)
+        else:
+            code_runs = models.CodeRun.objects.filter(inputs__in=linked)
+        code_runs = code_runs.distinct().order_by('id').values_list('id', flat=True)
+        data_products = models.DataProduct.objects.filter(
+            object__components__in=[id for id, _ in components]).distinct().order_by('id').values_list('id', flat=True)
+
+        return Response({
+            'direction': direction,
+            'depth': depth,
+            'components': [
+                {'url': reverse('objectcomponent-detail', args=[id], request=request), 'depth': d}
+                for id, d in components
+            ],
+            'code_runs': [reverse('coderun-detail', args=[id], request=request) for id in code_runs],
+            'data_products': [reverse('dataproduct-detail', args=[id], request=request) for id in data_products],
+        })
+
 
 for name, cls in models.all_models.items():
-    if name in ('Issue', 'DataProduct', 'CodeRun'):
+    if name in ('Issue', 'DataProduct', 'CodeRun', 'ObjectComponent'):
         continue
     data = {
         'model': cls,
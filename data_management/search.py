@@ -0,0 +1,255 @@
+import logging
+import re
+
+from django.db import DatabaseError, connection, connections, transaction
+from django.db.models.expressions import RawSQL
+
+from . import models
+
+logger = logging.getLogger(__name__)
+
+TERM = re.compile(r'[^\W_]+')
+FTS_TABLE = 'data_management_searchdocument_fts'
+
+
+def terms(text):
+    """
+    Split text into the lower case alphanumeric terms that are indexed and searched for.
+    """
+    return TERM.findall(text.lower())
+
+
+def _text(*values):
+    return ' '.join(' '.join(terms(str(value))) for value in values if value)
+
+
+def _keyphrases(obj):
+    return [keyword.keyphrase for keyword in obj.keywords.all()]
+
+
+def _data_product_documents(ids):
+    data_products = models.DataProduct.objects.filter(id__in=ids).select_related(
+        'namespace', 'object').prefetch_related('object__keywords')
+    for data_product in data_products:
+        title = '%s:%s' % (data_product.namespace.name, data_product.name)
+        yield data_product.id, title, _text(
+            data_product.namespace.name, data_product.name, data_product.version, data_product.object.description,
+            *_keyphrases(data_product.object))
+
+
+def _external_object_documents(ids):
+    external_objects = models.ExternalObject.objects.filter(id__in=ids).select_related(
+        'data_product__object').prefetch_related('data_product__object__keywords')
+    for external_object in external_objects:
+        yield external_object.id, external_object.title, _text(
+            external_object.title, external_object.identifier, external_object.alternate_identifier,
+            external_object.alternate_identifier_type, external_object.description, external_object.version,
+            *_keyphrases(external_object.data_product.object))
+
+
+def _code_repo_release_documents(ids):
+    code_repo_releases = models.CodeRepoRelease.objects.filter(id__in=ids).select_related(
+        'object').prefetch_related('object__keywords')
+    for code_repo_release in code_repo_releases:
+        yield code_repo_release.id, code_repo_release.name, _text(
+            code_repo_release.name, code_repo_release.version, code_repo_release.website,
+            code_repo_release.object.description, *_keyphrases(code_repo_release.object))
+
+
+DOCUMENTS = {
+    models.DataProduct: _data_product_documents,
+    models.ExternalObject: _external_object_documents,
+    models.CodeRepoRelease: _code_repo_release_documents,
+}
+
+
+def _document_model(model):
+    return model._meta.model_name
+
+
+def index(model, ids):
+    """
+    Create or replace the search documents for the objects of a searchable model with the given ids, removing the
+    documents of any which no longer exist.
+    """
+    ids = set(ids)
+    if not ids:
+        return
+    documents = [
+        models.SearchDocument(model=_document_model(model), object_id=object_id, title=title, body=body)
+        for object_id, title, body in DOCUMENTS[model](ids)
+    ]
+    models.SearchDocument.objects.filter(model=_document_model(model), object_id__in=ids).delete()
+    models.SearchDocument.objects.bulk_create(documents)
+
+
+def index_objects(object_ids):
+    """
+    Update the search documents which include details of the Objects with the given ids.
+    """
+    object_ids = set(object_ids)
+    if not object_ids:
+        return
+    index(models.DataProduct, models.DataProduct.objects.filter(
+        object_id__in=object_ids).values_list('id', flat=True))
+    index(models.ExternalObject, models.ExternalObject.objects.filter(
+        data_product__object_id__in=object_ids).values_list('id', flat=True))
+    index(models.CodeRepoRelease, models.CodeRepoRelease.objects.filter(
+        object_id__in=object_ids).values_list('id', flat=True))
+
+
+def rebuild():
+    """
+    Rebuild every search document.
+    """
+    models.SearchDocument.objects.all().delete()
+    for model in DOCUMENTS:
+        index(model, model.objects.values_list('id', flat=True))
+
+
+def searchable_saved(sender, instance, **kwargs):
+    index(sender, [instance.pk])
+
+
+def searchable_deleted(sender, instance, **kwargs):
+    models.SearchDocument.objects.filter(model=_document_model(sender), object_id=instance.pk).delete()
+
+
+def namespace_saved(sender, instance, created, **kwargs):
+    if not created:
+        index(models.DataProduct, instance.data_products.values_list('id', flat=True))
+
+
+def object_saved(sender, instance, created, **kwargs):
+    if not created:
+        index_objects([instance.pk])
+
+
+def keyword_changed(sender, instance, **kwargs):
+    index_objects([instance.object_id])
+
+
+def _has_fts_table():
+    """
+    Return whether the SQLite database has the FTS5 table, which is missing if SQLite was built without FTS5.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+        return cursor.fetchone() is not None
+
+
+def _match_sql(query_terms):
+    """
+    Return SQL selecting the id and rank of each search document matching all the terms, each as a prefix, or None
+    if the database has no full-text index.
+    """
+    table = models.SearchDocument._meta.db_table
+    if connection.vendor == 'postgresql':
+        vector = "to_tsvector('simple'::regconfig, COALESCE(body, ''))"
+        sql = (
+            "SELECT id, ts_rank(%s, query) AS rank FROM %s, to_tsquery('simple'::regconfig, %%s) query "
+            "WHERE %s @@ query" % (vector, table, vector)
+        )
+        return sql, [' & '.join('%s:*' % term for term in query_terms)]
+    elif connection.vendor == 'sqlite' and _has_fts_table():
+        # FTS5 ranks by bm25, where lower is better
+        sql = 'SELECT rowid AS id, -rank AS rank FROM %s WHERE %s MATCH %%s' % (FTS_TABLE, FTS_TABLE)
+        return sql, [' '.join('"%s"*' % term for term in query_terms)]
+    return None
+
+
+def documents(query, model=None):
+    """
+    Return a queryset of the search documents matching a query.
+
+    :param query: The text to search for. Every term in it must match the start of a term in a document
+    :param model: Only return the documents for this model
+    """
+    query_terms = terms(query)
+    queryset = models.SearchDocument.objects.all()
+    if model is not None:
+        queryset = queryset.filter(model=_document_model(model))
+    if not query_terms:
+        return queryset.none()
+    match = _match_sql(query_terms)
+    if match is None:
+        for term in query_terms:
+            queryset = queryset.filter(body__contains=term)
+        return queryset
+    sql, params = match
+    return queryset.filter(id__in=RawSQL('SELECT id FROM (%s) matches' % sql, params))
+
+
+def search(query, model_names=None, limit=20, offset=0):
+    """
+    Return the search documents matching a query, best match first.
+
+    :param query: The text to search for. Every term in it must match the start of a term in a document
+    :param model_names: Only return documents for models with these names
+    :param limit: The number of documents to return
+    :param offset: The number of documents to skip
+    :return: A list of SearchDocuments, each with a rank
+    """
+    query_terms = terms(query)
+    if not query_terms:
+        return []
+    match = _match_sql(query_terms)
+    if match is None:
+        queryset = documents(query)
+        if model_names:
+            queryset = queryset.filter(model__in=model_names)
+        results = list(queryset.order_by('id')[offset:offset + limit])
+        for document in results:
+            document.rank = None
+        return results
+    sql, params = match
+    where = ''
+    if model_names:
+        where = 'WHERE d.model IN (%s)' % ', '.join(['%s'] * len(model_names))
+        params = params + list(model_names)
+    return list(models.SearchDocument.objects.raw(
+        'SELECT d.*, m.rank FROM (%s) m JOIN %s d ON d.id = m.id %s ORDER BY m.rank DESC, d.id LIMIT %%s OFFSET %%s'
+        % (sql, models.SearchDocument._meta.db_table, where), params + [limit, offset]))
+
+
+def filter_queryset(queryset, query):
+    """
+    Filter a queryset of a searchable model to the objects matching a search query.
+    """
+    return queryset.filter(pk__in=documents(query, queryset.model).values('object_id'))
+
+
+def create_search_indexes(using='default', **kwargs):
+    """
+    Create the full-text index over the search documents: a GIN index over their text search vectors on PostgreSQL,
+    or an FTS5 table kept up to date by triggers on SQLite.
+    """
+    conn = connections[using]
+    table = models.SearchDocument._meta.db_table
+    try:
+        with transaction.atomic(using=using), conn.cursor() as cursor:
+            if conn.vendor == 'postgresql':
+                cursor.execute(
+                    "CREATE INDEX IF NOT EXISTS %s_body_tsv ON %s USING gin "
+                    "(to_tsvector('simple'::regconfig, COALESCE(body, '')))" % (table, table))
+            elif conn.vendor == 'sqlite':
+                exists = conn.introspection.table_names(cursor).count(FTS_TABLE)
+                cursor.execute(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS %s USING fts5(body, content='%s', content_rowid='id')"
+                    % (FTS_TABLE, table))
+                cursor.execute(
+                    'CREATE TRIGGER IF NOT EXISTS %s_ai AFTER INSERT ON %s BEGIN '
+                    'INSERT INTO %s(rowid, body) VALUES (new.id, new.body); END' % (FTS_TABLE, table, FTS_TABLE))
+                cursor.execute(
+                    'CREATE TRIGGER IF NOT EXISTS %s_ad AFTER DELETE ON %s BEGIN '
+                    "INSERT INTO %s(%s, rowid, body) VALUES ('delete', old.id, old.body); END"
+                    % (FTS_TABLE, table, FTS_TABLE, FTS_TABLE))
+                cursor.execute(
+                    'CREATE TRIGGER IF NOT EXISTS %s_au AFTER UPDATE ON %s BEGIN '
+                    "INSERT INTO %s(%s, rowid, body) VALUES ('delete', old.id, old.body); "
+                    'INSERT INTO %s(rowid, body) VALUES (new.id, new.body); END'
+                    % (FTS_TABLE, table, FTS_TABLE, FTS_TABLE, FTS_TABLE))
+                if not exists:
+                    cursor.execute("INSERT INTO %s(%s) VALUES ('rebuild')" % (FTS_TABLE, FTS_TABLE))
+    except DatabaseError as ex:
+        logger.warning('Could not create the full-text search index: %s', ex)
@@ -0,0 +1,474 @@
+"""
+Snapshots of the whole registry, for moving it between deployments.
+
+A snapshot is a gzipped stream of JSON lines. The first line describes the archive and each model in all_models
+follows, parents before children, as a line naming the model and its fields and then one array of field values per
+object. The rows of the many-to-many relations come after the models and a final line holds the number of rows written,
+so that a truncated archive is detected. Users are written by username. A snapshot can also hold only the objects
+updated since a given time, with the objects they refer to, for pushing the changes to a registry to another. The
+objects included only because they are referred to are listed in their model's line.
+
+Objects are identified by their uuid where the model has one, and otherwise by the unique fields or constraint which
+identify them, so importing a snapshot into a registry which already holds some of its objects updates them to match
+rather than creating copies, leaving those included only as references as they are. Every other object is inserted in
+batches and given a primary key by the database, with the foreign keys and relations pointing to it remapped to match.
+Objects and links which are not in the snapshot are never removed.
+"""
+import datetime
+import gzip
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.db.models import Q
+
+from . import caching, lineage, models, search
+
+FORMAT = 'data-registry-snapshot'
+VERSION = 1
+BATCH_SIZE = 1000
+
+
+class SnapshotError(Exception):
+    """
+    Raised when a snapshot cannot be read.
+    """
+
+
+def dependency_order():
+    """
+    Return the models in all_models ordered so that every model comes after the models its foreign keys and
+    many-to-many fields point to.
+    """
+    ordered = []
+
+    def visit(model, path):
+        if model in ordered:
+            return
+        if model in path:
+            raise ValueError('Relations of %s form a cycle' % model.__name__)
+        for field in list(model._meta.concrete_fields) + model._meta.local_many_to_many:
+            if field.is_relation and field.related_model in models.all_models.values():
+                visit(field.related_model, path + [model])
+        ordered.append(model)
+
+    for model in models.all_models.values():
+        visit(model, [])
+    return ordered
+
+
+def _fields(model):
+    """
+    Return the fields of a model held in a snapshot. The sort keys are derived from other fields and the time of the
+    last update is that of the import, so neither is included.
+    """
+    return [
+        field for field in model._meta.concrete_fields
+        if not isinstance(field, models.SortKeyField) and field.name != 'last_updated'
+    ]
+
+
+def _is_user(field):
+    return field.is_relation and field.related_model is get_user_model()
+
+
+def _identity(model):
+    """
+    Return the names of the fields identifying the objects of a model across registries, or None if there are none.
+    Only fields which cannot be NULL can identify an object, as NULLs never compare equal.
+    """
+    if model.IDENTITY_FIELDS:
+        return model.IDENTITY_FIELDS
+    candidates = [(field.name,) for field in model._meta.concrete_fields if field.name == 'uuid']
+    candidates.extend((field.name,) for field in model._meta.concrete_fields if field.unique and not field.primary_key)
+    candidates.extend(tuple(constraint.fields) for constraint in model._meta.constraints
+                      if getattr(constraint, 'fields', None) and getattr(constraint, 'condition', None) is None)
+    for names in candidates:
+        if not any(model._meta.get_field(name).null for name in names):
+            return names
+    return None
+
+
+def _write(stream, record):
+    stream.write(json.dumps(record, cls=DjangoJSONEncoder, separators=(',', ':')))
+    stream.write('\n')
+
+
+def _chunks(ids):
+    ids = sorted(ids)
+    for start in range(0, len(ids), BATCH_SIZE):
+        yield ids[start:start + BATCH_SIZE]
+
+
+def _values(queryset, column, ids):
+    """
+    Return the values of a column of the rows of a queryset whose primary keys are among the given ids.
+    """
+    values = set()
+    for chunk in _chunks(ids):
+        values.update(queryset.filter(pk__in=chunk).exclude(**{column: None}).values_list(column, flat=True))
+    return values
+
+
+def _updated_since(order, since):
+    """
+    Return the primary keys of the objects of each model updated after the given time, along with those of every object
+    they refer to, directly or indirectly, so that the objects can be matched to or created in another registry, and
+    the primary keys of those updated.
+    """
+    updated = {model: set(model.objects.filter(last_updated__gt=since).values_list('pk', flat=True)) for model in order}
+    keys = {model: set(pks) for model, pks in updated.items()}
+    for model in reversed(order):
+        if not keys[model]:
+            continue
+        for field in model._meta.concrete_fields:
+            if field.is_relation and field.related_model in keys:
+                keys[field.related_model].update(_values(model.objects.all(), field.attname, keys[model]))
+        for field in model._meta.local_many_to_many:
+            if field.related_model in keys:
+                through = field.remote_field.through.objects.all()
+                for chunk in _chunks(keys[model]):
+                    keys[field.related_model].update(through.filter(
+                        **{field.m2m_column_name() + '__in': chunk}).values_list(field.m2m_reverse_name(), flat=True))
+    return keys, updated
+
+
+def _select(queryset, column, keys):
+    """
+    Yield the rows of a queryset, in order of the given column, restricted to those with the column among the given
+    keys unless they are None.
+    """
+    queryset = queryset.order_by(column)
+    if keys is None:
+        yield from queryset.iterator(chunk_size=BATCH_SIZE)
+        return
+    for chunk in _chunks(keys):
+        yield from queryset.filter(**{column + '__in': chunk})
+
+
+def export(fileobj, since=None, only=None):
+    """
+    Write a snapshot of the registry.
+
+    :param fileobj: The binary file to write the snapshot to
+    :param since: If given, only write the objects updated after this time and the objects they refer to
+    :param only: The models to write, or None to write every model
+    :return: A dictionary of the number of rows written for each model and relation
+    """
+    counts = {}
+    outermost = not connection.in_atomic_block
+    with gzip.open(fileobj, 'wt', encoding='utf-8') as stream, transaction.atomic():
+        if connection.vendor == 'postgresql' and outermost:
+            # Read every table as of the same moment, so that no row refers to one written after its table was read
+            with connection.cursor() as cursor:
+                cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY')
+        order = [model for model in dependency_order() if only is None or model in only]
+        selected, updated = _updated_since(order, since) if since is not None else (None, None)
+        _write(stream, {
+            'format': FORMAT, 'version': VERSION, 'created': datetime.datetime.now(datetime.timezone.utc),
+            'since': since,
+        })
+        for model in order:
+            fields = _fields(model)
+            section = {'model': model.__name__, 'fields': [field.name for field in fields]}
+            if selected is not None:
+                section['references'] = sorted(selected[model] - updated[model])
+            _write(stream, section)
+            columns = [field.name + '__username' if _is_user(field) else field.attname for field in fields]
+            count = 0
+            for row in _select(model.objects.values_list(*columns), 'pk', selected and selected[model]):
+                _write(stream, row)
+                count += 1
+            counts[model.__name__] = count
+        for model in order:
+            for field in model._meta.local_many_to_many:
+                if field.related_model not in order:
+                    continue
+                name = '%s.%s' % (model.__name__, field.name)
+                _write(stream, {'relation': name})
+                rows = field.remote_field.through.objects.values_list(
+                    field.m2m_column_name(), field.m2m_reverse_name())
+                count = 0
+                for row in _select(rows, field.m2m_column_name(), selected and selected[model]):
+                    _write(stream, row)
+                    count += 1
+                counts[name] = count
+        _write(stream, {'end': counts})
+    return counts
+
+
+class _Importer:
+    """
+    The state of an import: the primary keys each object in the snapshot has been given, keyed by model and primary
+    key in the snapshot, the users found or created for each username, unless every object is attributed to the user
+    importing them, and the objects created or updated and CodeRuns linked to components, whose search documents and
+    lineage need updating.
+    """
+
+    def __init__(self, user=None):
+        self.keys = {}
+        self.users = {}
+        self.counts = {}
+        self.changed = {}
+        self.linked_code_runs = set()
+        self.importing_user = user
+
+    def user(self, username):
+        if username is None:
+            return None
+        if self.importing_user is not None:
+            return self.importing_user.pk
+        if username not in self.users:
+            user, created = get_user_model().objects.get_or_create(username=username)
+            if created:
+                user.set_unusable_password()
+                user.save()
+            self.users[username] = user.pk
+        return self.users[username]
+
+    def remap(self, field, value):
+        if value is None:
+            return None
+        if _is_user(field):
+            return self.user(value)
+        try:
+            return self.keys[field.related_model][value]
+        except KeyError:
+            raise SnapshotError('%s %s refers to %s %s, which is not in the snapshot' % (
+                field.model.__name__, field.name, field.related_model.__name__, value))
+
+    @staticmethod
+    def existing(model, attnames, objects):
+        """
+        Return the objects already in the registry with the same identity as the given objects, keyed by the values of
+        the identifying fields.
+        """
+        if not attnames:
+            return {}
+        values = {tuple(getattr(obj, attname) for attname in attnames) for obj in objects}
+        if len(attnames) == 1:
+            query = Q(**{attnames[0] + '__in': [value[0] for value in values]})
+        else:
+            query = Q()
+            for value in values:
+                query |= Q(**dict(zip(attnames, value)))
+        return {tuple(getattr(obj, attname) for attname in attnames): obj for obj in model.objects.filter(query)}
+
+    @staticmethod
+    def create(model, objects):
+        """
+        Insert new objects, letting the database assign their primary keys.
+        """
+        if connection.features.can_return_rows_from_bulk_insert:
+            model.objects.bulk_create(objects, batch_size=BATCH_SIZE)
+            return
+        # Without RETURNING the database can only give the primary key of a single inserted row, so insert them one at
+        # a time, as Model.save does but without sending signals
+        fields = [field for field in model._meta.local_concrete_fields if field is not model._meta.auto_field]
+        for obj in objects:
+            (obj.pk,) = model._base_manager._insert(
+                [obj], fields=fields, returning_fields=model._meta.db_returning_fields)[0]
+
+    @staticmethod
+    def update(model, objects):
+        """
+        Save changes to existing objects, filling in the time of the update and the sort keys as a save would.
+        """
+        fields = [field for field in model._meta.concrete_fields if not field.primary_key]
+        for obj in objects:
+            for field in fields:
+                field.pre_save(obj, False)
+        model.objects.bulk_update(objects, [field.name for field in fields], batch_size=BATCH_SIZE)
+
+    def insert(self, model, fields, rows, references=()):
+        """
+        Insert a batch of objects from the snapshot, updating those which already exist where they differ unless they
+        are only included as references.
+        """
+        identity = _identity(model) or ()
+        attnames = [model._meta.get_field(name).attname for name in identity]
+        objects = []
+        for row in rows:
+            values = {}
+            for field, value in zip(fields, row):
+                if field.is_relation:
+                    values[field.attname] = self.remap(field, value)
+                elif value is not None:
+                    values[field.attname] = field.to_python(value)
+                else:
+                    values[field.attname] = None
+            objects.append(model(**values))
+
+        keys = self.keys.setdefault(model, {})
+        existing = self.existing(model, attnames, objects)
+        # The user who last updated an object is not compared, so that importing a snapshot as another user only
+        # updates the objects which differ
+        compared = [field for field in fields if not field.primary_key and not _is_user(field)]
+        created = []
+        created_pks = []
+        updated = []
+        for obj in objects:
+            current = existing.get(tuple(getattr(obj, attname) for attname in attnames))
+            if current is None:
+                created_pks.append(obj.pk)
+                obj.pk = None
+                created.append(obj)
+                continue
+            keys[obj.pk] = current.pk
+            if obj.pk in references or all(
+                    getattr(current, field.attname) == getattr(obj, field.attname) for field in compared):
+                continue
+            for field in fields:
+                if not field.primary_key:
+                    setattr(current, field.attname, getattr(obj, field.attname))
+            updated.append(current)
+
+        self.create(model, created)
+        keys.update(zip(created_pks, (obj.pk for obj in created)))
+        self.update(model, updated)
+        self.changed.setdefault(model, set()).update(obj.pk for obj in created + updated)
+        self.counts[model.__name__] = self.counts.get(model.__name__, 0) + len(created) + len(updated)
+
+    def relate(self, field, rows):
+        through = field.remote_field.through
+        source, target = field.model, field.related_model
+        links = []
+        for source_pk, target_pk in rows:
+            try:
+                links.append(through(**{
+                    field.m2m_column_name(): self.keys[source][source_pk],
+                    field.m2m_reverse_name(): self.keys[target][target_pk],
+                }))
+            except KeyError:
+                raise SnapshotError('%s.%s links objects which are not in the snapshot' % (
+                    source.__name__, field.name))
+        through.objects.bulk_create(links, batch_size=BATCH_SIZE, ignore_conflicts=True)
+        if through in (models.CodeRun.inputs.through, models.CodeRun.outputs.through):
+            self.linked_code_runs.update(getattr(link, field.m2m_column_name()) for link in links)
+        name = '%s.%s' % (source.__name__, field.name)
+        self.counts[name] = self.counts.get(name, 0) + len(links)
+
+    def update_indexes(self):
+        """
+        Update the search documents of the objects created or updated, and of those showing details of them, and add
+        the lineage of the CodeRuns linked to components.
+        """
+        changed_objects = set(self.changed.get(models.Object, ()))
+        for chunk in _chunks(self.changed.get(models.Keyword, ())):
+            changed_objects.update(models.Keyword.objects.filter(pk__in=chunk).values_list('object_id', flat=True))
+        for model in search.DOCUMENTS:
+            for chunk in _chunks(self.changed.get(model, ())):
+                search.index(model, chunk)
+        for chunk in _chunks(self.changed.get(models.Namespace, ())):
+            search.index(models.DataProduct, models.DataProduct.objects.filter(
+                namespace_id__in=chunk).values_list('id', flat=True))
+        for chunk in _chunks(changed_objects):
+            search.index_objects(chunk)
+
+        for chunk in _chunks(self.linked_code_runs):
+            components = {code_run: (set(), set()) for code_run in chunk}
+            for index, through in enumerate((models.CodeRun.inputs.through, models.CodeRun.outputs.through)):
+                for code_run, component in through.objects.filter(coderun_id__in=chunk).values_list(
+                        'coderun_id', 'objectcomponent_id'):
+                    components[code_run][index].add(component)
+            for inputs, outputs in components.values():
+                lineage.link(inputs, outputs)
+
+
+def _records(stream):
+    for number, line in enumerate(stream, 1):
+        try:
+            yield json.loads(line)
+        except ValueError:
+            raise SnapshotError('Line %d of the snapshot is not valid JSON' % number)
+
+
+def _read_header(records):
+    header = next(records, None)
+    if not isinstance(header, dict) or header.get('format') != FORMAT:
+        raise SnapshotError('Not a registry snapshot')
+    if header.get('version') != VERSION:
+        raise SnapshotError('Snapshot version %s is not supported, expected version %d' % (
+            header.get('version'), VERSION))
+
+
+def _section(record):
+    """
+    Return the model and its fields, or the many-to-many field, which the rows following a section line belong to.
+    """
+    by_name = {model.__name__: model for model in models.all_models.values()}
+    if 'model' in record:
+        model = by_name.get(record['model'])
+        if model is None:
+            raise SnapshotError('Unknown model %s' % record['model'])
+        names = {field.name: field for field in _fields(model)}
+        unknown = [name for name in record['fields'] if name not in names]
+        if unknown:
+            raise SnapshotError('Unknown fields of %s: %s' % (model.__name__, ', '.join(unknown)))
+        return model, [names[name] for name in record['fields']]
+    model_name, _, field_name = record['relation'].partition('.')
+    model = by_name.get(model_name)
+    try:
+        field = model._meta.get_field(field_name)
+    except (AttributeError, LookupError):
+        field = None
+    if field is None or not field.many_to_many:
+        raise SnapshotError('Unknown relation %s' % record['relation'])
+    return field, None
+
+
+def import_(fileobj, user=None):
+    """
+    Load a snapshot into the registry, in a single transaction, updating the search documents and lineage of the
+    objects it creates or updates.
+
+    :param fileobj: The binary file to read the snapshot from
+    :param user: The user to attribute the objects to, or None to use the users named in the snapshot
+    :return: A dictionary of the number of objects created or updated for each model and links read for each relation
+    """
+    importer = _Importer(user)
+    written = {}
+    with gzip.open(fileobj, 'rt', encoding='utf-8') as stream, transaction.atomic():
+        records = _records(stream)
+        section, name, fields, references, rows, end = None, None, None, None, [], None
+
+        def flush():
+            if fields is not None:
+                importer.insert(section, fields, rows, references)
+            elif section is not None:
+                importer.relate(section, rows)
+            rows.clear()
+
+        try:
+            _read_header(records)
+            for record in records:
+                if isinstance(record, list):
+                    if section is None:
+                        raise SnapshotError('Row before the first model in the snapshot')
+                    rows.append(record)
+                    written[name] += 1
+                    if len(rows) >= BATCH_SIZE:
+                        flush()
+                    continue
+                flush()
+                if 'end' in record:
+                    end = record['end']
+                    break
+                section, fields = _section(record)
+                name = record.get('model') or record['relation']
+                written[name] = 0
+                importer.counts[name] = 0
+                references = set(record.get('references', ()))
+        except (AttributeError, KeyError, TypeError, ValueError) as exc:
+            raise SnapshotError('Invalid snapshot: %s' % exc)
+        except (EOFError, OSError) as exc:
+            raise SnapshotError('Unreadable snapshot: %s' % exc)
+        if end != written:
+            raise SnapshotError('The snapshot is incomplete')
+
+        importer.update_indexes()
+
+    for model in dependency_order():
+        caching.bump_generation(model)
+    return importer.counts
@@ -1,106 +1,300 @@
-from django.core.paginator import Paginator
-from django.db.models import Q
-from django.http import JsonResponse
+import functools
 
-from . import models
+from django.core import signing
+from django.core.exceptions import ValidationError
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.http import Http404, JsonResponse
+from django.urls import reverse
+from django.utils.html import format_html
 
+from . import models, search as full_text
+from .rest.pagination import cached_count
 
-def data_product_table_data(request):
-    size = int(request.GET.get('limit', 25))
-    offset = int(request.GET.get('offset', 25))
-    search = request.GET.get('search', None)
-    sort = request.GET.get('sort', '') or 'name'
-    order = request.GET.get('order', '') or 'asc'
-    sign = '-' if order == 'desc' else ''
-    all_objects = models.DataProduct.objects.all().order_by(sign + sort)
-    if search:
-        filtered_objects = all_objects.filter(
-            Q(namespace__name__icontains=search) |
-            Q(name__icontains=search) |
-            Q(version__icontains=search)
-        )
+VERSION_KEYS = ('version_major', 'version_minor', 'version_patch', 'version_prerelease')
+
+# The orderings each table can be sorted by, keyed by column. Each is backed by an index, apart from those following a
+# foreign key, and ends with a unique field so that every row has a distinct position to continue from.
+DATA_PRODUCT_SORTS = {
+    'namespace': ('namespace__name', 'name') + VERSION_KEYS + ('id',),
+    'name': ('name', 'id'),
+}
+
+EXTERNAL_OBJECT_SORTS = {
+    'identifier': ('identifier', 'alternate_identifier', 'alternate_identifier_type', 'title', 'version', 'id'),
+    'alternate_identifier': ('alternate_identifier', 'id'),
+    'release_date': ('release_date', 'id'),
+    'title': ('title', 'id'),
+}
+
+CODE_REPO_RELEASE_SORTS = {
+    'name': ('name',) + VERSION_KEYS + ('id',),
+}
+
+MODEL_SORTS = {
+    'last_updated': ('last_updated', 'id'),
+    'id': ('id',),
+}
+
+TOKEN_SALT = 'data_management.tables'
+
+DEFAULT_PAGE_SIZE = 25
+MAX_PAGE_SIZE = 100
+
+
+class _SortField:
+    """
+    A field to order a table by, named by a lookup which may follow foreign keys, such as namespace__name, or by an
+    annotation of the queryset.
+    """
+
+    def __init__(self, queryset, name):
+        self.name = name
+        self.path = []
+        annotation = queryset.query.annotations.get(name)
+        if annotation is not None:
+            self.field = annotation.output_field
+            self.null = self.field.null
+            return
+        model = queryset.model
+        for part in name.split('__'):
+            field = model._meta.get_field(part)
+            self.path.append(field)
+            model = field.related_model
+        self.field = self.path[-1]
+        self.null = any(field.null for field in self.path)
+
+    def _owner(self, obj):
+        for field in self.path[:-1]:
+            obj = getattr(obj, field.name) if obj is not None else None
+        return obj
+
+    def value_from_object(self, obj):
+        if not self.path:
+            return getattr(obj, self.name)
+        owner = self._owner(obj)
+        return None if owner is None else self.field.value_from_object(owner)
+
+    def value_to_string(self, obj):
+        if not self.path:
+            return str(getattr(obj, self.name))
+        return self.field.value_to_string(self._owner(obj))
+
+    def to_python(self, value):
+        return self.field.to_python(value)
+
+
+def _order_by(field, descending):
+    """
+    Return the ordering expression for a field. NULLs are placed as if they were greater than any other value, which
+    is how PostgreSQL orders an index.
+    """
+    if descending:
+        return F(field.name).desc(nulls_first=True) if field.null else F(field.name).desc()
+    return F(field.name).asc(nulls_last=True) if field.null else F(field.name).asc()
+
+
+def _after(fields, values, descending):
+    """
+    Return a Q selecting the rows which come after the row with the given values in the ordering, or None if no row
+    can. The leading field is also bounded on its own so that the database can start from it in the index.
+    """
+    field, value = fields[0], values[0]
+    if value is None:
+        after = Q(**{field.name + '__isnull': False}) if descending else None
+        equal = Q(**{field.name + '__isnull': True})
     else:
-        filtered_objects = all_objects
-    paginator = Paginator(filtered_objects, size)
-    page = (offset / size) + 1
-    page_objects = paginator.get_page(page)
-    return JsonResponse({
-        'total': filtered_objects.count(),
-        'totalNotFiltered': all_objects.count(),
-        'rows': [
-            {
-                'namespace': str(obj.namespace),
-                'name': '<a href="/data_product/%d">%s</a>' % (obj.object.id, obj.name),
-                'version': obj.version,
-            } for obj in page_objects
-        ],
-    })
+        after = Q(**{field.name + ('__lt' if descending else '__gt'): value})
+        if field.null and not descending:
+            after |= Q(**{field.name + '__isnull': True})
+        equal = Q(**{field.name: value})
+    if len(fields) > 1:
+        rest = _after(fields[1:], values[1:], descending)
+        if rest is not None:
+            after = equal & rest if after is None else after | (equal & rest)
+    if after is not None and value is not None:
+        bound = Q(**{field.name + ('__lte' if descending else '__gte'): value})
+        if field.null and not descending:
+            bound |= Q(**{field.name + '__isnull': True})
+        after = bound & after
+    return after
 
 
-def external_objects_table_data(request):
-    size = int(request.GET.get('limit', 25))
-    offset = int(request.GET.get('offset', 25))
-    search = request.GET.get('search', None)
-    sort = request.GET.get('sort', '') or 'identifier'
-    order = request.GET.get('order', '') or 'asc'
-    sign = '-' if order == 'desc' else ''
-    all_objects = models.ExternalObject.objects.all().order_by(sign + sort)
-    if search:
-        filtered_objects = all_objects.filter(
-            Q(source__name__icontains=search) |
-            Q(alternate_identifier__icontains=search) |
-            Q(identifier__icontains=search) |
-            Q(release_date__icontains=search) |
-            Q(title__icontains=search) |
-            Q(version__icontains=search)
-        )
+def _read_token(token, fields, context):
+    """
+    Return the values of the row a continuation token continues from, or None if the token is not valid for this
+    ordering and search.
+    """
+    try:
+        payload = signing.loads(token, salt=TOKEN_SALT)
+        if payload['context'] != context or len(payload['values']) != len(fields):
+            return None
+        return [None if value is None else field.to_python(value) for field, value in zip(fields, payload['values'])]
+    except (signing.BadSignature, ValidationError, KeyError, TypeError, ValueError):
+        return None
+
+
+def _make_token(obj, fields, context):
+    values = [None if field.value_from_object(obj) is None else field.value_to_string(obj) for field in fields]
+    return signing.dumps({'context': context, 'values': values}, salt=TOKEN_SALT, compress=True)
+
+
+def table_data(request, queryset, sorts, default_sort, row, search=full_text.filter_queryset, load=None):
+    """
+    Return a page of a bootstrap-table server side table.
+
+    A page can be requested either by offset or, much more cheaply for later pages, with the `after` continuation
+    token returned in `next` by the previous page, which is used to seek to the page through the index of the
+    ordering. Only the orderings in `sorts` are allowed, any other sort uses the default. Pages hold at most
+    MAX_PAGE_SIZE rows.
+
+    :param request: The request, with the bootstrap-table query parameters
+    :param queryset: The objects in the table
+    :param sorts: A dictionary of the fields to order by for each column that the table can be sorted by
+    :param default_sort: The column to sort by if the requested column cannot be sorted by
+    :param row: A function returning the row of the table for an object
+    :param search: A function filtering the objects to those matching the search text
+    :param load: A function given the list of objects on the page, loading anything more their rows need
+    :return: The JsonResponse holding the page
+    """
+    try:
+        size = int(request.GET.get('limit', DEFAULT_PAGE_SIZE))
+        offset = int(request.GET.get('offset', 0))
+    except ValueError:
+        return JsonResponse({'error': 'limit and offset must be integers'}, status=400)
+    if size < 1 or offset < 0:
+        return JsonResponse({'error': 'limit must be positive and offset must not be negative'}, status=400)
+    size = min(size, MAX_PAGE_SIZE)
+    query = request.GET.get('search', '')
+    sort = request.GET.get('sort', '')
+    if sort not in sorts:
+        sort = default_sort
+    descending = request.GET.get('order', '') == 'desc'
+    fields = [_SortField(queryset, name) for name in sorts[sort]]
+    context = [sort, descending, query]
+
+    all_objects = queryset.order_by(*(_order_by(field, descending) for field in fields))
+    filtered_objects = search(all_objects, query) if query else all_objects
+    page_objects = filtered_objects
+    values = _read_token(request.GET['after'], fields, context) if request.GET.get('after') else None
+    if values is not None:
+        after = _after(fields, values, descending)
+        page_objects = page_objects.filter(after) if after is not None else page_objects.none()
+        page_objects = page_objects[:size]
     else:
-        filtered_objects = all_objects
-    paginator = Paginator(filtered_objects, size)
-    page = (offset / size) + 1
-    page_objects = paginator.get_page(page)
+        page_objects = page_objects[offset:offset + size]
+    page_objects = list(page_objects)
+    if load is not None and page_objects:
+        load(page_objects)
+
+    table = request.path
     return JsonResponse({
-        'total': filtered_objects.count(),
-        'totalNotFiltered': all_objects.count(),
-        'rows': [
-            {
-                'identifier': obj.identifier,
-                'alternate_identifier': '<a href="/external_object/%d">%s</a>' % (obj.data_product.id, obj.alternate_identifier),
-                'release_date': str(obj.release_date),
-                'title': obj.title,
-                'version': obj.data_product.version,
-            } for obj in page_objects
-        ],
+        'total': cached_count(filtered_objects, '%s?search=%s' % (table, query)),
+        'totalNotFiltered': cached_count(all_objects, table),
+        'rows': [row(obj) for obj in page_objects],
+        'next': _make_token(page_objects[-1], fields, context) if len(page_objects) == size else None,
     })
 
 
+def data_product_table_data(request):
+    return table_data(
+        request, models.DataProduct.objects.select_related('namespace', 'object'), DATA_PRODUCT_SORTS, 'name',
+        lambda obj: {
+            'namespace': str(obj.namespace),
+            'name': '<a href="/data_product/%d">%s</a>' % (obj.object.id, obj.name),
+            'version': obj.version,
+        })
+
+
+def external_objects_table_data(request):
+    return table_data(
+        request, models.ExternalObject.objects.select_related('data_product'), EXTERNAL_OBJECT_SORTS, 'identifier',
+        lambda obj: {
+            'identifier': obj.identifier,
+            'alternate_identifier': '<a href="/external_object/%d">%s</a>' % (
+                obj.data_product.id, obj.alternate_identifier),
+            'release_date': str(obj.release_date),
+            'title': obj.title,
+            'version': obj.data_product.version,
+        })
+
+
 def code_repo_release_table_data(request):
-    size = int(request.GET.get('limit', 25))
-    offset = int(request.GET.get('offset', 25))
-    search = request.GET.get('search', None)
-    sort = request.GET.get('sort', '') or 'name'
-    order = request.GET.get('order', '') or 'asc'
-    sign = '-' if order == 'desc' else ''
-    all_objects = models.CodeRepoRelease.objects.all().order_by(sign + sort)
-    if search:
-        filtered_objects = all_objects.filter(
-            Q(name__icontains=search) |
-            Q(version__icontains=search) |
-            Q(website__icontains=search)
-        )
-    else:
-        filtered_objects = all_objects
-    paginator = Paginator(filtered_objects, size)
-    page = (offset / size) + 1
-    page_objects = paginator.get_page(page)
-    return JsonResponse({
-        'total': filtered_objects.count(),
-        'totalNotFiltered': all_objects.count(),
-        'rows': [
-            {
-                'name': '<a href="/object/%d">%s</a>' % (obj.object.id, obj.name),
-                'version': obj.version,
-                'website': obj.website,
-            } for obj in page_objects
-        ],
-    })
+    return table_data(
+        request, models.CodeRepoRelease.objects.select_related('object'), CODE_REPO_RELEASE_SORTS, 'name',
+        lambda obj: {
+            'name': '<a href="/object/%d">%s</a>' % (obj.object.id, obj.name),
+            'version': obj.version,
+            'website': obj.website,
+        })
+
+
+def has_issue_count(model):
+    """
+    Return whether the objects of a model have issues attached, to be counted in the model's table.
+    """
+    return any(field.name == 'issues' and field.many_to_many for field in model._meta.get_fields())
+
+
+def is_searchable(model):
+    """
+    Return whether the table of a model can be searched, using the full-text index or the model's NameFields.
+    """
+    return model in full_text.DOCUMENTS or any(isinstance(field, models.NameField) for field in model._meta.fields)
+
+
+def _search(queryset, search):
+    model = queryset.model
+    if model in full_text.DOCUMENTS:
+        return full_text.filter_queryset(queryset, search)
+    query = Q()
+    for field in model._meta.fields:
+        if isinstance(field, models.NameField):
+            query |= Q(**{field.name + '__icontains': search})
+    return queryset.filter(query) if query else queryset
+
+
+def _count_issues(links, source, objects):
+    """
+    Set the issue_count of each of the objects, counting the issues of them all in one query.
+    """
+    counts = dict(links.filter(**{source + '__in': [obj.pk for obj in objects]}).values_list(source).annotate(
+        count=Count('*')))
+    for obj in objects:
+        obj.issue_count = counts.get(obj.pk, 0)
+
+
+def model_table_data(request, model_name):
+    """
+    Return a page of the table of any model, for the generated list views.
+
+    The objects are loaded along with the relations used to name them and, where they have issues, the issues of the
+    objects on the page are counted in one more query. Such tables can also be sorted by the number of issues, which
+    unlike the other sorts is not backed by an index and so counts the issues of every object.
+    """
+    model = next((cls for cls in models.all_models.values() if cls._meta.model_name == model_name), None)
+    if model is None:
+        raise Http404('No table for %s' % model_name)
+    queryset = model.objects.select_related(*model.TABLE_RELATED_FIELDS)
+    sorts = MODEL_SORTS
+    load = None
+    if has_issue_count(model):
+        field = model._meta.get_field('issues')
+        source = field.m2m_field_name()
+        links = field.remote_field.through.objects.order_by()
+        sorts = dict(MODEL_SORTS, issue_count=('issue_count', 'id'))
+        if request.GET.get('sort') == 'issue_count':
+            issue_counts = links.filter(**{source: OuterRef('pk')}).values(source).annotate(
+                count=Count('*')).values('count')
+            queryset = queryset.annotate(issue_count=Coalesce(Subquery(issue_counts), 0))
+        else:
+            load = functools.partial(_count_issues, links, source)
+
+    def row(obj):
+        return {
+            'name': format_html('<a href="{}">{}</a>', reverse(obj.reverse_name(), args=[obj.id]), str(obj)),
+            'last_updated': str(obj.last_updated),
+            'issue_count': getattr(obj, 'issue_count', None),
+        }
+
+    return table_data(request, queryset, sorts, 'last_updated', row, search=_search, load=load)
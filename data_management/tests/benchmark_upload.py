@@ -0,0 +1,56 @@
+"""
+Compare the throughput of uploading a file with a single PUT and with parallel segmented uploads, using the local Swift
+stand-in. Run with python -m data_management.tests.benchmark_upload.
+"""
+from concurrent import futures
+from unittest import mock
+import argparse
+import os
+import time
+
+import requests
+
+from data_management import object_storage
+from data_management.tests.swift import SwiftServer
+
+MB = 1024 ** 2
+
+
+def report(name, size, seconds):
+    print('%s: %.1f MB in %.2fs (%.1f MB/s)' % (name, size / MB, seconds, size / MB / seconds))
+
+
+def benchmark(size, segment_size, streams):
+    data = os.urandom(size * MB)
+    segment_size = segment_size * MB
+    with SwiftServer() as swift, mock.patch('data_management.settings.CONFIG', swift.config()):
+        start = time.perf_counter()
+        requests.put(object_storage.create_url('single', 'PUT'), data=data).raise_for_status()
+        report('Single PUT', len(data), time.perf_counter() - start)
+
+        start = time.perf_counter()
+        urls = object_storage.create_segment_urls('segmented', len(data), segment_size)
+
+        def put(index):
+            segment = data[index * segment_size:(index + 1) * segment_size]
+            response = requests.put(urls[index], data=segment)
+            response.raise_for_status()
+            return response.headers['Etag'], len(segment)
+
+        with futures.ThreadPoolExecutor(max_workers=streams) as executor:
+            segments = list(executor.map(put, range(len(urls))))
+        object_storage.create_manifest('segmented', segments)
+        report('%d segments over %d streams' % (len(urls), streams), len(data), time.perf_counter() - start)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size', type=int, default=256, help='Size of the file to upload in MB')
+    parser.add_argument('--segment-size', type=int, default=16, help='Size of each segment in MB')
+    parser.add_argument('--streams', type=int, default=8, help='Number of segments to upload at once')
+    opts = parser.parse_args(args)
+    benchmark(opts.size, opts.segment_size, opts.streams)
+
+
+if __name__ == '__main__':
+    main()
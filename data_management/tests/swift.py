@@ -0,0 +1,115 @@
+"""
+A minimal stand-in for an OpenStack Swift object store, supporting the temporary URLs created by object_storage and
+static large object manifests, for use in tests and benchmarks.
+"""
+from hashlib import md5, sha1
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+import configparser
+import hmac
+import json
+import threading
+import time
+
+
+class SwiftHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def _authorise(self, method):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        try:
+            sig = query['temp_url_sig'][0]
+            expires = int(query['temp_url_expires'][0])
+        except (KeyError, ValueError):
+            return None, None
+        body = '%s\n%s\n%s' % (method, expires, url.path)
+        expected = hmac.new(self.server.key.encode('utf-8'), body.encode('utf-8'), sha1).hexdigest()
+        if expires < time.time() or not hmac.compare_digest(sig, expected):
+            return None, None
+        return url.path, query
+
+    def _respond(self, code, body=b'', headers=()):
+        self.send_response(code)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_PUT(self):
+        path, query = self._authorise('PUT')
+        if path is None:
+            return self._respond(401)
+        content = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if query.get('multipart-manifest') == ['put']:
+            try:
+                segments = [(segment['path'], segment['etag'], segment['size_bytes']) for segment in json.loads(content)]
+            except (ValueError, KeyError, TypeError):
+                return self._respond(400, b'Invalid manifest')
+            with self.server.lock:
+                parts = [self.server.objects.get('/v1' + segment) for segment, _, _ in segments]
+            for part, (_, etag, size) in zip(parts, segments):
+                if part is None or md5(part).hexdigest() != etag or len(part) != size:
+                    return self._respond(400, b'Invalid segment')
+            content = b''.join(parts)
+        with self.server.lock:
+            self.server.objects[path] = content
+        self._respond(201, headers=[('Etag', md5(content).hexdigest())])
+
+    def do_GET(self):
+        path, _ = self._authorise('GET')
+        if path is None:
+            return self._respond(401)
+        with self.server.lock:
+            content = self.server.objects.get(path)
+        if content is None:
+            return self._respond(404)
+        self._respond(200, content)
+
+
+class SwiftServer(ThreadingHTTPServer):
+    """
+    Swift stand-in listening on a free local port. Objects are kept in memory, keyed by their path.
+
+    Use as a context manager, which serves requests from a background thread.
+    """
+    daemon_threads = True
+
+    def __init__(self, key='secret', bucket='bucket'):
+        super().__init__(('127.0.0.1', 0), SwiftHandler)
+        self.key = key
+        self.bucket = bucket
+        self.objects = {}
+        self.lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        return 'http://%s:%d' % self.server_address
+
+    def config(self, storage_root='https://data.scrc.uk/', **options):
+        """
+        Return a configuration for object_storage pointing at the server.
+        """
+        config = configparser.ConfigParser()
+        config.read_dict({'storage': dict({
+            'url': self.url, 'bucket': self.bucket, 'key': self.key, 'duration': '600', 'storage_root': storage_root,
+        }, **options)})
+        return config
+
+    def get_object(self, path):
+        with self.lock:
+            return self.objects.get('/v1/%s/%s' % (self.bucket, path))
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self._thread.join()
+        self.server_close()
@@ -1,9 +1,30 @@
-from django.test import TestCase
+from concurrent import futures
+import configparser
+import csv
+import io
+import json
+import os
+import threading
+from unittest import mock
+
+import requests
+import semver
+from django.db import connection, transaction
+from django.db.models import F
+from django.db.models.signals import post_save
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 from rest_framework.test import APIClient
 
+from data_management import lineage, search
+from data_management.models import Author, ChangeLogEntry, CodeRun, ComponentLineage, DataProduct, Keyword, KeyValue, \
+    Namespace, Object, ObjectComponent, RenderedProvReport, SearchDocument, StorageLocation, StorageRoot
+from data_management.prov import precompute_prov_reports, render_prov_document
 from .initdb import init_db
+from .swift import SwiftServer
 
 
 class UsersAPITests(TestCase):
@@ -354,6 +375,431 @@ class CodeRunAPITests(TestCase):
         self.assertEqual(len(results), 1)
         self.assertEqual(results[0]['description'], 'Script run to upload and process scottish coronavirus-covid-19-management-information')
 
+class ProvReportAPITests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create(username='Test User')
+        init_db()
+        cache.clear()
+
+    def _get_report(self, code_run):
+        client = APIClient()
+        url = reverse('prov_report', kwargs={'pk': code_run.id})
+        return client.get(url, HTTP_ACCEPT='application/json')
+
+    def test_get_report(self):
+        code_run = CodeRun.objects.get(pk=1)
+        response = self._get_report(code_run)
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(len(data['entity']), 6)
+        obj = code_run.inputs.first().object
+        data_product = obj.data_products.first()
+        meta = data['entity']['/api/object/%d' % obj.id]
+        self.assertEqual(meta['storage'], str(obj.storage_location))
+        self.assertEqual(meta['namespace'], str(data_product.namespace))
+        self.assertEqual(meta['name'], data_product.name)
+
+    def test_query_count_does_not_depend_on_components(self):
+        code_run = CodeRun.objects.get(pk=1)
+        objects = list(Object.objects.all())
+        components = [
+            ObjectComponent.objects.create(updated_by=self.user, object=objects[i % len(objects)], name='c%d' % i)
+            for i in range(50)
+        ]
+        code_run.inputs.add(*components[:25])
+        code_run.outputs.add(*components[25:])
+        self._get_report(code_run)
+
+        with self.assertNumQueries(5):
+            response = self._get_report(code_run)
+
+        self.assertEqual(response.status_code, 200)
+        all_components = set(code_run.inputs.all()) | set(code_run.outputs.all())
+        all_objects = {component.object_id for component in all_components}
+        self.assertEqual(len(response.json()['entity']), len(all_components) + len(all_objects))
+
+    def test_stored_report_is_reused(self):
+        code_run = CodeRun.objects.get(pk=1)
+        expected = self._get_report(code_run).json()
+
+        with mock.patch('data_management.prov.render_prov_document') as render:
+            response = self._get_report(code_run)
+
+        render.assert_not_called()
+        self.assertEqual(response.json(), expected)
+        self.assertEqual(RenderedProvReport.objects.filter(code_run=code_run).count(), 1)
+
+    def test_stored_report_is_replaced_when_outputs_change(self):
+        code_run = CodeRun.objects.get(pk=1)
+        before = self._get_report(code_run).json()
+        component = ObjectComponent.objects.create(
+            updated_by=self.user, object=Object.objects.first(), name='new-output')
+        code_run.outputs.add(component)
+
+        after = self._get_report(code_run).json()
+
+        self.assertNotIn('/api/object_component/%d' % component.id, before['entity'])
+        self.assertIn('/api/object_component/%d' % component.id, after['entity'])
+        self.assertEqual(RenderedProvReport.objects.filter(code_run=code_run).count(), 1)
+
+    def test_precomputed_report_is_used(self):
+        code_run = CodeRun.objects.get(pk=1)
+        precompute_prov_reports(code_run, ['json', 'xml'])
+
+        with mock.patch('data_management.prov.render_prov_document') as render:
+            response = self._get_report(code_run)
+
+        render.assert_not_called()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(RenderedProvReport.objects.filter(code_run=code_run).count(), 2)
+
+    @override_settings(PROV_REPORT_TIMEOUT=0.01)
+    def test_slow_render_returns_503_then_report(self):
+        code_run = CodeRun.objects.get(pk=1)
+        rendered = threading.Event()
+        calls = []
+
+        def slow_render(doc, format):
+            calls.append(format)
+            rendered.wait(5)
+            return render_prov_document(doc, format)
+
+        with mock.patch('data_management.prov.render_prov_document', slow_render):
+            response = self._get_report(code_run)
+            self.assertEqual(response.status_code, 503)
+            rendered.set()
+            with override_settings(PROV_REPORT_TIMEOUT=5):
+                response = self._get_report(code_run)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(calls, ['json'])
+
+
+class LineageAPITests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create(username='Test User')
+        init_db()
+        self.object = DataProduct.objects.first().object
+        self.c1, self.c2, self.c3, self.c4 = [
+            ObjectComponent.objects.create(updated_by=self.user, object=self.object, name='lineage-%d' % i)
+            for i in range(1, 5)
+        ]
+        self.r1 = self._code_run([self.c1], [self.c2])
+        self.r2 = self._code_run([self.c2, self.c4], [self.c3])
+
+    def _code_run(self, inputs, outputs):
+        code_run = CodeRun.objects.create(
+            updated_by=self.user,
+            run_date='2020-07-17T18:21:11Z',
+            description='Lineage test run',
+            submission_script=self.object,
+        )
+        code_run.inputs.set(inputs)
+        code_run.outputs.set(outputs)
+        return code_run
+
+    def _lineage(self, component, **params):
+        client = APIClient()
+        url = reverse('objectcomponent-lineage', kwargs={'pk': component.id})
+        return client.get(url, data=params, format='json')
+
+    def _components(self, response):
+        prefix = 'http://testserver/api/object_component/'
+        return [(int(c['url'][len(prefix):-1]), c['depth']) for c in response.json()['components']]
+
+    def _paths(self):
+        return set(ComponentLineage.objects.values_list('ancestor_id', 'descendant_id', 'depth'))
+
+    def test_upstream(self):
+        response = self._lineage(self.c3)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            self._components(response),
+            sorted([(self.c2.id, 1), (self.c4.id, 1), (self.c1.id, 2)], key=lambda c: (c[1], c[0])))
+        self.assertEqual(len(response.json()['code_runs']), 2)
+        self.assertEqual(response.json()['data_products'], [
+            'http://testserver/api/data_product/%d/' % self.object.data_products.get().id
+        ])
+
+    def test_upstream_with_depth(self):
+        response = self._lineage(self.c3, depth=1)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({c for c, _ in self._components(response)}, {self.c2.id, self.c4.id})
+        self.assertEqual(response.json()['code_runs'], ['http://testserver/api/code_run/%d/' % self.r2.id])
+
+    def test_downstream(self):
+        response = self._lineage(self.c1, direction='downstream')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self._components(response), [(self.c2.id, 1), (self.c3.id, 2)])
+
+    def test_invalid_arguments(self):
+        self.assertEqual(self._lineage(self.c1, direction='sideways').status_code, 400)
+        self.assertEqual(self._lineage(self.c1, depth=0).status_code, 400)
+        self.assertEqual(self._lineage(self.c1, depth='deep').status_code, 400)
+
+    def test_query_count(self):
+        with self.assertNumQueries(4):
+            self._lineage(self.c3)
+
+    def test_removing_input_removes_paths(self):
+        self.r1.inputs.remove(self.c1)
+
+        self.assertEqual({c for c, _ in self._components(self._lineage(self.c3))}, {self.c2.id, self.c4.id})
+
+    def test_adding_run_shortens_depth(self):
+        self._code_run([self.c1], [self.c3])
+
+        self.assertIn((self.c1.id, 1), self._components(self._lineage(self.c3)))
+
+    def test_deleting_run_removes_paths(self):
+        self.r2.delete()
+
+        self.assertEqual(self._components(self._lineage(self.c3)), [])
+        self.assertEqual(self._components(self._lineage(self.c2)), [(self.c1.id, 1)])
+
+    def test_no_self_paths(self):
+        self.assertFalse(ComponentLineage.objects.filter(ancestor=F('descendant')).exists())
+
+    def test_rebuild_matches_incremental(self):
+        self._code_run([self.c3], [self.c1])
+        self.r1.outputs.clear()
+        self.r1.outputs.add(self.c2, self.c4)
+        paths = self._paths()
+
+        lineage.rebuild()
+
+        self.assertEqual(self._paths(), paths)
+
+
+class ObjectStorageAPITests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create(username='Test User')
+        init_db()
+        self.root = StorageRoot.objects.get(root='https://github.com')
+        self.location = StorageLocation.objects.filter(storage_root=self.root).first()
+        config = configparser.ConfigParser()
+        config.read_dict({'storage': {
+            'url': 'https://storage.example.com', 'bucket': 'bucket', 'key': 'secret', 'duration': '60',
+            'storage_root': self.root.root,
+        }})
+        patcher = mock.patch('data_management.settings.CONFIG', config)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_single_checksum(self):
+        response = self.client.post('/api/data', {'checksum': 'abc123'}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['url'].startswith('https://storage.example.com/v1/bucket/abc123?'))
+
+    def test_single_existing_checksum(self):
+        response = self.client.post('/api/data/' + self.location.hash, format='json')
+
+        self.assertEqual(response.status_code, 409)
+
+    def test_many_checksums(self):
+        checksums = [self.location.hash, 'abc123', 'def456', 'abc123']
+
+        with self.assertNumQueries(1):
+            response = self.client.post('/api/data', {'checksums': checksums}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['exists'], [self.location.hash])
+        self.assertEqual(list(data['urls']), ['abc123', 'def456'])
+        self.assertTrue(data['urls']['def456'].startswith('https://storage.example.com/v1/bucket/def456?'))
+
+    def test_many_checksums_ignores_other_roots(self):
+        other = StorageLocation.objects.exclude(storage_root=self.root).exclude(hash=self.location.hash).first()
+
+        response = self.client.post('/api/data', {'checksums': [other.hash]}, format='json')
+
+        self.assertEqual(response.json()['exists'], [])
+
+    def test_invalid_checksums(self):
+        response = self.client.post('/api/data', {'checksums': 'abc123'}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_many_checksums_in_batches(self):
+        checksums = ['checksum%d' % i for i in range(999)] + [self.location.hash]
+
+        with self.assertNumQueries(2):
+            response = self.client.post('/api/data', {'checksums': checksums}, format='json')
+
+        self.assertEqual(response.json()['exists'], [self.location.hash])
+        self.assertEqual(len(response.json()['urls']), 999)
+
+    def test_too_many_checksums(self):
+        checksums = ['checksum%d' % i for i in range(1001)]
+
+        response = self.client.post('/api/data', {'checksums': checksums}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+
+
+class SegmentedUploadAPITests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create(username='Test User')
+        self.swift = SwiftServer().__enter__()
+        self.addCleanup(self.swift.__exit__)
+        patcher = mock.patch('data_management.settings.CONFIG', self.swift.config(segment_size=str(2 * 1024 ** 2)))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.data = os.urandom(5 * 1024 ** 2 // 2)
+
+    def _plan(self, **data):
+        return self.client.post('/api/data', dict({'checksum': 'abc123', 'size': len(self.data)}, **data), format='json')
+
+    def _upload(self, urls, segment_size):
+        def put(index):
+            response = requests.put(urls[index], data=self.data[index * segment_size:(index + 1) * segment_size])
+            response.raise_for_status()
+            return {'etag': response.headers['Etag'], 'size': len(response.request.body)}
+
+        with futures.ThreadPoolExecutor(max_workers=len(urls)) as executor:
+            return list(executor.map(put, range(len(urls))))
+
+    def test_segmented_upload(self):
+        response = self._plan(segment_size=1024 ** 2)
+
+        self.assertEqual(response.status_code, 200)
+        plan = response.json()
+        self.assertEqual(plan['segment_size'], 1024 ** 2)
+        self.assertEqual(len(plan['segments']), 3)
+
+        segments = self._upload(plan['segments'], plan['segment_size'])
+        response = self.client.post(plan['manifest'], {'segments': segments}, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.swift.get_object('abc123'), self.data)
+
+    def test_default_segment_size(self):
+        plan = self._plan().json()
+
+        self.assertEqual(plan['segment_size'], 2 * 1024 ** 2)
+        self.assertEqual(len(plan['segments']), 2)
+
+    def test_small_file_uses_single_url(self):
+        response = self._plan(size=1024)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.json()), ['url'])
+
+    def test_invalid_segment_size(self):
+        self.assertEqual(self._plan(segment_size=1024).status_code, 400)
+        self.assertEqual(self._plan(segment_size=4 * 1024 ** 2).status_code, 400)
+        self.assertEqual(self._plan(size='big').status_code, 400)
+
+    def test_segment_count_is_capped(self):
+        with mock.patch('data_management.settings.CONFIG', self.swift.config(
+                segment_size=str(2 * 1024 ** 2), max_segments='2')):
+            plan = self._plan(segment_size=1024 ** 2).json()
+            self.assertEqual(plan['segment_size'], len(self.data) // 2)
+            self.assertEqual(len(plan['segments']), 2)
+
+            self.assertEqual(self._plan(size=5 * 1024 ** 2).status_code, 400)
+
+    def test_manifest_for_existing_file(self):
+        root = StorageRoot.objects.create(updated_by=self.user, root='https://data.scrc.uk/')
+        StorageLocation.objects.create(updated_by=self.user, storage_root=root, path='abc123', hash='abc123')
+        segments = [{'etag': 'x', 'size': 1024 ** 2}]
+
+        response = self.client.post('/api/data/abc123/manifest', {'segments': segments}, format='json')
+
+        self.assertEqual(response.status_code, 409)
+
+    def test_manifest_with_wrong_etag(self):
+        plan = self._plan(segment_size=1024 ** 2).json()
+        segments = self._upload(plan['segments'], plan['segment_size'])
+        segments[0]['etag'] = segments[1]['etag']
+
+        response = self.client.post(plan['manifest'], {'segments': segments}, format='json')
+
+        self.assertEqual(response.status_code, 502)
+        self.assertIsNone(self.swift.get_object('abc123'))
+
+    def test_invalid_manifest(self):
+        response = self.client.post('/api/data/abc123/manifest', {'segments': [{'etag': 'x'}]}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+
+
+class VersionFilterAPITests(TestCase):
+
+    VERSIONS = ['0.1.0', '0.1.5', '0.2.0', '1.0.0-rc.1', '1.0.0', '1.2.0', '1.2.7', '1.10.0', '2.0.0-beta', '2.0.0']
+
+    def setUp(self):
+        self.user = get_user_model().objects.create(username='Test User')
+        init_db()
+        namespace = Namespace.objects.get(name='FAIR')
+        obj = Object.objects.first()
+        for version in self.VERSIONS:
+            DataProduct.objects.create(updated_by=self.user, object=obj, namespace=namespace, name='versioned',
+                                       version=version)
+            DataProduct.objects.create(updated_by=self.user, object=obj, namespace=namespace, name='other',
+                                       version=version.replace('1.', '3.'))
+
+    def _versions(self, version, name='versioned'):
+        client = APIClient()
+        response = client.get(reverse('dataproduct-list'), data={'name': name, 'version': version}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return sorted(r['version'] for r in response.json()['results'])
+
+    def test_exact(self):
+        self.assertEqual(self._versions('1.2.0'), ['1.2.0'])
+
+    def test_latest(self):
+        self.assertEqual(self._versions('latest'), ['2.0.0'])
+
+    def test_latest_of_each_data_product(self):
+        latest = {}
+        for data_product in DataProduct.objects.all():
+            key = (data_product.namespace_id, data_product.name)
+            if key not in latest or semver.compare(data_product.version, latest[key]) > 0:
+                latest[key] = data_product.version
+
+        self.assertEqual(self._versions('latest', name='*'), sorted(latest.values()))
+
+    def test_comparisons(self):
+        self.assertEqual(self._versions('>=1.2.0'), ['1.10.0', '1.2.0', '1.2.7', '2.0.0', '2.0.0-beta'])
+        self.assertEqual(self._versions('>1.2.0,<=1.10.0'), ['1.10.0', '1.2.7'])
+        self.assertEqual(self._versions('<1.0.0'), ['0.1.0', '0.1.5', '0.2.0', '1.0.0-rc.1'])
+
+    def test_caret(self):
+        self.assertEqual(self._versions('^1.2.0'), ['1.10.0', '1.2.0', '1.2.7'])
+        self.assertEqual(self._versions('^0.1.0'), ['0.1.0', '0.1.5'])
+
+    def test_tilde(self):
+        self.assertEqual(self._versions('~1.2.0'), ['1.2.0', '1.2.7'])
+
+    def test_invalid_range(self):
+        client = APIClient()
+        response = client.get(reverse('dataproduct-list'), data={'version': '>=one'}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_sort_keys_are_hidden(self):
+        client = APIClient()
+        response = client.get(reverse('dataproduct-list'), format='json')
+
+        self.assertNotIn('version_major', response.json()['results'][0])
+        response = client.get(reverse('dataproduct-list'), data={'version_major': 1}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
 class ExternalObjectAPITests(TestCase):
 
     def setUp(self):
@@ -789,3 +1235,708 @@ class KeyvalueAPITests(TestCase):
         results = response.json()['results']
         self.assertEqual(len(results), 1)
         self.assertEqual(results[0]['key'], 'TestKey2')
+
+
+class BulkCreateAPITests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create(username='Test User')
+        init_db()
+
+    def test_create_list(self):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        url = reverse('keyvalue-list')
+        data = [
+            {'object': 'http://testserver/api/object/1/', 'key': 'BulkKey%d' % i, 'value': 'BulkValue%d' % i}
+            for i in range(3)
+        ]
+        response = client.post(url, data, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        results = response.json()
+        self.assertEqual(len(results), 3)
+        self.assertEqual([result['status'] for result in results], [201, 201, 201])
+        self.assertEqual([result['data']['key'] for result in results], ['BulkKey0', 'BulkKey1', 'BulkKey2'])
+        self.assertEqual(KeyValue.objects.filter(key__startswith='BulkKey').count(), 3)
+
+    def test_create_list_sends_post_save_with_the_database_written_to(self):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        url = reverse('keyvalue-list')
+        data = [{'object': 'http://testserver/api/object/1/', 'key': 'BulkKey', 'value': 'BulkValue'}]
+        received = []
+
+        def receiver(sender, instance, created, using, **kwargs):
+            received.append((instance.key, created, using))
+
+        post_save.connect(receiver, sender=KeyValue)
+        try:
+            response = client.post(url, data, format='json')
+        finally:
+            post_save.disconnect(receiver, sender=KeyValue)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(received, [('BulkKey', True, 'default')])
+
+    def test_create_list_with_conflicts(self):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        url = reverse('keyvalue-list')
+        data = [
+            {'object': 'http://testserver/api/object/1/', 'key': 'BulkKey', 'value': 'BulkValue'},
+            {'object': 'http://testserver/api/object/1/', 'key': 'BulkKey', 'value': 'BulkValue'},
+            {'object': 'http://testserver/api/object/1/', 'key': 'TestKey1', 'value': 'BulkValue'},
+            {'object': 'http://testserver/api/object/1/'},
+        ]
+        response = client.post(url, data, format='json')
+
+        self.assertEqual(response.status_code, 207)
+        results = response.json()
+        self.assertEqual([result['status'] for result in results], [201, 409, 409, 400])
+        self.assertEqual(KeyValue.objects.filter(key='BulkKey').count(), 1)
+
+    def test_create_list_of_objects(self):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        url = reverse('object-list')
+        response = client.post(url, [{'description': 'Bulk 1'}, {'description': 'Bulk 2'}], format='json')
+
+        self.assertEqual(response.status_code, 201)
+        for result in response.json():
+            obj = Object.objects.get(uuid=result['data']['uuid'])
+            self.assertEqual(obj.components.filter(whole_object=True).count(), 1)
+
+    def test_create_list_without_authentication(self):
+        client = APIClient()
+        url = reverse('keyvalue-list')
+        data = [{'object': 'http://testserver/api/object/1/', 'key': 'BulkKey', 'value': 'BulkValue'}]
+        response = client.post(url, data, format='json')
+
+        self.assertEqual(response.status_code, 403)
+
+
+class QueryCountAPITests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create(username='Test User')
+        init_db()
+
+    def _count_queries(self, url, page_size):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url, data={'page_size': page_size, 'count': 'none'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), page_size)
+        return len(queries)
+
+    def test_list_query_count_is_constant(self):
+        for name in ('object-list', 'objectcomponent-list', 'dataproduct-list', 'issue-list', 'storageroot-list'):
+            url = reverse(name)
+            self.assertEqual(self._count_queries(url, 1), self._count_queries(url, 3), name)
+
+    def test_internal_format(self):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        response = client.get(reverse('dataproduct-list'), format='json')
+
+        self.assertEqual(response.status_code, 200)
+        for result in response.json()['results']:
+            data_product = DataProduct.objects.get(id=result['url'].split('/')[-2])
+            expected = data_product.object.components.filter(whole_object=False).exists()
+            self.assertEqual(result['internal_format'], expected)
+
+
+@override_settings(API_RESPONSE_CACHE_TIMEOUT=0)
+class PaginationCountAPITests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create(username='Test User')
+        init_db()
+        cache.clear()
+
+    def _get_count(self, **params):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        response = client.get(reverse('object-list'), data=params, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['count']
+
+    def test_exact_count(self):
+        self.assertEqual(self._get_count(), 16)
+        self.assertEqual(self._get_count(count='exact', storage_location='3'), 1)
+
+    def test_estimated_count(self):
+        self.assertEqual(self._get_count(count='estimate'), 16)
+
+    def test_no_count(self):
+        self.assertIsNone(self._get_count(count='none'))
+
+    def test_exact_count_is_not_cached(self):
+        self.assertEqual(self._get_count(), 16)
+        # Insert without sending the signals which invalidate cached counts
+        Object.objects.bulk_create([Object(updated_by=self.user)])
+        self.assertEqual(self._get_count(), 17)
+
+    def test_estimated_count_is_cached_by_filters(self):
+        # Without database statistics the estimate falls back to a cached count
+        self.assertEqual(self._get_count(count='estimate', description='Not a description'), 0)
+        Object.objects.bulk_create([Object(updated_by=self.user, description='Not a description')])
+        self.assertEqual(self._get_count(count='estimate', description='Not a description'), 0)
+        self.assertEqual(self._get_count(count='estimate', description='Not a description', page_size=5), 0)
+        self.assertEqual(self._get_count(count='estimate'), 17)
+
+    def test_estimated_count_is_invalidated_by_writes(self):
+        self.assertEqual(self._get_count(count='estimate'), 16)
+        Object.objects.create(updated_by=self.user)
+        self.assertEqual(self._get_count(count='estimate'), 17)
+
+    @override_settings(API_COUNT_CACHE_TIMEOUT=0)
+    def test_estimated_count_without_cache(self):
+        self.assertEqual(self._get_count(count='estimate', description='Not a description'), 0)
+        Object.objects.bulk_create([Object(updated_by=self.user, description='Not a description')])
+        self.assertEqual(self._get_count(count='estimate', description='Not a description'), 1)
+
+    def test_invalid_count(self):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        response = client.get(reverse('object-list'), data={'count': 'approximate'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class SearchAPITests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create(username='Test User')
+        init_db()
+
+    def _search(self, **params):
+        client = APIClient()
+        response = client.get(reverse('search'), data=params, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_search(self):
+        results = self._search(q='symptom')
+        self.assertEqual(len(results), 2)
+        self.assertEqual({result['type'] for result in results}, {'data_product'})
+        self.assertEqual({result['title'] for result in results}, {
+            'FAIR:human/infection/SARS-CoV-2/symptom-probability',
+            'FAIR:human/infection/SARS-CoV-2/symptom-delay',
+        })
+        data_product = DataProduct.objects.get(name='human/infection/SARS-CoV-2/symptom-delay')
+        self.assertIn('http://testserver' + reverse('dataproduct-detail', args=[data_product.id]),
+                      [result['url'] for result in results])
+
+    def test_search_matches_prefixes_of_every_term(self):
+        results = self._search(q='SARS mort')
+        self.assertEqual([result['title'] for result in results], ['FAIR:human/infection/SARS-CoV-2/scotland/mortality'])
+        self.assertEqual(self._search(q='symptom mort'), [])
+
+    def test_search_by_type(self):
+        results = self._search(q='coronavirus', type='external_object')
+        self.assertEqual({result['title'] for result in results}, {
+            'scottish deaths-involving-coronavirus-covid-19',
+            'scottish coronavirus-covid-19-management-information',
+        })
+        results = self._search(q='scrcdata', type=['data_product', 'code_repo_release'])
+        self.assertEqual([result['type'] for result in results], ['code_repo_release'])
+
+    def test_search_pages(self):
+        titles = [result['title'] for result in self._search(q='human')]
+        self.assertEqual(len(titles), 11)
+        self.assertEqual([result['title'] for result in self._search(q='human', limit=5, offset=5)], titles[5:10])
+
+    def test_search_is_updated(self):
+        Namespace.objects.filter(name='simple_network_sim').update(name='epidemics')
+        self.assertEqual(self._search(q='epidemics'), [])
+        namespace = Namespace.objects.get(name='epidemics')
+        namespace.save()
+        self.assertEqual(len(self._search(q='epidemics')), 4)
+
+        data_product = DataProduct.objects.get(name='human/population')
+        keyword = Keyword.objects.create(updated_by=self.user, object=data_product.object, keyphrase='zoonosis')
+        self.assertEqual([result['title'] for result in self._search(q='zoonosis')], ['epidemics:human/population'])
+        keyword.delete()
+        self.assertEqual(self._search(q='zoonosis'), [])
+
+        data_product.delete()
+        self.assertFalse(SearchDocument.objects.filter(model='dataproduct', object_id=data_product.id).exists())
+
+    def test_rebuild(self):
+        count = SearchDocument.objects.count()
+        SearchDocument.objects.all().delete()
+        search.rebuild()
+        self.assertEqual(SearchDocument.objects.count(), count)
+        self.assertEqual(len(self._search(q='symptom')), 2)
+
+    def test_full_text_index_is_used(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('FTS5 is only used on SQLite')
+        with CaptureQueriesContext(connection) as queries:
+            self._search(q='symptom')
+        self.assertIn(search.FTS_TABLE, queries.captured_queries[-1]['sql'])
+
+    def test_search_without_full_text_index(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('FTS5 is only used on SQLite')
+        titles = {result['title'] for result in self._search(q='symptom')}
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TABLE %s' % search.FTS_TABLE)
+        # Without the index each term is matched anywhere in the text rather than at the start of words
+        self.assertLessEqual(titles, {result['title'] for result in self._search(q='symptom')})
+
+    def test_invalid_search(self):
+        client = APIClient()
+        for params in ({}, {'q': '--'}, {'q': 'symptom', 'type': 'object'}, {'q': 'symptom', 'limit': 0},
+                       {'q': 'symptom', 'limit': 'all'}, {'q': 'symptom', 'offset': -1}, {'q': 'a', 'name': 'b'}):
+            response = client.get(reverse('search'), data=params, format='json')
+            self.assertEqual(response.status_code, 400, params)
+
+
+@override_settings(API_RESPONSE_CACHE_TIMEOUT=0)
+class ConditionalAPITests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create(username='Test User')
+        init_db()
+        cache.clear()
+        self.client = APIClient()
+        self.object = DataProduct.objects.get(name='human/infection/SARS-CoV-2/symptom-probability').object
+
+    def _get(self, url, **headers):
+        return self.client.get(url, format='json', HTTP_ACCEPT='application/json', **headers)
+
+    def test_detail(self):
+        url = reverse('object-detail', args=[self.object.id])
+        response = self._get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+
+        with self.assertNumQueries(1):
+            response = self._get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        response = self._get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+        data_product = self.object.data_products.get()
+        url = reverse('dataproduct-detail', args=[data_product.id])
+        etag = self._get(url)['ETag']
+        data_product.version = '0.2.0'
+        data_product.save()
+        response = self._get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['version'], '0.2.0')
+
+    def test_detail_changes_with_related_objects(self):
+        url = reverse('object-detail', args=[self.object.id])
+        etag = self._get(url)['ETag']
+        Keyword.objects.create(updated_by=self.user, object=self.object, keyphrase='symptoms')
+        response = self._get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['keywords']), 1)
+
+    def test_detail_changes_with_many_to_many_relations(self):
+        code_run = CodeRun.objects.first()
+        url = reverse('coderun-detail', args=[code_run.id])
+        etag = self._get(url)['ETag']
+        code_run.inputs.clear()
+        response = self._get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['inputs'], [])
+
+    def test_detail_changes_with_models_read_by_the_serializer(self):
+        data_product = DataProduct.objects.exclude(object__components__whole_object=False).first()
+        url = reverse('dataproduct-detail', args=[data_product.id])
+        response = self._get(url)
+        self.assertFalse(response.json()['internal_format'])
+        ObjectComponent.objects.create(updated_by=self.user, object=data_product.object, name='table')
+        response = self._get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['internal_format'])
+
+    def test_list(self):
+        url = reverse('dataproduct-list')
+        response = self.client.get(url, data={'name': 'human/*'}, format='json', HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        other = self.client.get(url, data={'name': 'this/*'}, format='json', HTTP_ACCEPT='application/json')
+        self.assertNotEqual(other['ETag'], etag)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url, data={'name': 'human/*'}, format='json', HTTP_ACCEPT='application/json',
+                                       HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        DataProduct.objects.get(name='human/population').delete()
+        response = self.client.get(url, data={'name': 'human/*'}, format='json', HTTP_ACCEPT='application/json',
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_head(self):
+        url = reverse('object-detail', args=[self.object.id])
+        etag = self._get(url)['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.head(url, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+
+        response = self.client.head(reverse('object-detail', args=[999999]), HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 404)
+        response = self.client.head(reverse('object-list'), HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('ETag', response)
+
+    def test_browsable_api_is_not_conditional(self):
+        response = self.client.get(reverse('object-detail', args=[self.object.id]), HTTP_ACCEPT='text/html')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+
+
+class ResponseCacheAPITests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create(username='Test User')
+        init_db()
+        cache.clear()
+        self.client = APIClient()
+
+    def _get(self, url, **kwargs):
+        return self.client.get(url, format='json', HTTP_ACCEPT='application/json', **kwargs)
+
+    def test_cached_list(self):
+        url = reverse('dataproduct-list')
+        response = self._get(url, data={'name': 'human/*'})
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(0):
+            cached = self._get(url, data={'name': 'human/*'})
+        self.assertEqual(cached.status_code, 200)
+        self.assertEqual(cached.json(), response.json())
+        self.assertEqual(cached['ETag'], response['ETag'])
+        self.assertEqual(cached['Content-Type'], response['Content-Type'])
+        with self.assertNumQueries(0):
+            response = self._get(url, data={'name': 'human/*'}, HTTP_IF_NONE_MATCH=cached['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertNotEqual(self._get(url, data={'name': 'this/*'}).json(), cached.json())
+
+    def test_write_invalidates_list(self):
+        url = reverse('namespace-list')
+        count = self._get(url).json()['count']
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        response = client.post(url, {'name': 'new_namespace'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self._get(url).json()['count'], count + 1)
+        response = client.post(url, [{'name': 'bulk_namespace'}], format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self._get(url).json()['count'], count + 2)
+        Namespace.objects.get(name='new_namespace').delete()
+        self.assertEqual(self._get(url).json()['count'], count + 1)
+
+    def test_related_write_invalidates_detail(self):
+        code_run = CodeRun.objects.first()
+        url = reverse('coderun-detail', args=[code_run.id])
+        self.assertNotEqual(self._get(url).json()['inputs'], [])
+        code_run.inputs.clear()
+        self.assertEqual(self._get(url).json()['inputs'], [])
+
+    def test_write_to_models_read_by_the_serializer_invalidates_detail(self):
+        data_product = DataProduct.objects.exclude(object__components__whole_object=False).first()
+        url = reverse('dataproduct-detail', args=[data_product.id])
+        self.assertFalse(self._get(url).json()['internal_format'])
+        ObjectComponent.objects.create(updated_by=self.user, object=data_product.object, name='table')
+        self.assertTrue(self._get(url).json()['internal_format'])
+
+    def test_commit_invalidates_responses_cached_during_write(self):
+        url = reverse('namespace-list')
+        with mock.patch('data_management.caching.transaction.on_commit') as on_commit:
+            Namespace.objects.create(updated_by=self.user, name='uncommitted_namespace')
+        self._get(url)
+        with self.assertNumQueries(0):
+            self._get(url)
+        for args, kwargs in on_commit.call_args_list:
+            args[0]()
+        with CaptureQueriesContext(connection) as queries:
+            self._get(url)
+        self.assertGreater(len(queries), 0)
+
+    def test_missing_object_is_not_cached(self):
+        url = reverse('namespace-detail', args=[999999])
+        self.assertEqual(self._get(url).status_code, 404)
+        Namespace.objects.create(id=999999, updated_by=self.user, name='late_namespace')
+        self.assertEqual(self._get(url).status_code, 200)
+
+    @override_settings(API_RESPONSE_CACHE_TIMEOUT=0)
+    def test_cache_disabled(self):
+        url = reverse('namespace-list')
+        self._get(url)
+        with self.assertNumQueries(3):
+            self._get(url)
+
+
+class ExportAPITests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create(username='Test User')
+        init_db()
+        self.client = APIClient()
+
+    def _export(self, **params):
+        response = self.client.get(reverse('dataproduct-export'), data=params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode('utf-8'), response
+
+    def test_ndjson(self):
+        with self.assertNumQueries(1):
+            content, response = self._export()
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(len(rows), DataProduct.objects.count())
+        data_product = DataProduct.objects.get(name='human/population')
+        row = next(row for row in rows if row['id'] == data_product.id)
+        self.assertEqual(row['name'], 'human/population')
+        self.assertEqual(row['namespace_id'], data_product.namespace_id)
+        self.assertEqual(row['version'], '0.1.0')
+        self.assertNotIn('version_major', row)
+
+    def test_csv(self):
+        content, response = self._export(format='csv', name='human/*')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('dataproduct.csv', response['Content-Disposition'])
+        rows = list(csv.DictReader(io.StringIO(content)))
+        expected = DataProduct.objects.filter(name__startswith='human/').order_by('-id')
+        self.assertEqual([int(row['id']) for row in rows], [data_product.id for data_product in expected])
+        self.assertEqual(rows[0]['name'], expected[0].name)
+
+    def test_filters(self):
+        content, _ = self._export(namespace=Namespace.objects.get(name='simple_network_sim').id)
+        self.assertEqual(len(content.splitlines()), 4)
+
+    def test_invalid_query(self):
+        response = self.client.get(reverse('dataproduct-export'), data={'page_size': 10})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(json.loads(response.content)['detail'][:23], 'Invalid query arguments')
+
+
+class ChangesAPITests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create(username='Test User')
+        init_db()
+        self.client = APIClient()
+        self.since = ChangeLogEntry.objects.order_by('-id').values_list('id', flat=True).first()
+
+    def _changes(self, **params):
+        params.setdefault('since', self.since)
+        response = self.client.get(reverse('changes'), data=params, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_initial_data_is_logged(self):
+        results = self._changes(since=0, limit=1000, type='data_product')['results']
+        self.assertEqual(len(results), DataProduct.objects.count())
+        self.assertEqual({result['action'] for result in results}, {'created'})
+
+    def test_create_update_delete(self):
+        namespace = Namespace.objects.create(updated_by=self.user, name='changes')
+        namespace.full_name = 'Changes'
+        namespace.save()
+        Namespace.objects.filter(pk=namespace.pk).update(website='https://example.com')
+        namespace_id = namespace.id
+        namespace.delete()
+        results = self._changes()['results']
+        self.assertEqual([(result['type'], result['object_id'], result['action']) for result in results], [
+            ('namespace', namespace_id, 'created'),
+            ('namespace', namespace_id, 'updated'),
+            ('namespace', namespace_id, 'updated'),
+            ('namespace', namespace_id, 'deleted'),
+        ])
+        self.assertEqual(results[0]['url'], 'http://testserver' + reverse('namespace-detail', args=[namespace_id]))
+        self.assertIsNone(results[-1]['url'])
+
+    def test_relation_changes_update_the_declaring_object(self):
+        obj = Object.objects.filter(storage_location__isnull=False).first()
+        obj.authors.add(Author.objects.first())
+        results = self._changes()['results']
+        self.assertEqual([(result['type'], result['object_id'], result['action']) for result in results],
+                         [('object', obj.id, 'updated')])
+
+    def test_rolled_back_changes_are_not_logged(self):
+        with self.assertRaises(ValueError), transaction.atomic():
+            Namespace.objects.create(updated_by=self.user, name='rolled back')
+            raise ValueError()
+        self.assertEqual(self._changes()['results'], [])
+
+    def test_paging(self):
+        for i in range(5):
+            Namespace.objects.create(updated_by=self.user, name='changes%d' % i)
+        page = self._changes(limit=3)
+        self.assertEqual(len(page['results']), 3)
+        self.assertEqual(page['next'], page['results'][-1]['id'])
+        rest = self._changes(since=page['next'], limit=3)
+        self.assertEqual(len(rest['results']), 2)
+        ids = [result['id'] for result in page['results'] + rest['results']]
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual(self._changes(since=rest['next'])['next'], rest['next'])
+
+    def test_type(self):
+        namespace = Namespace.objects.create(updated_by=self.user, name='changes')
+        KeyValue.objects.create(updated_by=self.user, object=Object.objects.first(), key='changes', value='1')
+        results = self._changes(type='namespace')['results']
+        self.assertEqual([result['object_id'] for result in results], [namespace.id])
+
+    def test_invalid_query(self):
+        for params in ({'type': 'nothing'}, {'since': 'x'}, {'limit': 0}, {'page': 1}):
+            response = self.client.get(reverse('changes'), data=params, format='json')
+            self.assertEqual(response.status_code, 400)
+
+
+@override_settings(API_RESPONSE_CACHE_TIMEOUT=0)
+class SparseFieldsetAPITests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create(username='Test User')
+        init_db()
+        self.client = APIClient()
+
+    def _get(self, url, **params):
+        response = self.client.get(url, data=params, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_fields(self):
+        results = self._get(reverse('object-list'), fields='url,description')['results']
+        self.assertEqual(len(results), Object.objects.count())
+        for result in results:
+            self.assertEqual(set(result), {'url', 'description'})
+
+    def test_repeated_fields(self):
+        results = self._get(reverse('dataproduct-list'), fields=['url', 'name,version'])['results']
+        self.assertEqual(set(results[0]), {'url', 'name', 'version'})
+
+    def test_omit(self):
+        obj = Object.objects.filter(storage_location__isnull=False).first()
+        full = self._get(reverse('object-detail', args=[obj.id]))
+        result = self._get(reverse('object-detail', args=[obj.id]), omit='components,data_products')
+        del full['components'], full['data_products']
+        self.assertEqual(result, full)
+
+    def test_unrequested_relations_are_not_queried(self):
+        self._get(reverse('object-list'))
+        with CaptureQueriesContext(connection) as queries:
+            self._get(reverse('object-list'))
+        with CaptureQueriesContext(connection) as sparse_queries:
+            self._get(reverse('object-list'), fields='url,storage_location')
+        self.assertLess(len(sparse_queries), len(queries))
+        page_query = next(query['sql'] for query in sparse_queries if 'LIMIT' in query['sql'])
+        self.assertNotIn('"description"', page_query)
+        self.assertIn('"storage_location_id"', page_query)
+        # The ETag, the count and the page
+        self.assertEqual(len(sparse_queries), 3)
+
+    def test_reverse_one_to_one(self):
+        data_product = DataProduct.objects.filter(external_object__isnull=False).first()
+        result = self._get(reverse('dataproduct-detail', args=[data_product.id]), fields='external_object')
+        self.assertEqual(result, {'external_object': 'http://testserver' + reverse(
+            'externalobject-detail', args=[data_product.external_object.id])})
+
+    def test_annotations_are_only_added_when_needed(self):
+        with CaptureQueriesContext(connection) as queries:
+            self._get(reverse('dataproduct-list'), fields='url,name')
+        self.assertFalse(any('internal_format' in query['sql'] for query in queries))
+        results = self._get(reverse('dataproduct-list'), fields='internal_format')['results']
+        self.assertEqual(set(results[0]), {'internal_format'})
+
+    def test_unknown_field(self):
+        response = self.client.get(reverse('object-list'), data={'fields': 'url,colour'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('colour', response.json()['detail'])
+
+    def test_writes_use_every_field(self):
+        self.client.force_authenticate(user=self.user)
+        response = self.client.post(reverse('namespace-list') + '?fields=url', {'name': 'sparse'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['name'], 'sparse')
+
+    def test_export_fields(self):
+        response = self.client.get(reverse('dataproduct-export'), data={'format': 'csv', 'fields': 'id,name'})
+        content = b''.join(response.streaming_content).decode('utf-8')
+        self.assertEqual(content.splitlines()[0], 'id,name')
+        response = self.client.get(reverse('dataproduct-export'), data={'fields': 'colour'})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(API_RESPONSE_CACHE_TIMEOUT=0)
+class ExpandAPITests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create(username='Test User')
+        init_db()
+        self.client = APIClient()
+        self.data_product = DataProduct.objects.filter(object__storage_location__isnull=False).first()
+
+    def _get(self, url, **params):
+        response = self.client.get(url, data=params, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_expand(self):
+        url = reverse('dataproduct-detail', args=[self.data_product.id])
+        result = self._get(url, expand='object,object.storage_location,namespace,object.components')
+        obj = self.data_product.object
+        self.assertEqual(result['namespace']['name'], self.data_product.namespace.name)
+        self.assertEqual(result['object']['uuid'], str(obj.uuid))
+        self.assertEqual(result['object']['storage_location']['path'], obj.storage_location.path)
+        self.assertEqual(result['object']['storage_location']['storage_root'], 'http://testserver' + reverse(
+            'storageroot-detail', args=[obj.storage_location.storage_root_id]))
+        self.assertEqual(sorted(component['name'] for component in result['object']['components']),
+                         sorted(obj.components.values_list('name', flat=True)))
+        self.assertEqual(result['object']['data_products'], [
+            'http://testserver' + reverse('dataproduct-detail', args=[dp.id]) for dp in obj.data_products.all()])
+
+    def test_nested_path_expands_its_parents(self):
+        url = reverse('dataproduct-detail', args=[self.data_product.id])
+        result = self._get(url, expand='object.storage_location')
+        self.assertEqual(result['object']['storage_location']['hash'], self.data_product.object.storage_location.hash)
+        self.assertTrue(result['namespace'].startswith('http://'))
+
+    def test_list_queries_do_not_grow_with_the_page(self):
+        cache.clear()
+        params = {'expand': 'object,object.storage_location,namespace,object.components'}
+        with CaptureQueriesContext(connection) as small:
+            self._get(reverse('dataproduct-list'), page_size=2, **params)
+        cache.clear()
+        with CaptureQueriesContext(connection) as large:
+            results = self._get(reverse('dataproduct-list'), page_size=100, **params)['results']
+        self.assertEqual(len(results), DataProduct.objects.count())
+        self.assertEqual(len(small), len(large))
+        self.assertTrue(all(isinstance(result['object'], dict) for result in results))
+
+    def test_expand_with_fields(self):
+        result = self._get(reverse('dataproduct-detail', args=[self.data_product.id]),
+                           fields='name,namespace', expand='namespace')
+        self.assertEqual(set(result), {'name', 'namespace'})
+        self.assertEqual(result['namespace']['name'], self.data_product.namespace.name)
+
+    def test_expanded_objects_are_revalidated(self):
+        url = reverse('dataproduct-detail', args=[self.data_product.id])
+        response = self.client.get(url, data={'expand': 'object.storage_location'}, format='json')
+        location = self.data_product.object.storage_location
+        location.path = 'moved'
+        location.save()
+        response = self.client.get(url, data={'expand': 'object.storage_location'}, format='json',
+                                   HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['object']['storage_location']['path'], 'moved')
+
+    def test_invalid_expand(self):
+        for expand in ('name', 'object.colour', 'updated_by'):
+            response = self.client.get(reverse('dataproduct-list'), data={'expand': expand}, format='json')
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('Cannot expand', response.json()['detail'])
@@ -0,0 +1,85 @@
+import fnmatch
+import random
+
+from django.db import connection
+from django.test import TestCase, SimpleTestCase
+from django.contrib.auth import get_user_model
+
+from data_management.lookups import ANY, STAR, parse_glob, sqlite_glob
+from data_management.models import Namespace
+
+
+NAMES = (
+    'SARS-CoV-2', 'SARS-CoV-2/cases', 'sars-cov-2/cases', 'SARS', 'FAIR', 'fair', 'fAIR', 'a_b', 'a%b', 'a.b',
+    'abc', 'abd', 'ab', '[abc]', 'a[b', 'a^b', 'a!b', 'a-b', 'a]b', 'a\\b', 'a*b', 'a?b', '', 'line\nbreak',
+    'prefix/middle/suffix',
+)
+
+PATTERNS = (
+    'SARS-CoV-2', 'SARS-CoV-2/*', 'SARS*', '*cases', '*CoV*', 'sars*', '[fF]*', '[!f]*', '[^f]*', 'a?b', 'a_b',
+    'a%b', 'a*', '*', '?', 'ab?', 'a[b', '[[]abc]', 'a[!b]?', 'a[-.]b', 'a[]]b', 'a[]b', 'line*', 'prefix/*/suffix',
+    '*/middle/*', 'a**b', '[a-c]b*', 'a[^]b', 'a[*?]b', 'a[\\]b', 'a[b-a]b', 'a[!b-a]b', 'a[--.]b', 'a[]-a]b',
+)
+
+
+class ParseGlobTests(SimpleTestCase):
+
+    def test_literal(self):
+        self.assertEqual(parse_glob('SARS-CoV-2/cases'), ['SARS-CoV-2/cases'])
+
+    def test_wildcards(self):
+        self.assertEqual(parse_glob('a*?b**'), ['a', STAR, ANY, 'b', STAR])
+
+    def test_character_classes(self):
+        self.assertEqual(parse_glob('[fF]*'), [(False, [('f', 'f'), ('F', 'F')]), STAR])
+        self.assertEqual(parse_glob('[!a-c]x'), [(True, [('a', 'c')]), 'x'])
+        self.assertEqual(parse_glob('[]a]'), [(False, [(']', ']'), ('a', 'a')])])
+        self.assertEqual(parse_glob('[c-a]'), [(False, [])])
+
+    def test_unclosed_bracket(self):
+        self.assertEqual(parse_glob('a[b'), ['a[b'])
+
+
+class SQLiteGlobTests(SimpleTestCase):
+
+    def test_translation(self):
+        self.assertEqual(sqlite_glob('SARS-CoV-2/*'), 'SARS-CoV-2/*')
+        self.assertEqual(sqlite_glob('[!f]?'), '[^f]?')
+        self.assertEqual(sqlite_glob('[^f]'), '[f^]')
+        self.assertEqual(sqlite_glob('a[b'), 'a[[]b')
+        self.assertEqual(sqlite_glob('[*]'), '[*]')
+        self.assertEqual(sqlite_glob('[a-]'), '[-a]')
+        self.assertIsNone(sqlite_glob('[b-a]'))
+
+
+class GlobLookupTests(TestCase):
+
+    def setUp(self):
+        user = get_user_model().objects.create(username='Test User')
+        for name in NAMES:
+            Namespace.objects.create(updated_by=user, name=name, full_name=name)
+
+    def _assert_matches_fnmatch(self, pattern):
+        expected = sorted(name for name in NAMES if fnmatch.fnmatchcase(name, pattern))
+        actual = sorted(Namespace.objects.filter(name__glob=pattern).values_list('name', flat=True))
+        self.assertEqual(actual, expected, repr(pattern))
+
+    def test_matches_fnmatch(self):
+        for pattern in PATTERNS:
+            self._assert_matches_fnmatch(pattern)
+
+    def test_random_patterns_match_fnmatch(self):
+        generator = random.Random(0)
+        for _ in range(500):
+            length = generator.randint(1, 8)
+            self._assert_matches_fnmatch(''.join(generator.choice('ab[]!^-*?\\') for _ in range(length)))
+
+    def test_exclude(self):
+        expected = sorted(name for name in NAMES if not fnmatch.fnmatchcase(name, 'a*'))
+        actual = sorted(Namespace.objects.exclude(name__glob='a*').values_list('name', flat=True))
+        self.assertEqual(actual, expected)
+
+    def test_uses_native_glob_on_sqlite(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Only applies to SQLite')
+        self.assertIn(' GLOB ', str(Namespace.objects.filter(name__glob='SARS*').query))
@@ -0,0 +1,257 @@
+import gzip
+import io
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from data_management import snapshot
+from data_management.models import CodeRun, ComponentLineage, DataProduct, Licence, Namespace, Object, \
+    ObjectComponent, PushWatermark, SearchDocument
+from .initdb import init_db
+
+
+def _summary():
+    """
+    Describe the registry without primary keys, so that registries can be compared across an import.
+    """
+    return {
+        'counts': {model.__name__: model.objects.count() for model in snapshot.dependency_order()},
+        'objects': {
+            (str(obj.uuid), obj.storage_location and obj.storage_location.path,
+             tuple(sorted(str(author.uuid) for author in obj.authors.all())), obj.updated_by.username)
+            for obj in Object.objects.all()
+        },
+        'data_products': {
+            (dp.namespace.name, dp.name, dp.version, str(dp.object.uuid), dp.version_major)
+            for dp in DataProduct.objects.all()
+        },
+        'code_runs': {
+            (str(run.uuid), run.submission_script.uuid,
+             tuple(sorted((str(c.object.uuid), c.name) for c in run.inputs.all())),
+             tuple(sorted((str(c.object.uuid), c.name) for c in run.outputs.all())))
+            for run in CodeRun.objects.all()
+        },
+        'lineage': ComponentLineage.objects.count(),
+        'search': SearchDocument.objects.count(),
+    }
+
+
+class SnapshotTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create(username='Test User')
+        init_db()
+
+    def export(self):
+        fileobj = io.BytesIO()
+        snapshot.export(fileobj)
+        return fileobj.getvalue()
+
+    def clear_registry(self):
+        for model in reversed(snapshot.dependency_order()):
+            model.objects.all().delete()
+
+    def test_round_trip(self):
+        before = _summary()
+        archive = self.export()
+        self.clear_registry()
+        get_user_model().objects.filter(username='testusera').delete()
+        # Take the primary keys used in the snapshot, so that the imported objects need new ones
+        Namespace.objects.create(updated_by=self.user, name='other')
+        Object.objects.create(updated_by=self.user)
+
+        counts = snapshot.import_(io.BytesIO(archive))
+        self.assertEqual(counts['Object'], before['counts']['Object'])
+        after = _summary()
+        self.assertEqual(after['counts']['Namespace'], before['counts']['Namespace'] + 1)
+        self.assertEqual(after['counts']['Object'], before['counts']['Object'] + 1)
+        after['objects'] = {obj for obj in after['objects'] if obj[0] != str(Object.objects.order_by('id').first().uuid)}
+        after['counts'] = before['counts']
+        self.assertEqual(after, before)
+
+        obj = Object.objects.create(updated_by=self.user)
+        self.assertGreater(obj.id, Object.objects.exclude(id=obj.id).order_by('-id').first().id)
+
+    def test_import_reuses_existing_objects(self):
+        before = _summary()
+        counts = snapshot.import_(io.BytesIO(self.export()))
+        self.assertEqual(sum(count for name, count in counts.items() if '.' not in name), 0)
+        self.assertEqual(_summary(), before)
+
+    def test_import_updates_existing_objects(self):
+        archive = self.export()
+        obj = Object.objects.first()
+        Object.objects.filter(pk=obj.pk).update(description='changed')
+        licence = Licence.objects.first()
+        Licence.objects.filter(pk=licence.pk).update(identifier='https://example.org/changed')
+
+        counts = snapshot.import_(io.BytesIO(archive))
+        self.assertEqual(counts['Object'], 1)
+        self.assertEqual(counts['Licence'], 1)
+        self.assertEqual(Object.objects.get(pk=obj.pk).description, obj.description)
+        self.assertEqual(Licence.objects.get(pk=licence.pk).identifier, licence.identifier)
+
+    def test_incremental_import_leaves_references_alone(self):
+        since = timezone.now()
+        data_product = DataProduct.objects.first()
+        data_product.save()
+        fileobj = io.BytesIO()
+        snapshot.export(fileobj, since=since)
+        Object.objects.filter(pk=data_product.object_id).update(description='changed')
+
+        counts = snapshot.import_(io.BytesIO(fileobj.getvalue()))
+        self.assertEqual(counts['Object'], 0)
+        self.assertEqual(Object.objects.get(pk=data_product.object_id).description, 'changed')
+
+    def test_export_is_compact(self):
+        lines = gzip.decompress(self.export()).decode('utf-8').splitlines()
+        self.assertIn('"format":"data-registry-snapshot"', lines[0])
+        self.assertTrue(lines[1].startswith('{"model":'))
+        self.assertTrue(all(line.startswith('[') or line.startswith('{') for line in lines))
+
+    def test_unsupported_version(self):
+        archive = gzip.compress(b'{"format":"data-registry-snapshot","version":2}\n')
+        with self.assertRaisesMessage(snapshot.SnapshotError, 'version 2 is not supported'):
+            snapshot.import_(io.BytesIO(archive))
+
+    def test_incomplete_snapshot(self):
+        lines = gzip.decompress(self.export()).splitlines(keepends=True)
+        archive = gzip.compress(b''.join(lines[:-1]))
+        count = Object.objects.count()
+        with self.assertRaisesMessage(snapshot.SnapshotError, 'incomplete'):
+            snapshot.import_(io.BytesIO(archive))
+        self.assertEqual(Object.objects.count(), count)
+
+    def test_commands(self):
+        handle, path = tempfile.mkstemp(suffix='.json.gz')
+        os.close(handle)
+        self.addCleanup(os.remove, path)
+        out = StringIO()
+        call_command('export_registry', path, stdout=out)
+        self.assertIn('Object: %d' % Object.objects.count(), out.getvalue())
+        out = StringIO()
+        call_command('import_registry', path, stdout=out)
+        self.assertIn('Object: 0', out.getvalue())
+
+        with open(path, 'wb') as fileobj:
+            fileobj.write(b'not a snapshot')
+        with self.assertRaises(CommandError):
+            call_command('import_registry', path, stdout=StringIO())
+
+
+class PushRegistryTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create(username='Test User')
+        init_db()
+        self.pushed = []
+        self.status_code = 200
+        patcher = mock.patch('data_management.management.commands.push_registry.requests.post', side_effect=self.post)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, url, data, headers, timeout):
+        self.assertEqual(url, 'http://remote/api/import/')
+        self.assertEqual(headers['Authorization'], 'token secret')
+        self.pushed.append(data.read())
+        return mock.Mock(status_code=self.status_code, text='Rejected', json=lambda: {'Object': 1})
+
+    def push(self):
+        out = StringIO()
+        call_command('push_registry', 'http://remote/api', '--token', 'secret', stdout=out)
+        return out.getvalue()
+
+    def rows(self, archive):
+        counts = {}
+        model = None
+        for line in gzip.decompress(archive).decode('utf-8').splitlines()[1:]:
+            record = json.loads(line)
+            if isinstance(record, list):
+                counts[model] += 1
+            elif 'end' not in record:
+                model = record.get('model') or record['relation']
+                counts[model] = 0
+        return counts
+
+    def create_code_run(self):
+        script = Object.objects.create(updated_by=self.user, description='script')
+        code_run = CodeRun.objects.create(updated_by=self.user, run_date=timezone.now(), description='pushed',
+                                          submission_script=script)
+        component = ObjectComponent.objects.filter(object__data_products__isnull=False).first()
+        code_run.inputs.add(component)
+        return code_run, component
+
+    def test_push_sends_objects_updated_since_the_last_push(self):
+        self.assertIn('Pushed', self.push())
+        self.assertEqual(self.rows(self.pushed[0])['Object'], Object.objects.count())
+        self.assertNotIn('UserAuthor', self.rows(self.pushed[0]))
+        self.assertTrue(PushWatermark.objects.filter(remote='http://remote/api/').exists())
+
+        self.assertIn('Nothing to push', self.push())
+        self.assertEqual(len(self.pushed), 1)
+
+        code_run, component = self.create_code_run()
+        self.push()
+        rows = self.rows(self.pushed[1])
+        self.assertEqual(rows['CodeRun'], 1)
+        self.assertEqual(rows['CodeRun.inputs'], 1)
+        # The new script and its component, and the input and its object, which the remote registry may not have
+        self.assertEqual(rows['Object'], 2)
+        self.assertEqual(rows['ObjectComponent'], 2)
+        self.assertEqual(rows['StorageLocation'], 1 if component.object.storage_location else 0)
+        self.assertEqual(rows['DataProduct'], 0)
+
+    def test_pushed_objects_are_loaded_by_the_remote_registry(self):
+        self.push()
+        code_run, component = self.create_code_run()
+        self.push()
+        pushed_input = (component.object.uuid, component.name)
+        uuids = set(Object.objects.values_list('uuid', flat=True))
+        for model in reversed(snapshot.dependency_order()):
+            model.objects.all().delete()
+
+        remote_user = get_user_model().objects.create(username='remote', is_staff=True)
+        client = APIClient()
+        client.force_authenticate(user=remote_user)
+        for archive in self.pushed:
+            response = client.post(reverse('import'), data=archive, content_type='application/gzip')
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['CodeRun'], 1)
+        self.assertEqual(set(Object.objects.values_list('uuid', flat=True)), uuids)
+        pushed = CodeRun.objects.get(uuid=code_run.uuid)
+        self.assertEqual([(c.object.uuid, c.name) for c in pushed.inputs.all()], [pushed_input])
+        self.assertEqual(set(Object.objects.values_list('updated_by', flat=True)), {remote_user.id})
+
+    def test_import_requires_authentication(self):
+        response = APIClient().post(reverse('import'), data=b'', content_type='application/gzip')
+        self.assertIn(response.status_code, (401, 403))
+
+    def test_import_requires_staff(self):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        response = client.post(reverse('import'), data=b'', content_type='application/gzip')
+        self.assertEqual(response.status_code, 403)
+
+    def test_invalid_snapshot_is_rejected(self):
+        self.user.is_staff = True
+        self.user.save()
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        response = client.post(reverse('import'), data=b'not a snapshot', content_type='application/gzip')
+        self.assertEqual(response.status_code, 400)
+
+    def test_rejected_push_keeps_the_watermark(self):
+        self.status_code = 400
+        with self.assertRaisesMessage(CommandError, 'Rejected'):
+            self.push()
+        self.assertFalse(PushWatermark.objects.exists())
@@ -0,0 +1,29 @@
+import functools
+
+import semver
+from django.test import SimpleTestCase
+
+from data_management.versions import prerelease_key, sort_key
+
+
+VERSIONS = [
+    '1.0.0-alpha', '1.0.0-alpha.1', '1.0.0-alpha.beta', '1.0.0-beta', '1.0.0-beta.2', '1.0.0-beta.11', '1.0.0-rc.1',
+    '1.0.0', '1.0.0-a-b', '1.0.0-a.x', '0.9.10', '0.10.0', '2.0.0', '10.0.0', '1.10.0', '1.2.10', '1.2.9',
+    '1.0.0-0', '1.0.0-1', '1.0.0-01a', '1.0.0+build.1', '1.0.0-x.7.z.92',
+]
+
+
+class SortKeyTests(SimpleTestCase):
+
+    def test_matches_semver_precedence(self):
+        expected = sorted(VERSIONS, key=functools.cmp_to_key(semver.compare))
+        self.assertEqual(sorted(VERSIONS, key=sort_key), expected)
+
+    def test_release_sorts_after_prerelease(self):
+        self.assertGreater(prerelease_key(None), prerelease_key('zzz'))
+
+    def test_prerelease_key_is_hex(self):
+        self.assertEqual(prerelease_key('rc.1'), '0272630001013' + '1')
+
+    def test_build_metadata_is_ignored(self):
+        self.assertEqual(sort_key('1.0.0+build.1'), sort_key('1.0.0'))
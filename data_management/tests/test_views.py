@@ -1,7 +1,16 @@
+import configparser
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils.encoding import iri_to_uri
 from django.contrib.auth import get_user_model
 
+from data_management.models import DataProduct, ExternalObject, Issue, KeyValue, Namespace, Object, \
+    ObjectComponent, StorageLocation
 from .initdb import init_db
 
 
@@ -34,3 +43,282 @@ class IndexViewTests(TestCase):
         response = self.client.get(reverse('index'))
         context = response.context[-1]
         self.assertEqual(len(context['code_repo_release']), 1)
+
+
+class ResolverViewTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create(username='Test User')
+        init_db()
+        cache.clear()
+        self.external_object = ExternalObject.objects.get(title='scottish deaths-involving-coronavirus-covid-19')
+        self.data_product = self.external_object.data_product
+        self.location = self.data_product.object.storage_location
+
+    def _data_product_url(self):
+        return '/data_product/%s:%s@%s' % (self.data_product.namespace.name, self.data_product.name,
+                                           self.data_product.version)
+
+    def _external_object_url(self):
+        return '/external_object/%s:%s@%s' % (self.external_object.alternate_identifier, self.external_object.title,
+                                              self.external_object.version)
+
+    def test_data_product(self):
+        response = self.client.get(self._data_product_url())
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response['Location'], self.location.full_uri())
+
+    def test_data_product_root(self):
+        response = self.client.get(self._data_product_url(), {'root': ''})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content.decode(), self.location.storage_root.root)
+
+    def test_data_product_latest(self):
+        newer = DataProduct.objects.create(
+            updated_by=self.user, object=Object.objects.exclude(storage_location=None).exclude(
+                storage_location=self.location).first(), namespace=self.data_product.namespace,
+            name=self.data_product.name, version='0.10.0')
+        DataProduct.objects.create(
+            updated_by=self.user, object=self.data_product.object, namespace=self.data_product.namespace,
+            name=self.data_product.name, version='0.9.0')
+
+        response = self.client.get('/data_product/%s:%s@latest' % (self.data_product.namespace.name,
+                                                                    self.data_product.name))
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response['Location'], iri_to_uri(newer.object.storage_location.full_uri()))
+
+    def test_data_product_not_found(self):
+        response = self.client.get('/data_product/missing:missing@0.0.1')
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_data_product_is_cached(self):
+        url = self._data_product_url()
+        with self.assertNumQueries(1):
+            self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+
+        self.assertEqual(response['Location'], self.location.full_uri())
+
+    def test_data_product_cache_is_invalidated(self):
+        self.client.get(self._data_product_url())
+        self.location.path = 'moved/file.csv'
+        self.location.save()
+
+        response = self.client.get(self._data_product_url())
+
+        self.assertEqual(response['Location'], self.location.storage_root.root + 'moved/file.csv')
+
+    def test_external_object(self):
+        response = self.client.get(self._external_object_url())
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response['Location'], self.location.full_uri())
+
+    def test_external_object_original(self):
+        response = self.client.get(self._external_object_url(), {'original': ''})
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response['Location'], iri_to_uri(self.external_object.original_store.full_uri()))
+
+    def test_get_data(self):
+        config = configparser.ConfigParser()
+        config.read_dict({'storage': {
+            'url': 'https://storage.example.com', 'bucket': 'bucket', 'key': 'secret', 'duration': '60',
+            'storage_root': self.location.storage_root.root,
+        }})
+        location = StorageLocation.objects.create(updated_by=self.user, storage_root=self.location.storage_root,
+                                                  path='0123456789abcdef', hash='0123456789abcdef')
+        obj = Object.objects.create(updated_by=self.user, storage_location=location)
+        KeyValue.objects.create(updated_by=self.user, object=obj, key='accessibility', value='private')
+
+        with mock.patch('data_management.settings.CONFIG', config):
+            with self.assertNumQueries(1):
+                anonymous = self.client.get('/data/0123456789abcdef')
+            self.client.force_login(self.user)
+            authenticated = self.client.get('/data/0123456789abcdef')
+            missing = self.client.get('/data/missing')
+
+        self.assertEqual(anonymous.status_code, 403)
+        self.assertEqual(authenticated.status_code, 302)
+        self.assertTrue(authenticated['Location'].startswith('https://storage.example.com/v1/bucket/'))
+        self.assertEqual(missing.status_code, 404)
+
+
+class TableViewTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create(username='Test User')
+        init_db()
+        cache.clear()
+
+    def _get_rows(self, url, **params):
+        rows = []
+        token = None
+        while True:
+            page = dict(params, offset=len(rows))
+            if token:
+                page['after'] = token
+            response = self.client.get(url, page)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            rows.extend(data['rows'])
+            token = data['next']
+            if not token:
+                return rows
+
+    def test_keyset_pages_match_offset_pages(self):
+        for url, sort in (('/tables/dataproducts', 'name'), ('/tables/dataproducts', 'namespace'),
+                          ('/tables/externalobjects', 'identifier'), ('/tables/externalobjects', 'release_date'),
+                          ('/tables/codereporeleases', 'name')):
+            for order in ('asc', 'desc'):
+                expected = self.client.get(url, {'sort': sort, 'order': order, 'limit': 100}).json()['rows']
+                self.assertEqual(self._get_rows(url, sort=sort, order=order, limit=1), expected, (url, sort, order))
+
+    def test_keyset_page_query(self):
+        first = self.client.get('/tables/dataproducts', {'sort': 'name', 'limit': 4}).json()
+        second = self.client.get('/tables/dataproducts', {'sort': 'name', 'limit': 4, 'offset': 4}).json()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/tables/dataproducts',
+                                       {'sort': 'name', 'limit': 4, 'offset': 4, 'after': first['next']})
+        self.assertEqual(response.json()['rows'], second['rows'])
+        self.assertNotIn('OFFSET', queries.captured_queries[-1]['sql'])
+
+    def test_keyset_token_for_another_sort_is_ignored(self):
+        first = self.client.get('/tables/dataproducts', {'sort': 'name', 'limit': 4}).json()
+        expected = self.client.get('/tables/dataproducts', {'sort': 'namespace', 'limit': 4, 'offset': 4}).json()
+        for token in (first['next'], 'not-a-token'):
+            response = self.client.get('/tables/dataproducts',
+                                       {'sort': 'namespace', 'limit': 4, 'offset': 4, 'after': token})
+            self.assertEqual(response.json()['rows'], expected['rows'])
+
+    def test_namespace_sort_is_by_name(self):
+        namespace = Namespace.objects.create(updated_by=self.user, name='AAA')
+        DataProduct.objects.create(updated_by=self.user, namespace=namespace, object=Object.objects.first(),
+                                   name='first', version='1.0.0')
+        rows = self.client.get('/tables/dataproducts', {'sort': 'namespace', 'limit': 100}).json()['rows']
+        namespaces = [row['namespace'] for row in rows]
+        self.assertEqual(namespaces, sorted(namespaces))
+
+    def test_page_size_is_limited(self):
+        for params in ({'limit': 'x'}, {'offset': 'x'}, {'limit': 0}, {'offset': -1}):
+            self.assertEqual(self.client.get('/tables/dataproducts', params).status_code, 400)
+        with mock.patch('data_management.tables.MAX_PAGE_SIZE', 2):
+            data = self.client.get('/tables/dataproducts', {'limit': 10000000}).json()
+        self.assertEqual(len(data['rows']), 2)
+        self.assertIsNotNone(data['next'])
+
+    def test_unindexed_sort_uses_default(self):
+        expected = self.client.get('/tables/dataproducts', {'sort': 'name'}).json()['rows']
+        self.assertEqual(self.client.get('/tables/dataproducts', {'sort': 'version'}).json()['rows'], expected)
+
+    def test_data_product_search(self):
+        response = self.client.get('/tables/dataproducts', {'search': 'symptom', 'offset': 0})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['total'], 2)
+        self.assertEqual(data['totalNotFiltered'], 13)
+
+    def test_external_object_search(self):
+        response = self.client.get('/tables/externalobjects', {'search': 'deaths', 'offset': 0})
+        self.assertEqual(response.status_code, 200)
+        rows = response.json()['rows']
+        self.assertEqual([row['title'] for row in rows], ['scottish deaths-involving-coronavirus-covid-19'])
+
+    def test_code_repo_release_search(self):
+        response = self.client.get('/tables/codereporeleases', {'search': 'github SCRCdata', 'offset': 0})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['total'], 1)
+
+
+class ModelTableViewTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create(username='Test User')
+        init_db()
+        cache.clear()
+
+    def test_list_page_is_displayed(self):
+        for name in ('objects', 'objectcomponents', 'storagelocations', 'coderuns'):
+            response = self.client.get(reverse(name))
+            self.assertEqual(response.status_code, 200)
+        self.assertContains(response, reverse('model_table', args=['coderun']))
+
+    def test_rows_are_loaded_in_one_query(self):
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('model_table', args=['object']), {'limit': 100})
+        data = response.json()
+        self.assertEqual(data['total'], Object.objects.count())
+        names = [row['name'] for row in data['rows']]
+        location = StorageLocation.objects.exclude(location_for_object=None).first()
+        self.assertIn('<a href="%s">%s</a>' % (reverse('object', args=[location.location_for_object.get().id]),
+                                               location.full_uri()), names)
+
+    def test_issue_counts(self):
+        component = ObjectComponent.objects.get(name='mixing-matrix')
+        component.issues.set(Issue.objects.all())
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('model_table', args=['objectcomponent']), {'limit': 100})
+        counts = {row['name']: row['issue_count'] for row in response.json()['rows']}
+        self.assertEqual(counts['<a href="%s">mixing-matrix</a>' % reverse('objectcomponent', args=[component.id])],
+                         Issue.objects.count())
+        self.assertEqual(sum(counts.values()), Issue.objects.count())
+
+    def test_sort_by_issue_count(self):
+        issues = list(Issue.objects.all())
+        for count, component in enumerate(ObjectComponent.objects.order_by('id')[:len(issues)], 1):
+            component.issues.set(issues[:count])
+        url = reverse('model_table', args=['objectcomponent'])
+        expected = self.client.get(url, {'sort': 'issue_count', 'order': 'desc', 'limit': 100}).json()['rows']
+        counts = [row['issue_count'] for row in expected]
+        self.assertEqual(counts, sorted(counts, reverse=True))
+        self.assertEqual(counts[0], len(issues))
+        rows = []
+        token = None
+        while True:
+            params = {'sort': 'issue_count', 'order': 'desc', 'limit': 3, 'offset': len(rows)}
+            if token:
+                params['after'] = token
+            data = self.client.get(url, params).json()
+            rows.extend(data['rows'])
+            token = data['next']
+            if not token:
+                break
+        self.assertEqual(rows, expected)
+
+    def test_issue_count_sort_is_opt_in(self):
+        component = ObjectComponent.objects.order_by('id').first()
+        component.issues.set(Issue.objects.all())
+        url = reverse('model_table', args=['objectcomponent'])
+        rows = self.client.get(url, {'order': 'desc', 'limit': 100}).json()['rows']
+        expected = self.client.get(url, {'sort': 'last_updated', 'order': 'desc', 'limit': 100}).json()['rows']
+        self.assertEqual(rows, expected)
+        self.assertNotEqual(rows[0]['issue_count'], Issue.objects.count())
+
+    def test_search(self):
+        response = self.client.get(reverse('model_table', args=['objectcomponent']), {'search': 'mixing'})
+        self.assertEqual(response.json()['total'], 1)
+
+    def test_sort_and_pages(self):
+        expected = self.client.get(reverse('model_table', args=['object']),
+                                   {'sort': 'last_updated', 'order': 'desc', 'limit': 100}).json()['rows']
+        rows = []
+        token = None
+        while True:
+            params = {'sort': 'last_updated', 'order': 'desc', 'limit': 5, 'offset': len(rows)}
+            if token:
+                params['after'] = token
+            data = self.client.get(reverse('model_table', args=['object']), params).json()
+            rows.extend(data['rows'])
+            token = data['next']
+            if not token:
+                break
+        self.assertEqual(rows, expected)
+
+    def test_unknown_model(self):
+        response = self.client.get(reverse('model_table', args=['widget']))
+        self.assertEqual(response.status_code, 404)
@@ -25,7 +25,10 @@ urlpatterns = [
     path('issues/', views.IssueListView.as_view(), name='issues'),
     path('issue/<int:pk>', views.IssueDetailView.as_view(), name='issue'),
     path('api/', include(router.urls)),
-    path('api/prov-report/<int:pk>/', cache_page(cache_duration)(api_views.ProvReportView.as_view()), name='prov_report'),
+    path('api/prov-report/<int:pk>/', api_views.ProvReportView.as_view(), name='prov_report'),
+    path('api/search/', api_views.SearchView.as_view(), name='search'),
+    path('api/changes/', api_views.ChangesView.as_view(), name='changes'),
+    path('api/import/', api_views.ImportView.as_view(), name='import'),
     path('get-token', views.get_token, name='get_token'),
     path('revoke-token', views.revoke_token, name='revoke_token'),
     path('docs/', cache_page(cache_duration)(views.doc_index), name='docs_index'),
@@ -33,9 +36,12 @@ urlpatterns = [
     path('tables/dataproducts', cache_page(cache_duration)(tables.data_product_table_data)),
     path('tables/externalobjects', cache_page(cache_duration)(tables.external_objects_table_data)),
     path('tables/codereporeleases', cache_page(cache_duration)(tables.code_repo_release_table_data)),
+    path('tables/<str:model_name>', cache_page(cache_duration)(tables.model_table_data), name='model_table'),
     path('data_product/<str:namespace>:<path:data_product_name>@<str:version>', views.data_product),
     path('external_object/<path:alternate_identifier>:<path:title>@<str:version>', views.external_object),
     path('data/<str:name>', views.get_data),
+    path('api/data/<str:checksum>/manifest', api_views.ObjectStorageManifestView.as_view(),
+         name='object_storage_manifest'),
     path('api/data/<str:checksum>', api_views.ObjectStorageView.as_view()),
     path('api/data', api_views.ObjectStorageView.as_view())
 ]
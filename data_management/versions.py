@@ -0,0 +1,136 @@
+import re
+
+import semver
+from django.db.models import Exists, OuterRef, Q
+
+# Sort key of the prerelease part of a version with no prerelease, which sorts after every prerelease
+RELEASE = 'ff'
+# Sort key of the lowest possible prerelease, 0, used for exclusive upper bounds so they also exclude prereleases
+LOWEST_PRERELEASE = (b'\x01\x01' + b'0').hex()
+
+KEYS = ('major', 'minor', 'patch', 'prerelease')
+COMPARISON = re.compile(r'^(>=|<=|>|<|=|\^|~)?\s*(\S+)$')
+
+
+def prerelease_key(prerelease):
+    """
+    Encode the prerelease part of a semantic version so that the encodings of two prereleases compare in the same
+    order as the prereleases do under semantic versioning precedence rules.
+
+    Numeric identifiers are prefixed with their length so that they compare numerically and sort before alphanumeric
+    identifiers, and identifiers are separated by a zero byte so that a prefix sorts first. The result is hex encoded,
+    so that it sorts the same way whatever the collation of the column.
+
+    :param prerelease: The prerelease part of a version, or None for a release
+    :return: The sort key
+    """
+    if prerelease is None:
+        return RELEASE
+    parts = []
+    for identifier in prerelease.split('.'):
+        if identifier.isdigit():
+            parts.append(b'\x01' + bytes([len(identifier)]) + identifier.encode('ascii'))
+        else:
+            parts.append(b'\x02' + identifier.encode('ascii'))
+    return b'\x00'.join(parts).hex()
+
+
+def sort_key(version):
+    """
+    Return the (major, minor, patch, prerelease) sort key of a semantic version.
+    """
+    info = semver.VersionInfo.parse(version)
+    return info.major, info.minor, info.patch, prerelease_key(info.prerelease)
+
+
+def _compare(field, op, key):
+    """
+    Return a Q object comparing the sort key columns of a version field to a sort key. The columns are compared in
+    turn so that the comparison can use an index over them.
+    """
+    strict = {'>': 'gt', '>=': 'gt', '<': 'lt', '<=': 'lt'}[op]
+    columns = ['%s_%s' % (field, name) for name in KEYS]
+    final = {'>': 'gt', '>=': 'gte', '<': 'lt', '<=': 'lte'}[op]
+    q = Q(**{'%s__%s' % (columns[-1], final): key[-1]})
+    for column, value in reversed(list(zip(columns[:-1], key[:-1]))):
+        q = Q(**{'%s__%s' % (column, strict): value}) | (Q(**{column: value}) & q)
+    return q
+
+
+def range_q(field, expression):
+    """
+    Return a Q object matching versions in a range.
+
+    The range is a comma separated list of comparisons that must all hold, each of which is a version preceded by
+    one of >, >=, <, <= or =, or by ^ to match versions compatible with it (up to the next major version, or the next
+    minor or patch version for versions below 1.0.0) or ~ to match versions with the same major and minor version.
+
+    :param field: The name of the version field
+    :param expression: The range
+    :raises ValueError: If the range is not valid
+    :return: The Q object
+    """
+    q = Q()
+    for comparison in expression.split(','):
+        match = COMPARISON.match(comparison.strip())
+        if match is None:
+            raise ValueError('Invalid version range %s' % expression)
+        op, version = match.groups()
+        info = semver.VersionInfo.parse(version)
+        key = sort_key(version)
+        if op in (None, '='):
+            q &= Q(**{field: version})
+        elif op in ('^', '~'):
+            if op == '~' or info.major == 0 and info.minor > 0:
+                upper = (info.major, info.minor + 1, 0)
+            elif info.major == 0:
+                upper = (0, 0, info.patch + 1)
+            else:
+                upper = (info.major + 1, 0, 0)
+            q &= _compare(field, '>=', key) & _compare(field, '<', upper + (LOWEST_PRERELEASE,))
+        else:
+            q &= _compare(field, op, key)
+    return q
+
+
+def latest(queryset, field, group_fields):
+    """
+    Filter a queryset to the objects with the highest version in each group of objects sharing the group fields.
+    """
+    columns = ['%s_%s' % (field, name) for name in KEYS]
+    newer = queryset.model.objects.filter(
+        _compare(field, '>', [OuterRef(column) for column in columns]),
+        **{name: OuterRef(name) for name in group_fields}
+    )
+    return queryset.filter(~Exists(newer))
+
+
+def ordering(field, descending=False):
+    """
+    Return the order_by arguments to sort by a version field.
+    """
+    prefix = '-' if descending else ''
+    return ['%s%s_%s' % (prefix, field, name) for name in KEYS]
+
+
+def fill_sort_keys(**kwargs):
+    """
+    Fill in the version sort keys of any rows saved before they were added, run after migrating.
+    """
+    from . import models
+
+    for model in models.all_models.values():
+        for field in model._meta.fields:
+            if not isinstance(field, models.VersionField) or not hasattr(model, '%s_major' % field.attname):
+                continue
+            missing = model.objects.filter(**{'%s_major__isnull' % field.attname: True}).only('pk', field.attname)
+            updated = []
+            for obj in missing.iterator():
+                try:
+                    keys = sort_key(getattr(obj, field.attname))
+                except (TypeError, ValueError):
+                    continue
+                for name, key in zip(KEYS, keys):
+                    setattr(obj, '%s_%s' % (field.attname, name), key)
+                updated.append(obj)
+            model.objects.bulk_update(updated, ['%s_%s' % (field.attname, name) for name in KEYS], batch_size=1000)
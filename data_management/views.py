@@ -1,4 +1,4 @@
-from configparser import ConfigParser
+import configparser
 import os
 
 from django.http import HttpResponseNotFound
@@ -6,14 +6,18 @@ from django.shortcuts import render, HttpResponse, redirect
 from django.views import generic
 from django.utils.text import camel_case_to_spaces
 from django.contrib.auth import get_user_model
-from django.db.models import Q
+from django.conf import settings as django_settings
+from django.db.models import Exists, OuterRef
 from rest_framework.authtoken.models import Token
 
 from collections import namedtuple
 
+from . import caching
 from . import models
 from . import object_storage
 from . import settings
+from . import tables
+from . import versions
 
 
 def index(request):
@@ -64,17 +68,19 @@ def revoke_token(request):
     return HttpResponse('Your token has been deleted')
 
 
-class BaseListView(generic.ListView):
+class BaseListView(generic.TemplateView):
     """
-    Base class for views for displaying a table of the database objects.
+    Base class for views for displaying a table of the database objects. The table is filled a page at a time from
+    `tables.model_table_data`.
     """
-    context_object_name = 'objects'
     template_name = os.path.join('data_management', 'object_list.html')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['model_name'] = self.model_name.lower()
         context['display_name'] = camel_case_to_spaces(self.model_name) + 's'
+        context['issue_count'] = tables.has_issue_count(self.model)
+        context['searchable'] = tables.is_searchable(self.model)
         return context
 
 
@@ -186,56 +192,85 @@ def doc_index(request):
     return render(request, os.path.join('data_management', 'docs.html'), ctx)
 
 
+RESOLVER_MODELS = (
+    models.Namespace, models.DataProduct, models.ExternalObject, models.Object, models.StorageLocation,
+    models.StorageRoot, models.KeyValue, models.FileType,
+)
+
+
+def _resolve(name, compute, *parts):
+    """
+    Resolve a redirect target with a single query, caching the result for RESOLVER_CACHE_TIMEOUT seconds or until
+    any of the models involved change.
+    """
+    timeout = getattr(django_settings, 'RESOLVER_CACHE_TIMEOUT', 30)
+    return caching.cached('resolve:' + name, RESOLVER_MODELS, parts, compute, timeout)
+
+
+def _resolve_data(name):
+    try:
+        root = settings.CONFIG.get('storage', 'storage_root')
+    except configparser.Error:
+        return None
+    private = models.KeyValue.objects.filter(object=OuterRef('pk'), key='accessibility', value='private')
+    return models.Object.objects.filter(
+        storage_location__storage_root__root=root, storage_location__path=name
+    ).annotate(private=Exists(private)).values_list('private', 'file_type__extension').first()
+
+
 def get_data(request, name):
     """
     Redirect to a temporary URL for accessing a file from object storage
     """
-    check = True
-    try:
-        storage_root = models.StorageRoot.objects.get(Q(name=settings.CONFIG.get('storage', 'storage_root')))
-        location = models.StorageLocation.objects.get(Q(storage_root=storage_root) & Q(path=name))
-        object = models.Object.objects.get(storage_location=location)
-    except:
-        check = None
-    else:
-        if object.metadata:
-            try:
-                key_value = object.metadata.get(Q(key='accessibility'))
-            except:
-                pass
-            else:
-                if not request.user.is_authenticated and key_value.value == 'private':
-                    check = False
-
-    if check is None:
+    resolved = _resolve('data', lambda: _resolve_data(name), name)
+    if resolved is None:
         return HttpResponseNotFound()
-    elif not check:
+
+    private, extension = resolved
+    if private and not request.user.is_authenticated:
         return HttpResponse(status=403)
 
     filename = None
-    if object.file_type:
-        filename = '%s.%s' % (name, object.file_type.extension)
+    if extension is not None:
+        filename = '%s.%s' % (name, extension)
 
     return redirect(object_storage.create_url(name, 'GET', filename))
 
 
+def _resolve_data_product(namespace, data_product_name, version):
+    data_products = models.DataProduct.objects.filter(namespace__name=namespace, name=data_product_name)
+    if version == 'latest':
+        data_products = data_products.order_by(*versions.ordering('version', descending=True))
+    else:
+        data_products = data_products.filter(version=version)
+    return data_products.values_list(
+        'object__storage_location__storage_root__root', 'object__storage_location__path').first()
+
+
 def data_product(request, namespace, data_product_name, version):
     """
-    Redirect to the URL of a file given the namespace, data product name and version
+    Redirect to the URL of a file given the namespace, data product name and version, which can be latest for the
+    latest version of the data product
     """
-    try:
-        namespace = models.Namespace.objects.get(Q(name=namespace))
-        data_product = models.DataProduct.objects.get(Q(name=data_product_name) & Q(namespace=namespace) & Q(version=version))
-    except:
-        return HttpResponseNotFound()
-
-    if not data_product.object.storage_location:
+    resolved = _resolve('data_product', lambda: _resolve_data_product(namespace, data_product_name, version),
+                        namespace, data_product_name, version)
+    if resolved is None or resolved[1] is None:
         return HttpResponseNotFound()
 
+    root, path = resolved
     if 'root' in request.GET:
-        return HttpResponse(data_product.object.storage_location.storage_root.root)
+        return HttpResponse(root)
+
+    return redirect(root + path)
 
-    return redirect(data_product.object.storage_location.full_uri())
+
+def _resolve_external_object(alternate_identifier, title, version):
+    return models.ExternalObject.objects.filter(
+        alternate_identifier=alternate_identifier, title=title, version=version
+    ).values_list(
+        'data_product__object__storage_location__storage_root__root', 'data_product__object__storage_location__path',
+        'original_store__storage_root__root', 'original_store__path',
+    ).first()
 
 
 def external_object(request, alternate_identifier, title, version):
@@ -243,22 +278,23 @@ def external_object(request, alternate_identifier, title, version):
     Redirect to the URL of a file given the alternate identifier, title and version
     """
     # Find the external object
-    try:
-        external_object = models.ExternalObject.objects.get(Q(alternate_identifier=alternate_identifier) & Q(title=title) & Q(version=version))
-    except:
+    resolved = _resolve('external_object', lambda: _resolve_external_object(alternate_identifier, title, version),
+                        alternate_identifier, title, version)
+    if resolved is None:
         return HttpResponseNotFound()
+    root, path, original_root, original_path = resolved
 
     # Use storage location if it exists and user has not requested the original_store
-    if external_object.object.storage_location and 'original' not in request.GET:
+    if path is not None and 'original' not in request.GET:
         if 'root' in request.GET:
-            return HttpResponse(external_object.object.storage_location.storage_root.root)
-        return redirect(external_object.object.storage_location.full_uri())
+            return HttpResponse(root)
+        return redirect(root + path)
 
     # Use original_store if it exists
-    if external_object.original_store:
+    if original_path is not None:
         if 'root' in request.GET:
-            return HttpResponse(external_object.original_store.storage_root.root)
-        return redirect(external_object.original_store.full_uri())
+            return HttpResponse(original_root)
+        return redirect(original_root + original_path)
 
     # External object exists but there is no StorageLocation or original_store
     return HttpResponse(status=204)